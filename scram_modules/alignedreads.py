@@ -1,6 +1,16 @@
 import operator
+from multiprocessing import Pool
+
+import numpy
 
 from scram_modules.dna import DNA
+from scram_modules.kmer import RefKmers, MultiRefKmers
+
+_MIN_CHUNK_WINDOWS = 1 << 20  # references are only split into chunks of at least this many windows
+_CHUNKS_PER_CORE = 4  # more chunks than cores evens out the load
+_ROW_BLOCK = 1 << 16  # alignments converted to Python objects at a time by AlignedReads.by_position
+
+_worker_seq_dict = None  # reads for this worker process - set once by _align_init_worker
 
 
 class AlignedReads(object):
@@ -41,33 +51,45 @@ class AlignedReads(object):
     def alignments(self):
         return self._internal_dict.values() #view of alignments
 
-    def align_reads_to_ref(self, seq_dict, ref, nt):
+    def align_reads_to_ref(self, seq_dict, ref, nt, cores=1):
         """
-        Align reads from SRNASeq object to reference in RefSeq object
-        :param seq_dict: SRNASeq object
+        Align reads from SRNASeq object to reference in RefSeq object.  With more than one core, a long
+        reference is split into chunks overlapping by nt - 1 that are aligned in parallel - alignments are
+        identical to a single process.
+        :param seq_dict: SRNASeq or PackedSRNASeq object
         :param ref: RefSeq object
         :param nt: read length to align (int)
+        :param cores: number of processes to spawn for a long reference (int)
         """
-        count_start = 0
-
-        ref_complement = ref.complement()
-
-        while count_start < (len(ref) - (nt - 1)):
-            query_seq_fwd = DNA(ref[count_start:(count_start + nt)])
-            query_seq_rvs = DNA(ref_complement[count_start:(count_start + nt)])
-            if query_seq_fwd in seq_dict and query_seq_fwd not in self._internal_dict:
-                self._internal_dict[query_seq_fwd] = [
-                    [count_start, seq_dict[query_seq_fwd]]]
-            elif query_seq_fwd in seq_dict and query_seq_fwd in self._internal_dict:
-                self._internal_dict[query_seq_fwd].append(
-                    [count_start, seq_dict[query_seq_fwd]])
-            if query_seq_rvs in seq_dict and query_seq_rvs not in self._internal_dict:
-                self._internal_dict[query_seq_rvs] = [
-                    [len(ref) - count_start - 1, 0 - seq_dict[query_seq_rvs]]]
-            elif query_seq_rvs in seq_dict and query_seq_rvs in self._internal_dict:
-                self._internal_dict[query_seq_rvs].append(
-                    [len(ref) - count_start - 1, 0 - seq_dict[query_seq_rvs]])
-            count_start += 1
+        if cores > 1:
+            hits = _chunked_ref_hits(seq_dict, ref, [nt], cores)[nt]
+        else:
+            hits = seq_dict.ref_hits(RefKmers(ref, nt))
+        self._add_hits(seq_dict, hits)
+
+    def _add_hits(self, seq_dict, hits):
+        """
+        Add alignments from the read store
+        :param seq_dict: SRNASeq or PackedSRNASeq object the hits are from
+        :param hits: positions, read keys, counts - see SRNASeq.ref_hits
+        """
+        positions, reads, counts = hits
+        dna_by_read = {}
+        for pos, read, count in zip(positions.tolist(), reads, counts.tolist()):
+            if read not in dna_by_read:
+                dna_by_read[read] = seq_dict.to_dna(read)
+            self._add_alignment(dna_by_read[read], [pos, count])
+
+    def _add_alignment(self, sRNA, alignment):
+        """
+        Add a single alignment for a read
+        :param sRNA: read sequence (DNA)
+        :param alignment: [position, read count] list(int, float)
+        """
+        if sRNA not in self._internal_dict:
+            self._internal_dict[sRNA] = [alignment]
+        else:
+            self._internal_dict[sRNA].append(alignment)
 
     def split(self):
         """
@@ -77,6 +99,50 @@ class AlignedReads(object):
             for alignment in alignments:
                 alignment[1] /= len(alignments)
 
+    def by_position(self):
+        """
+        Alignments in reference position order, generated a block at a time.  Alignments at the same
+        position are in alignment order (reads in the order they were aligned, then each read's alignments),
+        so only a position array is sorted rather than a list of every alignment.
+        :return: generator of (read sequence (DNA), position (int), count (float))
+        """
+        reads, read_idx, aln_idx, order = self._position_order()
+        for start in range(0, len(order), _ROW_BLOCK):
+            block = order[start:start + _ROW_BLOCK]
+            for i, j in zip(read_idx[block].tolist(), aln_idx[block].tolist()):
+                sRNA, alignments = reads[i]
+                yield sRNA, alignments[j][0], alignments[j][1]
+
+    def position_arrays(self):
+        """
+        Alignments in reference position order as arrays - see by_position
+        :return: read sequences (numpy.array(bytes)), positions (numpy.array(int)), counts (numpy.array(float))
+        """
+        reads, read_idx, aln_idx, order = self._position_order()
+        sequences = numpy.array([str(sRNA).encode('ascii') for sRNA, _ in reads], dtype=bytes)
+        counts = numpy.fromiter((alignment[1] for _, alignments in reads for alignment in alignments),
+                                dtype=numpy.float64, count=len(order))
+        positions = numpy.fromiter((alignment[0] for _, alignments in reads for alignment in alignments),
+                                   dtype=numpy.int64, count=len(order))
+        return sequences[read_idx[order]], positions[order], counts[order]
+
+    def _position_order(self):
+        """
+        Order of all alignments by position
+        :return: [(read sequence, alignments),...] (list), read index for each alignment (numpy.array(int)),
+                 index in the read's alignments for each alignment (numpy.array(int)), alignments in position
+                 order (numpy.array(int))
+        """
+        reads = list(self._internal_dict.items())
+        aln_numbers = numpy.fromiter((len(alignments) for _, alignments in reads), dtype=numpy.int64,
+                                     count=len(reads))
+        total = int(aln_numbers.sum())
+        positions = numpy.fromiter((alignment[0] for _, alignments in reads for alignment in alignments),
+                                   dtype=numpy.int64, count=total)
+        read_idx = numpy.repeat(numpy.arange(len(reads)), aln_numbers)
+        aln_idx = numpy.arange(total) - numpy.repeat(numpy.cumsum(aln_numbers) - aln_numbers, aln_numbers)
+        return reads, read_idx, aln_idx, numpy.argsort(positions, kind='stable')
+
     def aln_by_ref_pos(self, nt):
         """
         Returns two sorted lists of (pos,count) tuples - fwd and rvs.  For plotting.  sRNA seq not tracked
@@ -91,10 +157,10 @@ class AlignedReads(object):
         for alignment in self._internal_dict.values():
             for i in alignment:
                 if i[1] > 0:
-                    fwd_alignment[i[0]] = i[1]  # {pos:count}
+                    fwd_alignment[i[0]] = fwd_alignment.get(i[0], 0) + i[1]  # {pos:count}
                     aln_count += i[1]
                 elif i[1] < 0:
-                    rvs_alignment[i[0]] = i[1]  # {pos:count}
+                    rvs_alignment[i[0]] = rvs_alignment.get(i[0], 0) + i[1]  # {pos:count}
 
                     aln_count -= i[1]
 
@@ -107,3 +173,150 @@ class AlignedReads(object):
         print("\n{0} {1} nt reads per million reads have aligned\n".format(aln_count, nt))
         print("-" * 50)
         return [sorted_fwd_alignment, sorted_rvs_alignment, aln_count]
+
+
+class MultiAlignedReads(object):
+    """
+    Class for aligning reads of several sizes to a reference sequence in a single pass
+    """
+
+    def __init__(self):
+        self._internal_dict = {}  # {nt: AlignedReads}
+
+    def __setitem__(self, nt, alignment):
+        self._internal_dict[nt] = alignment
+
+    def __getitem__(self, nt):
+        return self._internal_dict[nt]  # Return alignments for a read length (AlignedReads)
+
+    def __iter__(self):
+        return iter(sorted(self._internal_dict.items()))  # iterable - (nt, AlignedReads) by read length
+
+    def __len__(self):
+        return len(self._internal_dict)  # number of read lengths aligned (int)
+
+    def __contains__(self, nt):
+        return nt in self._internal_dict
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self._internal_dict == other._internal_dict
+        else:
+            return False
+
+    def lengths(self):
+        return sorted(self._internal_dict) #read lengths aligned
+
+    def align_reads_to_ref(self, seq_dict, ref, lengths=None, cores=1):
+        """
+        Align reads of all lengths from SRNASeq object to reference in RefSeq object - the reference is
+        scanned once for all lengths
+        :param seq_dict: SRNASeq or PackedSRNASeq object
+        :param ref: RefSeq object
+        :param lengths: read lengths to align - all read lengths in seq_dict if None (list(int))
+        :param cores: number of processes to spawn for a long reference - see AlignedReads.align_reads_to_ref
+                      (int)
+        """
+        if lengths is None:
+            lengths = seq_dict.lengths()
+        if cores > 1:
+            hits_by_length = _chunked_ref_hits(seq_dict, ref, lengths, cores)
+        else:
+            hits_by_length = seq_dict.ref_hits_by_length(MultiRefKmers(ref, lengths))
+        for nt, hits in hits_by_length.items():
+            alignment = AlignedReads()
+            alignment._add_hits(seq_dict, hits)
+            self._internal_dict[nt] = alignment
+
+    def split(self):
+        """
+        Divide the aligned read count at each position by the number of times the read aligns
+        """
+        for alignment in self._internal_dict.values():
+            alignment.split()
+
+
+def _ref_chunks(ref_len, max_len, cores):
+    """
+    Split the windows of a reference into chunks for parallel alignment
+    :param ref_len: reference length (int)
+    :param max_len: longest read length to align (int)
+    :param cores: number of processes (int)
+    :return: [(first window (int), last window + 1 (int)),...] in reference order - a single chunk if the
+             reference is too short to split (list)
+    """
+    windows = max(ref_len - (max_len - 1), 0)
+    chunk_count = min(cores * _CHUNKS_PER_CORE, windows // _MIN_CHUNK_WINDOWS)
+    if chunk_count < 2:
+        return [(0, windows)]
+    bounds = [windows * i // chunk_count for i in range(chunk_count + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _chunked_ref_hits(seq_dict, ref, lengths, cores):
+    """
+    Align reads of several lengths to a long reference in parallel.  Chunks overlap by max(lengths) - 1 so
+    every window is aligned in exactly one chunk; chunk hits are offset to reference positions and merged
+    into the order a single scan of the reference produces.
+    :param seq_dict: SRNASeq or PackedSRNASeq object
+    :param ref: reference sequence (DNA)
+    :param lengths: read lengths to align (list(int))
+    :param cores: number of processes to spawn (int)
+    :return: {read length (int): (positions, read keys, counts) - see SRNASeq.ref_hits} (dict)
+    """
+    lengths = sorted(set(lengths))
+    chunks = _ref_chunks(len(ref), lengths[-1], cores) if lengths else []
+    if len(chunks) < 2:
+        return seq_dict.ref_hits_by_length(MultiRefKmers(ref, lengths))
+    max_len = lengths[-1]
+    ref_seq = str(ref)
+    chunk_items = [(ref_seq[start:stop + max_len - 1], lengths, stop - start) for start, stop in chunks]
+    chunk_items[-1] = (ref_seq[chunks[-1][0]:], lengths, len(ref_seq))  # last windows of shorter reads
+    shared_seq_dict = seq_dict.shared()
+    pool = Pool(cores, initializer=_align_init_worker, initargs=(shared_seq_dict,))
+    try:
+        chunk_hits = pool.map(_align_chunk_worker, chunk_items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        if shared_seq_dict is not seq_dict:
+            shared_seq_dict.release()
+    hits_by_length = {}
+    for nt in lengths:
+        positions = numpy.concatenate([hits[nt][0] + start for (start, _), hits in zip(chunks, chunk_hits)])
+        reads = [read for hits in chunk_hits for read in hits[nt][1]]
+        counts = numpy.concatenate([hits[nt][2] for hits in chunk_hits])
+        # single scan order - fwd hits by window, rvs hits by window on the reverse complement
+        # (see kmer.MultiRefKmers.hits)
+        scan_order = numpy.argsort(numpy.where(counts < 0, 2 * (len(ref) - 1 - positions) + 1, 2 * positions),
+                                   kind='stable')
+        hits_by_length[nt] = (positions[scan_order], [reads[i] for i in scan_order.tolist()], counts[scan_order])
+    return hits_by_length
+
+
+def _align_init_worker(seq_dict):
+    """
+    Worker process initialiser - keep reads for all chunks aligned by the worker
+    :param seq_dict: SRNASeq, PackedSRNASeq or SharedSRNASeq object
+    """
+    global _worker_seq_dict
+    _worker_seq_dict = seq_dict
+
+
+def _align_chunk_worker(chunk_item):
+    """
+    Worker process - align reads to a chunk of a reference
+    :param chunk_item: (chunk sequence (str), read lengths (list(int)), number of windows aligned in this chunk
+                       (int)) - the chunk sequence runs on past its last window into the next chunk
+    :return: {read length (int): (positions, read keys, counts) - see SRNASeq.ref_hits} (dict) - positions
+             relative to the start of the chunk
+    """
+    chunk_seq, lengths, windows = chunk_item
+    hits_by_length = _worker_seq_dict.ref_hits_by_length(MultiRefKmers(DNA(chunk_seq), lengths))
+    for nt, (positions, reads, counts) in hits_by_length.items():
+        # windows of shorter reads past the last window belong to the next chunk
+        in_chunk = numpy.where(counts < 0, positions - (nt - 1), positions) < windows
+        if not in_chunk.all():
+            hits_by_length[nt] = (positions[in_chunk], [read for read, keep in zip(reads, in_chunk.tolist()) if keep],
+                                  counts[in_chunk])
+    return hits_by_length
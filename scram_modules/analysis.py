@@ -1,20 +1,22 @@
 """
 Analysis module
+
+The den and CDP modules are imported by the analyses that use them, so a run only loads what it needs
 """
 from termcolor import colored
 
-import analysis_helper as ah
-import cdp
-import den as dn
-from srnaseq import SRNASeq
+from scram_modules import analysis_helper as ah
+from scram_modules.srnaseq import PackedSRNASeq
 
 #TODO: combine functions - mnt3dm and den, CDP and CDP-split
 def single_ref_profile(seq_file_list, ref_file, nt, smoothWinSize=50,
                        fileFig=False, fileName='plot.pdf', min_read_size=18,
                        max_read_size=32, min_read_no=1, onscreen=False, no_csv=False,
-                       ylim=0, pub=False, split=False, bok = False):
+                       ylim=0, pub=False, split=False, bok = False, coverage=False, processes=4,
+                       multipage=False, hit_matrix=None, compress=False, npz=False,
+                       bedgraph=False, dpi=None, rasterize=False):
     """
-    Align reads of a single length to a single reference
+    Align reads of a single length to each sequence in a reference file
     :param seq_file_list: [path/to/seq/, path/to/seq2,...] (list(str))
     :param ref_file: path/to/reference (str)
     :param nt: read length to align (int)
@@ -30,23 +32,35 @@ def single_ref_profile(seq_file_list, ref_file, nt, smoothWinSize=50,
     :param pub: publication plot with no axes, legend (bool)
     :param split: split aligned read counts by number of times a read aligns
     :param bok: use bokeh for plotting (bool)
+    :param coverage: plot per-nucleotide coverage rather than counts at read centres (bool)
+    :param processes: no of processes for multiple reference sequences (int)
+    :param multipage: plots for multiple reference sequences to a single PDF (bool)
+    :param hit_matrix: path/to/hit/matrix.npz - save the alignment as a reference x read HitMatrix (str)
+    :param compress: gzip CSV and bedGraph files, and compress .npz files (bool)
+    :param npz: also save results as columnar .npz files - see results (bool)
+    :param bedgraph: save run-length encoded profiles as bedGraph files (bool)
+    :param dpi: resolution of PNG plots and rasterized profiles (int)
+    :param rasterize: draw profiles as images in PDF plots (bool)
     """
     """
     Aligns reads from a single read file to a single reference sequence for
     a single sRNA size.
     """
-    seq, seq_name = _profile_load_files_shared(max_read_size, min_read_no,
-                                               min_read_size, seq_file_list)
+    seq, seq_name = load_sample(seq_file_list, min_read_size, max_read_size, min_read_no)
+    from scram_modules import den as dn
     dn.srna_profile(seq, seq_name, ref_file, nt, smoothWinSize, fileFig,
-                    fileName, onscreen, no_csv, ylim, pub, split, bok)
+                    fileName, onscreen, no_csv, ylim, pub, split, bok, coverage, processes, multipage,
+                    hit_matrix, compress, npz, bedgraph, dpi, rasterize)
 
 
 def single_ref_profile_21_22_24(seq_file_list, ref_file, smoothWinSize=50,
                                 fileFig=True, fileName='plot.pdf', min_read_size=18,
                                 max_read_size=32, min_read_no=1, onscreen=True, no_csv=False,
-                                y_lim=0, pub=False, split=False,  bok = False):
+                                y_lim=0, pub=False, split=False,  bok = False, coverage=False, processes=4,
+                                multipage=False, hit_matrix=None, compress=False, npz=False,
+                                bedgraph=False, dpi=None, rasterize=False):
     """
-    Align reads of 21, 22 annd 24 nt to a single reference
+    Align reads of 21, 22 annd 24 nt to each sequence in a reference file
     :param seq_file_list: [path/to/seq/, path/to/seq2,...] (list(str))
     :param ref_file: path/to/reference (str)
     :param nt: read length to align (int)
@@ -62,22 +76,35 @@ def single_ref_profile_21_22_24(seq_file_list, ref_file, smoothWinSize=50,
     :param pub: publication plot with no axes, legend (bool)
     :param split: split aligned read counts by number of times a read aligns
     :param bok: use bokeh for plotting (bool)
+    :param coverage: plot per-nucleotide coverage rather than counts at read centres (bool)
+    :param processes: no of processes for multiple reference sequences (int)
+    :param multipage: plots for multiple reference sequences to a single PDF (bool)
+    :param hit_matrix: path/to/hit/matrix.npz - save the alignment as a reference x read HitMatrix (str)
+    :param compress: gzip CSV and bedGraph files, and compress .npz files (bool)
+    :param npz: also save results as columnar .npz files - see results (bool)
+    :param bedgraph: save run-length encoded profiles as bedGraph files (bool)
+    :param dpi: resolution of PNG plots and rasterized profiles (int)
+    :param rasterize: draw profiles as images in PDF plots (bool)
     """
-    seq, seq_name = _profile_load_files_shared(max_read_size, min_read_no, min_read_size, seq_file_list)
+    seq, seq_name = load_sample(seq_file_list, min_read_size, max_read_size, min_read_no)
+    from scram_modules import den as dn
     dn.srna_profile_21_22_24(seq, seq_name, ref_file, smoothWinSize,
-                             fileFig, fileName, onscreen, no_csv, y_lim, pub, split, bok)
+                             fileFig, fileName, onscreen, no_csv, y_lim, pub, split, bok, coverage, processes,
+                             multipage, hit_matrix, compress, npz, bedgraph, dpi, rasterize)
 
 
-def _profile_load_files_shared(max_read_size, min_read_no, min_read_size, seq_file_list):
+def load_sample(seq_file_list, min_read_size=18, max_read_size=32, min_read_no=1):
     """
-    Shared function for loading seq files
+    Load a sample - reads from one or more sequence files, with RPMR counts averaged over the files for reads
+    in all of them
+    :param seq_file_list: [path/to/seq/, path/to/seq2,...] (list(str))
+    :param min_read_size: exclude reads with lengths < min_read_size (int)
     :param max_read_size: exclude reads with lengths > max_read_size (int)
     :param min_read_no: exclude reads with counts below min_read_no (int)
-    :param min_read_size: exclude reads with lengths < min_read_size (int)
-    :param seq_file_list: [path/to/seq/, path/to/seq2,...] (list(str))
+    :return: reads (PackedSRNASeq), sample name - sequence file names joined by _ (str)
     """
     print(colored("-----------------LOADING SEQUENCES----------------", 'green'))
-    seq = SRNASeq()
+    seq = PackedSRNASeq()
     if len(seq_file_list) == 1:
         seq.load_seq_file(seq_file_list[0], max_read_size, min_read_no,
                           min_read_size)
@@ -97,7 +124,8 @@ def _profile_load_files_shared(max_read_size, min_read_no, min_read_size, seq_fi
 def CDP(seq_file_list_1, seq_file_list_2, ref_file, nt,
         fileFig=False, fileName='plot.pdf',
         min_read_size=18, max_read_size=32, min_read_no=1, onscreen=False,
-        no_csv=False, pub=True, processes=4,  bok = False):
+        no_csv=False, pub=True, processes=4,  bok = False, chunk_size=500, hit_matrix=None,
+        compress=False, npz=False, dpi=None, rasterize=False):
     """
     Align reads of a single length to multiple references, and calculate counts only
     :param seq_file_list_1: [path/to/seq/, path/to/seq2,...] (list(str))
@@ -114,20 +142,29 @@ def CDP(seq_file_list_1, seq_file_list_2, ref_file, nt,
     :param pub: publication plot with no axes, legend (bool)
     :param processes: no of processes to generate at a time i.e. threads (int)
     :param bok: use bokeh for plotting (bool)
+    :param chunk_size: no. of reference sequences sent to a process at a time (int)
+    :param hit_matrix: path/to/hit/matrix.npz - save the alignment as a reference x read HitMatrix (str)
+    :param compress: gzip CSV files, and compress .npz files (bool)
+    :param npz: also save results as columnar .npz files - see results (bool)
+    :param dpi: resolution of a PNG plot and rasterized points (int)
+    :param rasterize: draw points as an image in a PDF plot (bool)
     """
 
     seq_1, seq_2, seq_name_1, seq_name_2 = _cdp_load_files_shared(max_read_size, min_read_no, min_read_size,
                                                                   seq_file_list_1,
                                                                   seq_file_list_2)
 
+    from scram_modules import cdp
     cdp.cdp_no_split_alignment(seq_1, seq_2, seq_name_1, seq_name_2, ref_file, nt, fileFig,
-                               fileName, onscreen, no_csv, pub, processes, bok)
+                               fileName, onscreen, no_csv, pub, processes, bok, chunk_size, hit_matrix,
+                               compress, npz, dpi, rasterize)
 
 
 def CDP_split(seq_file_list_1, seq_file_list_2, ref_file, nt,
               fileFig=False, fileName='plot.pdf',
               min_read_size=18, max_read_size=32, min_read_no=1, onscreen=False,
-              no_csv=False, pub=False, processes=4,  bok = False):
+              no_csv=False, pub=False, processes=4,  bok = False, chunk_size=500, hit_matrix=None,
+              compress=False, npz=False, dpi=None, rasterize=False):
     """
     Align reads of a single length to multiple references, and calculate counts only
     :param seq_file_list_1: [path/to/seq/, path/to/seq2,...] (list(str))
@@ -144,13 +181,21 @@ def CDP_split(seq_file_list_1, seq_file_list_2, ref_file, nt,
     :param pub: publication plot with no axes, legend (bool)
     :param processes: no of processes to generate at a time i.e. threads (int)
     :param bok: use bokeh for plotting (bool)
+    :param chunk_size: no. of reference sequences sent to a process at a time (int)
+    :param hit_matrix: path/to/hit/matrix.npz - save the alignment as a reference x read HitMatrix (str)
+    :param compress: gzip CSV files, and compress .npz files (bool)
+    :param npz: also save results as columnar .npz files - see results (bool)
+    :param dpi: resolution of a PNG plot and rasterized points (int)
+    :param rasterize: draw points as an image in a PDF plot (bool)
     """
     seq_1, seq_2, seq_name_1, seq_name_2 = _cdp_load_files_shared(max_read_size, min_read_no, min_read_size,
                                                                   seq_file_list_1,
                                                                   seq_file_list_2)
 
+    from scram_modules import cdp
     cdp.cdp_split_alignment(seq_1, seq_2, seq_name_1, seq_name_2, ref_file,
-                            nt, fileFig, fileName, onscreen, no_csv, pub, processes, bok)
+                            nt, fileFig, fileName, onscreen, no_csv, pub, processes, bok, chunk_size, hit_matrix,
+                            compress, npz, dpi, rasterize)
 
 
 def _cdp_load_files_shared(max_read_size, min_read_no, min_read_size, seq_file_list_1, seq_file_list_2):
@@ -164,14 +209,14 @@ def _cdp_load_files_shared(max_read_size, min_read_no, min_read_size, seq_file_l
     :return: seq1(sRNASeq), seq2 (sRNASeq), seq_name_1 (str), seq_name_2 (str)
     """
     print(colored("-----------------LOADING SEQUENCES----------------", 'green'))
-    seq_1 = SRNASeq()
+    seq_1 = PackedSRNASeq()
     if len(seq_file_list_1) == 1:
         seq_1.load_seq_file(seq_file_list_1[0], max_read_size, min_read_no,
                             min_read_size)
     else:
         seq_1.load_seq_file_arg_list(seq_file_list_1, max_read_size, min_read_no,
                                      min_read_size)
-    seq_2 = SRNASeq()
+    seq_2 = PackedSRNASeq()
     if len(seq_file_list_2) == 1:
         seq_2.load_seq_file(seq_file_list_2[0], max_read_size, min_read_no,
                             min_read_size)
@@ -197,7 +242,8 @@ def _cdp_load_files_shared(max_read_size, min_read_no, min_read_size, seq_file_l
 
 
 def reads_aligned_per_seq(seq_file_list, ref_file, nt, split,
-                          min_read_len=18, max_read_len=32, min_read_no=1, processes=4):
+                          min_read_len=18, max_read_len=32, min_read_no=1, processes=4, chunk_size=500,
+                          hit_matrix=None, compress=False, npz=False):
     """
     Get RPMR alignments for each sequence file in the list - no plot
     :param seq_file_list: [path/to/seq/, path/to/seq2,...] (list(str))
@@ -209,6 +255,10 @@ def reads_aligned_per_seq(seq_file_list, ref_file, nt, split,
     :param min_read_no: exclude reads with counts below min_read_no (int)
     :param pub: publication plot with no axes, legend (bool)
     :param processes: no of processes to generate at a time i.e. threads (int)
+    :param chunk_size: no. of reference sequences sent to a process at a time (int)
+    :param hit_matrix: path/to/hit/matrix.npz - save the alignment as a reference x read HitMatrix (str)
+    :param compress: gzip CSV files, and compress .npz files (bool)
+    :param npz: also save results as columnar .npz files - see results (bool)
     """
     """
     Calculates normalised reads aligned to multiple reference sequences for each seq file individually
@@ -216,10 +266,10 @@ def reads_aligned_per_seq(seq_file_list, ref_file, nt, split,
     Outputs a csv only (no scatter plot)
     """
     print(colored("-----------------LOADING SEQUENCES----------------", 'green'))
-    loaded_seq_list = []  # list of SRNASeq objects
+    loaded_seq_list = []  # list of PackedSRNASeq objects
     loaded_seq_name_list = []  # list of seq names in same order
     for seq_file in range(len(seq_file_list)):
-        seq = SRNASeq()
+        seq = PackedSRNASeq()
         seq.load_seq_file(seq_file_list[seq_file],
                           max_read_len,
                           min_read_no,
@@ -228,11 +278,12 @@ def reads_aligned_per_seq(seq_file_list, ref_file, nt, split,
         seq_name = ah.single_file_output(seq_file_list[seq_file])
         loaded_seq_name_list.append(seq_name)
 
+    from scram_modules import cdp
     if split:
         cdp.cdp_no_split_single(loaded_seq_list, loaded_seq_name_list,
                                 ref_file,
-                                nt, processes)
+                                nt, processes, chunk_size, hit_matrix, compress, npz)
     else:
         cdp.cdp_split_single(loaded_seq_list, loaded_seq_name_list,
                              ref_file,
-                             nt, processes)
+                             nt, processes, chunk_size, hit_matrix, compress, npz)
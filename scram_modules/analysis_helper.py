@@ -1,6 +1,8 @@
 """
 Helper functions for the analysis Module
 """
+import os
+import re
 
 
 def single_file_output(in_file):
@@ -61,3 +63,34 @@ def ref_seq_output(in_seq_name, in_ref_name, ext):
     return "{0}_{1}.{2}".format(in_ref_name,
                                 in_seq_name,
                                 ext)
+
+
+def ref_header_output(header):
+    """
+    Extract reference name from a FASTA header for output file names ie. >chr1 description --> chr1
+    :param header: reference header (str)
+    :return: reference name - characters that can't be used in file names are replaced with _ (str)
+    """
+    words = header.lstrip('>').split()
+    return re.sub(r'[^\w.-]', '_', words[0]) if words else 'ref'
+
+
+def ref_track_name(header):
+    """
+    Extract sequence name from a FASTA header for genome browser tracks ie. >chr1 description --> chr1
+    :param header: reference header (str)
+    :return: sequence name, unchanged (str)
+    """
+    words = header.lstrip('>').split()
+    return words[0] if words else 'ref'
+
+
+def ref_file_name(file_name, in_ref_name):
+    """
+    Add a reference name to a manual file name ie. fig.pdf --> fig_chr1.pdf
+    :param file_name: file name (str)
+    :param in_ref_name: reference name (str)
+    :return: file name for the reference (str)
+    """
+    root, ext = os.path.splitext(file_name)
+    return "{0}_{1}{2}".format(root, in_ref_name, ext)
@@ -0,0 +1,274 @@
+"""
+Batch module
+
+Runs a manifest of den, mnt3dm, CDP and CDP_single analyses.  Every sample (a set of sequence files) and
+reference in the manifest is loaded once, before any analysis runs, and shared by all the analyses that use
+it.  The analyses then run in a pool of worker processes that are given the loaded samples and references
+when they start (with fork, they are shared with the worker processes rather than copied).
+
+A manifest is a tab-separated file with a header line, or a JSON file (.json) holding a list of objects,
+with the fields:
+    analysis - den, mnt3dm, CDP or CDP_single
+    reference - path/to/reference
+    s1 - sequence file/s (comma separated in a TSV file, or a list in a JSON file)
+    s2 - sequence file/s 2 - CDP only
+    nt - read length for den, CDP and CDP_single (optional - default 21)
+    file_name - figure file name or "auto" (optional - no figure if empty)
+
+Analysis settings (read size limits, smoothing window, output options...) are shared by all analyses.
+"""
+import csv
+import json
+import os
+import time
+from multiprocessing import Pool
+
+from termcolor import colored
+
+ANALYSES = ('den', 'mnt3dm', 'CDP', 'CDP_single')
+_DEFAULT_NT = 21
+
+_worker_samples = None  # {sample: (reads, sample name)} for this worker process - set by _batch_init_worker
+_worker_refs = None  # {path/to/refseq: reference sequences} for this worker process
+_worker_settings = None  # analysis settings for this worker process - see run_batch
+
+
+def run_batch(manifest_file, smoothWinSize=50, min_read_size=18, max_read_size=32, min_read_no=1,
+              no_csv=True, ylim=0, pub=False, split=False, coverage=False, processes=4, chunk_size=500,
+              multipage=False, compress=False, npz=False, bedgraph=False, dpi=None, rasterize=False):
+    """
+    Run every analysis in a manifest.  Figures are only written to file - not displayed.
+    :param manifest_file: path/to/manifest - .json, or tab-separated (str)
+    :param smoothWinSize: window size for smoothing den and mnt3dm profiles (int)
+    :param min_read_size: exclude reads with lengths < min_read_size (int)
+    :param max_read_size: exclude reads with lengths > max_read_size (int)
+    :param min_read_no: exclude reads with counts below min_read_no (int)
+    :param no_csv: generate CSVs of alignment data (bool)
+    :param ylim: +/- y limits on den and mnt3dm plots
+    :param pub: publication plots with no axes, legend (bool)
+    :param split: split aligned read counts by number of times a read aligns (bool)
+    :param coverage: plot per-nucleotide coverage rather than counts at read centres (bool)
+    :param processes: no. of analyses run at a time - or no. of processes for a single analysis (int)
+    :param chunk_size: no. of reference sequences sent to a CDP process at a time (int)
+    :param multipage: den and mnt3dm plots for multiple reference sequences to a single PDF (bool)
+    :param compress: gzip CSV and bedGraph files, and compress .npz files (bool)
+    :param npz: also save results as columnar .npz files - see results (bool)
+    :param bedgraph: save den and mnt3dm profiles as bedGraph files (bool)
+    :param dpi: resolution of PNG plots and rasterized series (int)
+    :param rasterize: draw profiles and points as images in PDF plots (bool)
+    :return: analyses that failed (list(dict))
+    """
+    start = time.time()
+    jobs = read_manifest(manifest_file)
+    sample_files, ref_files = plan_batch(jobs)
+    missing = [in_file for in_file in sorted(set(sum(sample_files, ())) | set(ref_files))
+               if not os.path.isfile(in_file)]
+    if missing:
+        print(colored("\nEXITING!\n\nFiles in {0} not found: {1}\n".format(manifest_file, ", ".join(missing)),
+                      'red'))
+        return jobs
+    samples = _load_samples(sample_files, max_read_size, min_read_no, min_read_size)
+    refs = _load_refs(ref_files)
+    settings = {'smooth_win_size': smoothWinSize, 'no_csv': no_csv, 'ylim': ylim, 'pub': pub, 'split': split,
+                'coverage': coverage, 'cores': processes, 'chunk_size': chunk_size, 'multipage': multipage,
+                'compress': compress, 'npz': npz, 'bedgraph': bedgraph, 'dpi': dpi, 'rasterize': rasterize}
+    print(colored("------------------RUNNING {0} ANALYSES------------------\n".format(len(jobs)), 'green'))
+    if processes <= 1 or len(jobs) == 1:
+        _batch_init_worker(samples, refs, settings)  # a single analysis uses all processes itself
+        results = [_batch_worker(job) for job in jobs]
+    else:
+        # each analysis runs in a single worker process - daemonic worker processes can't start their own pools
+        pool = Pool(min(processes, len(jobs)), initializer=_batch_init_worker,
+                    initargs=(samples, refs, dict(settings, cores=1)))
+        try:
+            results = pool.map(_batch_worker, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    failed = [job for job, error in zip(jobs, results) if error is not None]
+    for job, error in zip(jobs, results):
+        if error is not None:
+            print(colored("{0} failed: {1}".format(_job_name(job), error), 'red'))
+    print("\nBatch time = {0:.1f} seconds - {1} of {2} analyses completed\n".format(time.time() - start,
+                                                                                   len(jobs) - len(failed),
+                                                                                   len(jobs)))
+    return failed
+
+
+def read_manifest(manifest_file):
+    """
+    Read and check the analyses in a manifest
+    :param manifest_file: path/to/manifest - .json, or tab-separated (str)
+    :return: analyses - {'analysis': (str), 'reference': (str), 's1': (tuple(str)), 's2': (tuple(str)),
+             'nt': (int), 'file_name': (str)} (list(dict))
+    :raises ValueError: if an analysis is unknown or missing sequence files
+    """
+    with open(manifest_file) as manifest:
+        if manifest_file.lower().endswith('.json'):
+            rows = json.load(manifest)
+        else:
+            rows = [row for row in csv.DictReader(manifest, delimiter='\t')
+                    if row.get('analysis') and not row['analysis'].startswith('#')]
+    return [_manifest_job(row, line) for line, row in enumerate(rows, 1)]
+
+
+def plan_batch(jobs):
+    """
+    Samples and references needed for a batch - each is listed once, in the order first used
+    :param jobs: analyses - see read_manifest (list(dict))
+    :return: samples - sequence files for each (list(tuple(str))), reference files (list(str))
+    """
+    sample_files = []
+    ref_files = []
+    for job in jobs:
+        for sample in _job_samples(job):
+            if sample not in sample_files:
+                sample_files.append(sample)
+        if job['reference'] not in ref_files:
+            ref_files.append(job['reference'])
+    return sample_files, ref_files
+
+
+def _manifest_job(row, line):
+    """
+    Check and normalise an analysis read from a manifest
+    :param row: manifest fields (dict)
+    :param line: analysis number in the manifest (int)
+    :return: analysis (dict) - see read_manifest
+    """
+    job = {'analysis': row.get('analysis'), 'reference': row.get('reference'),
+           's1': _seq_files(row.get('s1')), 's2': _seq_files(row.get('s2')),
+           'nt': int(row.get('nt') or _DEFAULT_NT), 'file_name': row.get('file_name') or "NO_PLOT"}
+    if job['analysis'] not in ANALYSES:
+        raise ValueError("Manifest analysis {0}: {1} is not a recognized analysis type".format(line,
+                                                                                           job['analysis']))
+    if not job['reference'] or not job['s1'] or (job['analysis'] == 'CDP') != bool(job['s2']):
+        raise ValueError("Manifest analysis {0}: {1} requires a reference and sequence files (s1{2})".format(
+            line, job['analysis'], ", s2" if job['analysis'] == 'CDP' else " only"))
+    return job
+
+
+def _seq_files(field):
+    """
+    Sequence files from a manifest field
+    :param field: comma separated paths (str), paths (list(str)) or None
+    :return: paths (tuple(str))
+    """
+    if not field:
+        return ()
+    if isinstance(field, str):
+        field = field.split(',')
+    return tuple(seq_file.strip() for seq_file in field if seq_file.strip())
+
+
+def _job_samples(job):
+    """
+    Samples used by an analysis - CDP_single aligns each sequence file as a separate sample
+    :param job: analysis - see read_manifest (dict)
+    :return: sequence files for each sample (list(tuple(str)))
+    """
+    if job['analysis'] == 'CDP_single':
+        return [(seq_file,) for seq_file in job['s1']]
+    if job['analysis'] == 'CDP':
+        return [job['s1'], job['s2']]
+    return [job['s1']]
+
+
+def _job_name(job):
+    """
+    :param job: analysis - see read_manifest (dict)
+    :return: analysis description for messages (str)
+    """
+    return "{0} {1} {2}".format(job['analysis'], job['reference'], ",".join(job['s1'] + job['s2']))
+
+
+def _load_samples(sample_files, max_read_size, min_read_no, min_read_size):
+    """
+    Load each sample once
+    :param sample_files: sequence files for each sample (list(tuple(str)))
+    :param max_read_size: exclude reads with lengths > max_read_size (int)
+    :param min_read_no: exclude reads with counts below min_read_no (int)
+    :param min_read_size: exclude reads with lengths < min_read_size (int)
+    :return: {sample: (reads (PackedSRNASeq), sample name (str))} (dict)
+    """
+    from scram_modules import analysis
+    return {sample: analysis.load_sample(list(sample), min_read_size, max_read_size, min_read_no)
+            for sample in sample_files}
+
+
+def _load_refs(ref_files):
+    """
+    Load (or read the index for) each reference once
+    :param ref_files: reference files (list(str))
+    :return: {path/to/refseq: reference sequences (IndexedRefSeq or RefSeq)} (dict)
+    """
+    from scram_modules import den as dn
+    return {ref_file: dn.load_refs(ref_file) for ref_file in ref_files}
+
+
+def _batch_init_worker(samples, refs, settings):
+    """
+    Worker process initialiser - keep the loaded samples and references for all analyses run by the worker
+    :param samples: {sample: (reads, sample name)} (dict)
+    :param refs: {path/to/refseq: reference sequences} (dict)
+    :param settings: analysis settings (dict)
+    """
+    global _worker_samples, _worker_refs, _worker_settings
+    _worker_samples = samples
+    _worker_refs = refs
+    _worker_settings = settings
+
+
+def _batch_worker(job):
+    """
+    Worker process - run an analysis with the worker's samples and references.  Errors are returned, so the
+    rest of the batch still runs.
+    :param job: analysis - see read_manifest (dict)
+    :return: error message (str) or None
+    """
+    try:
+        _run_job(job, _worker_settings)
+    except Exception as e:
+        return "{0}: {1}".format(type(e).__name__, e)
+    return None
+
+
+def _run_job(job, settings):
+    """
+    Run a single analysis
+    :param job: analysis - see read_manifest (dict)
+    :param settings: analysis settings (dict)
+    """
+    ref_file = job['reference']
+    refs = _worker_refs[ref_file]
+    file_fig = job['file_name'] != "NO_PLOT"
+    if job['analysis'] in ('den', 'mnt3dm'):
+        from scram_modules import den as dn
+        seq, seq_name = _worker_samples[job['s1']]
+        den_split = not settings['split']  # den functions split counts if their split argument is False
+        if job['analysis'] == 'den':
+            dn.srna_profile(seq, seq_name, ref_file, job['nt'], settings['smooth_win_size'], file_fig,
+                            job['file_name'], False, settings['no_csv'], settings['ylim'], settings['pub'],
+                            den_split, False, settings['coverage'], settings['cores'], settings['multipage'],
+                            None, settings['compress'], settings['npz'], settings['bedgraph'], settings['dpi'],
+                            settings['rasterize'], refs)
+        else:
+            dn.srna_profile_21_22_24(seq, seq_name, ref_file, settings['smooth_win_size'], file_fig,
+                                     job['file_name'], False, settings['no_csv'], settings['ylim'], settings['pub'],
+                                     den_split, False, settings['coverage'], settings['cores'],
+                                     settings['multipage'], None, settings['compress'], settings['npz'],
+                                     settings['bedgraph'], settings['dpi'], settings['rasterize'], refs)
+    elif job['analysis'] == 'CDP':
+        from scram_modules import cdp
+        seq_1, seq_name_1 = _worker_samples[job['s1']]
+        seq_2, seq_name_2 = _worker_samples[job['s2']]
+        alignment = cdp.cdp_split_alignment if settings['split'] else cdp.cdp_no_split_alignment
+        alignment(seq_1, seq_2, seq_name_1, seq_name_2, ref_file, job['nt'], file_fig, job['file_name'], False,
+                  settings['no_csv'], settings['pub'], settings['cores'], False, settings['chunk_size'], None,
+                  settings['compress'], settings['npz'], settings['dpi'], settings['rasterize'], refs)
+    else:
+        from scram_modules import cdp
+        loaded_seqs = [_worker_samples[sample] for sample in _job_samples(job)]
+        alignment = cdp.cdp_split_single if settings['split'] else cdp.cdp_no_split_single
+        alignment([seq for seq, _ in loaded_seqs], [seq_name for _, seq_name in loaded_seqs], ref_file, job['nt'],
+                  settings['cores'], settings['chunk_size'], None, settings['compress'], settings['npz'], refs)
@@ -1,18 +1,29 @@
 from termcolor import colored
-from refseq import RefSeq
-import write_to_file as wtf
-import analysis_helper as ah
-import plot_reads as pr
-from dna import DNA
-from multiprocessing import Process, JoinableQueue, Manager
+from scram_modules.refseq import IndexedRefSeq, read_ref_file
+from scram_modules import write_to_file as wtf
+from scram_modules import analysis_helper as ah
+from scram_modules import plot_reads as pr
+from scram_modules.kmer import RefKmers
+from scram_modules.srnaseq import MultiSRNASeq
+from scram_modules.hitmatrix import HitMatrix
+from multiprocessing import Pool
+from collections import deque
+import numpy
 import psutil
 import time
 
 """
 CDP analysis class - for calculation of reads aligning to a reference
 """
+
+_worker_reads = None  # merged read sets for this worker process - set once by _cdp_init_worker
+_worker_nt = None  # read length to align in this worker process
+_worker_refs = None  # indexed reference for this worker process - None if sequences are sent in chunks
+
+
 def cdp_no_split_alignment(seq_1, seq_2, seq_name_1, seq_name_2, ref_file, nt, file_fig,
-                           file_name, onscreen, no_csv, pub, cores, bok):
+                           file_name, onscreen, no_csv, pub, cores, bok, chunk_size=500, hit_matrix=None,
+                           compress=False, npz=False, dpi=None, rasterize=False, refs=None):
     """
     Align two sets of sequence files to multiple reference sequences for scatter plotting of counts
     :param seq_1: seq file set 1 (SRNASeq)
@@ -27,344 +38,346 @@ def cdp_no_split_alignment(seq_1, seq_2, seq_name_1, seq_name_2, ref_file, nt, f
     :param no_csv: generate csv (boot)
     :param pub: publication images without labels, legend etc (bool)
     :param cores: number of processes to spawn (int)
+    :param chunk_size: no. of reference sequences sent to a worker process at a time (int)
+    :param hit_matrix: path/to/hit/matrix.npz - save the alignment as a HitMatrix (str)
+    :param compress: gzip the CSV file, and compress the .npz file (bool)
+    :param npz: save counts as a columnar .npz file (bool)
+    :param dpi: resolution of a PNG plot and rasterized points (int) - matplotlib default if None
+    :param rasterize: draw points as an image in a PDF plot (bool)
+    :param refs: reference sequences already loaded from ref_file - read from the file if None
+                 (IndexedRefSeq or RefSeq)
     """
     start = time.time()
-    workers = cores
-    work_queue = JoinableQueue()
-    processes = []
-    mgr = Manager()
-    count = 0
-    counts_by_ref = mgr.dict()  # header:(count1, count2)
-    refs = RefSeq()
-    refs.load_ref_file(ref_file)
     print(colored("------------------ALIGNING READS------------------\n", 'green'))
-    for header, seq in refs:
-        work_queue.put((header, seq,))  # tuple into work queue
-        count += 1
-        if count % 10000 == 0:
-            print("{0} reference sequences processed\n".format(count))
-            print(colored("{0}% system RAM used\n".format(psutil.virtual_memory().percent), 'green'))
-            _cdp_no_split_queue(counts_by_ref, nt, processes, seq_1, seq_2, work_queue, workers)
-    _cdp_no_split_queue(counts_by_ref, nt, processes, seq_1, seq_2, work_queue, workers)
+    headers = []
+    refs, indexed_refs = ref_records(ref_file, refs)
+    if hit_matrix is None:
+        ref_counts = _cdp_no_split_counts(refs, headers, [seq_1, seq_2], nt, cores, chunk_size, indexed_refs)
+    else:
+        ref_counts = _cdp_save_hit_matrix(refs, headers, [seq_1, seq_2], [seq_name_1, seq_name_2], nt, cores,
+                                          chunk_size, indexed_refs, hit_matrix).ref_counts()
+    counts_by_ref = {}  # header:(count1, count2)
+    for ordinal in numpy.flatnonzero(ref_counts.any(axis=1)):
+        counts_by_ref[headers[ordinal]] = tuple(ref_counts[ordinal].tolist())
     print("\nAlignment time = " + str("{0:.1f}".format((time.time() - start))) + " seconds\n")
     if len(counts_by_ref) == 0:
         print("\nNo reads aligned to any reference sequence. \
         Output files not generated\n")
     else:
-        _cdp_output(counts_by_ref.copy(), file_fig, file_name, onscreen, no_csv, seq_name_1,
-                    seq_name_2, ref_file, nt, pub, bok)
+        _cdp_output(counts_by_ref, file_fig, file_name, onscreen, no_csv, seq_name_1,
+                    seq_name_2, ref_file, nt, pub, bok, compress, npz, dpi, rasterize)
 
 
-def _cdp_no_split_queue(counts_by_ref, nt, processes, seq_1, seq_2, work_queue, workers):
+def ref_counts(refs, headers, read_sets, nt, cores=1, chunk_size=500, indexed_refs=None, split=False):
     """
-    Fill the multiprocess queue for non-split CDP
-    :param counts_by_ref: Manager dict for counts for each reference result (mgr.dict)
+    Count reads from each read set aligned to each reference sequence
+    :param refs: reference sequences - iterable of (header, ref), see ref_records
+    :param headers: list that reference headers are appended to, in reference order (list)
+    :param read_sets: [seq_1 (SRNASeq),...] (list)
     :param nt: read length to align (int)
-    :param processes: list for processes to be added to (list)
-    :param seq_1: seq file set 1 (SRNASeq)
-    :param seq_2: seq file set 2 (SRNASeq)
-    :param work_queue: joinable queue with refseq header and seq tuples (JoinableQueue(header,ref_seq))
-    :param workers: number of processes to spawn (int)
-    """
-    for w in range(workers):
-        p = Process(target=_cdp_no_split_worker, args=(work_queue, counts_by_ref,
-                                                       seq_1,
-                                                       seq_2,
-                                                       nt))
-        p.start()
-        processes.append(p)
-    for p in processes:
-        p.join()
-
-
-def _cdp_no_split_worker(work_queue, counts_by_ref, seq_1, seq_2, nt):
-    """
-    Worker process - get refseq from work queue, aligns reads from seq_1 and seq_2,
-    and adds as (x,y) coords to counts_by_ref if there are alignments.
-    :param work_queue: joinable queue with refseq header and seq tuples (JoinableQueue(header,ref_seq))
-    :param counts_by_ref: Manager dict for counts for each reference result (mgr.dict)
-    :param seq_1: seq file set 1 (SRNASeq)
-    :param seq_2: seq file set 2 (SRNASeq)
-    :param nt: read length to align (int)
-    :return: True
+    :param cores: number of processes to spawn (int)
+    :param chunk_size: no. of reference sequences sent to a worker process at a time (int)
+    :param indexed_refs: indexed reference that ordinals in refs refer to (IndexedRefSeq)
+    :param split: split each read count by the number of times the read aligns to all reference sequences (bool)
+    :return: aligned counts - row for each reference ordinal, column for each read set
+             (numpy.array(float, ndim=2))
     """
-
-    try:
-        while not work_queue.empty():
-            both_aligned = _cdp_no_split_single_ref_align(work_queue.get(), seq_1, seq_2, nt)
-            if both_aligned is not None:
-                counts_by_ref[both_aligned[0]] = (both_aligned[1], both_aligned[2])
-    except Exception as e:
-        print(e)
-    return True
+    counts_function = _cdp_split_counts if split else _cdp_no_split_counts
+    return counts_function(refs, headers, read_sets, nt, cores, chunk_size, indexed_refs)
 
 
-def _cdp_no_split_single_ref_align(single_ref, seq_1, seq_2, nt):
+def _cdp_no_split_counts(refs, headers, read_sets, nt, cores, chunk_size, indexed_refs=None):
     """
-    Count for both seqs aligned to single refseq seq
-    :param single_ref: single refseq seq (DNA)
-    :param seq_1: seq file set 1 (SRNASeq)
-    :param seq_2: seq file set 2 (SRNASeq)
+    Count reads from each read set aligned to each reference sequence
+    :param refs: reference sequences - iterable of (header, ref), see ref_records
+    :param headers: list that reference headers are appended to, in reference order (list)
+    :param read_sets: [seq_1 (SRNASeq),...] (list)
     :param nt: read length to align (int)
-    :return header, count_1, count 2 (str, float, float)
+    :param cores: number of processes to spawn (int)
+    :param chunk_size: no. of reference sequences sent to a worker process at a time (int)
+    :param indexed_refs: indexed reference that ordinals in refs refer to (IndexedRefSeq)
+    :return: aligned counts - row for each reference ordinal, column for each read set
+             (numpy.array(float, ndim=2))
+    """
+    chunk_counts = [numpy.zeros((0, len(read_sets)))]
+    for _, counts in _cdp_pool_map(_cdp_no_split_worker, refs, headers, MultiSRNASeq(read_sets, [nt]), nt, cores,
+                                   chunk_size, indexed_refs):
+        chunk_counts.append(counts)
+    return numpy.concatenate(chunk_counts)
+
+
+def _cdp_pool_map(worker, refs, headers, merged_reads, nt, cores, chunk_size, indexed_refs=None):
+    """
+    Align reads to reference sequences with a pool of worker processes that persists for the whole analysis.
+    Read sets are merged, so each reference is scanned once for all read sets, and placed in shared memory
+    that each worker attaches to once.  Reference sequences are sent in chunks as they are read.  At most 2
+    chunks per process are in flight, so only those reference sequences are held in memory, and alignment
+    starts while the reference file is still being read.  Errors in a worker are raised here.
+    :param worker: function run by a worker for each chunk -
+                   (first ordinal, [ref,...]) --> first ordinal, chunk results
+    :param refs: reference sequences - iterable of (header, ref), see ref_records
+    :param headers: list that reference headers are appended to, in reference order (list)
+    :param merged_reads: read sets for each worker (MultiSRNASeq)
+    :param nt: read length to align (int)
+    :param cores: number of processes to spawn - chunks are aligned in this process if 1 (int)
+    :param chunk_size: no. of reference sequences sent to a worker process at a time (int)
+    :param indexed_refs: indexed reference that ordinals in refs refer to (IndexedRefSeq)
+    :return: generator of (first ordinal (int), chunk results), in reference order
     """
-
-    single_alignment = _cdp_no_split_count_aligned_reads_to_seq(seq_1, seq_2,
-                                                                single_ref[1], nt)
-
-    if single_alignment[0] != 0 or single_alignment[1] != 0:
-        return single_ref[0], single_alignment[0], single_alignment[1],
+    count = 0
+    if cores <= 1:
+        _cdp_init_worker(merged_reads, nt, indexed_refs)
+        for ref_chunk in _ref_chunks(refs, headers, chunk_size):
+            count = _chunk_progress(count, len(ref_chunk[1]))
+            yield worker(ref_chunk)
+        return
+    shared_reads = merged_reads.shared()
+    pool = Pool(cores, initializer=_cdp_init_worker, initargs=(shared_reads, nt, indexed_refs))
+    in_flight = deque()  # pending chunk results, in reference order
+    try:
+        chunks = _ref_chunks(refs, headers, chunk_size)
+        while True:
+            for ref_chunk in chunks:
+                in_flight.append((len(ref_chunk[1]), pool.apply_async(worker, (ref_chunk,))))
+                if len(in_flight) >= 2 * cores:
+                    break
+            if not in_flight:
+                break
+            chunk_len, chunk_result = in_flight.popleft()
+            first_ordinal, chunk_results = chunk_result.get()
+            count = _chunk_progress(count, chunk_len)
+            yield first_ordinal, chunk_results
+    finally:
+        pool.close()
+        pool.join()
+        if shared_reads is not merged_reads:
+            shared_reads.release()
+
+
+def _chunk_progress(count, chunk_len):
+    """
+    Report progress every 10000 reference sequences
+    :param count: no. of reference sequences processed before the chunk (int)
+    :param chunk_len: no. of reference sequences in the chunk (int)
+    :return: no. of reference sequences processed (int)
+    """
+    if (count + chunk_len) // 10000 > count // 10000:
+        print("{0} reference sequences processed\n".format(count + chunk_len))
+        print(colored("{0}% system RAM used\n".format(psutil.virtual_memory().percent), 'green'))
+    return count + chunk_len
+
+
+def _ref_chunks(refs, headers, chunk_size):
+    """
+    Split reference sequences into chunks for worker processes.  Headers stay in the parent process -
+    references are identified by ordinal (position in the reference file).
+    :param refs: reference sequences - iterable of (header, ref), see ref_records
+    :param headers: list that reference headers are appended to, in reference order (list)
+    :param chunk_size: no. of reference sequences in a chunk (int)
+    :return: generator of (first ordinal (int), [ref,...])
+    """
+    first_ordinal = len(headers)
+    chunk = []
+    for header, seq in refs:
+        headers.append(header)
+        chunk.append(seq)
+        if len(chunk) == chunk_size:
+            yield first_ordinal, chunk
+            first_ordinal += len(chunk)
+            chunk = []
+    if chunk:
+        yield first_ordinal, chunk
+
+
+def ref_records(ref_file, refs=None):
+    """
+    Reference sequences to align.  An indexed reference is used where possible - only ordinals are sent
+    to worker processes, which read their sequences from the memory-mapped reference file.  Otherwise
+    sequences are streamed from the reference file (or taken from loaded references) and sent in chunks.
+    :param ref_file: path/to/refseq (str)
+    :param refs: reference sequences already loaded from ref_file - read from the file if None
+                 (IndexedRefSeq or RefSeq)
+    :return: iterable of (header (str), ref - ordinal (int) or sequence (DNA)),
+             indexed reference (IndexedRefSeq) or None
+    """
+    if isinstance(refs, IndexedRefSeq):
+        return ((header, ordinal) for ordinal, header in enumerate(refs.headers())), refs
+    if refs is not None:
+        return iter(refs), None
+    indexed_refs = IndexedRefSeq()
+    try:
+        indexed_refs.load_ref_file(ref_file)
+    except ValueError as e:
+        print("\n{0} - reference not indexed\n".format(e))
+        return read_ref_file(ref_file), None
+    return ((header, ordinal) for ordinal, header in enumerate(indexed_refs.headers())), indexed_refs
 
 
-def _cdp_no_split_count_aligned_reads_to_seq(seq_dict_1, seq_dict_2, ref, nt):
+def _cdp_init_worker(reads, nt, indexed_refs):
     """
-    Return mapped reads for a single ref_seq
-    pos is 5' end of read relative to 5' end of fwd strand
-    :param seq_dict_1:
-    :param seq_dict_2:
-    :param ref:
-    :param nt:
-    :return: aligned_count_1, aligned_count_2 (int,int)
+    Worker process initialiser - keep read sets and reference for all chunks processed by the worker
+    :param reads: merged read sets (MultiSRNASeq)
+    :param nt: read length to align (int)
+    :param indexed_refs: indexed reference, or None if sequences are sent in chunks (IndexedRefSeq)
     """
+    global _worker_reads, _worker_nt, _worker_refs
+    _worker_reads = reads
+    _worker_nt = nt
+    _worker_refs = indexed_refs
 
-    aligned_count_1 = 0  # number of reads aligned
-    aligned_count_2 = 0  # number of reads aligned
-    count_start = 0
-
-    ref_complement = ref.complement()
-
-    while count_start < (len(ref) - (nt - 1)):
-        query_seq_fwd, query_seq_rvs = _get_query_seqs(count_start, ref, ref_complement, nt)
 
-        aligned_count_1 = _cdp_no_split_aligned_count(aligned_count_1, query_seq_fwd, query_seq_rvs, seq_dict_1)
-        aligned_count_2 = _cdp_no_split_aligned_count(aligned_count_2, query_seq_fwd, query_seq_rvs, seq_dict_2)
-        count_start += 1
-
-    return aligned_count_1, aligned_count_2
-
-
-def _get_query_seqs(count_start, ref, ref_complement, srna_length):
+def _worker_ref(ref):
     """
-    Get to correct length fwd and rvs query seq from the ref
-    :param count_start:
-    :param ref:
-    :param ref_complement:
-    :param srna_length:
-    :return:
+    Reference sequence for a chunk entry
+    :param ref: ordinal in the worker's indexed reference (int) or sequence (DNA)
+    :return: reference sequence (DNA)
     """
-    query_seq_fwd = DNA(ref[count_start:(count_start + srna_length)])
-    query_seq_rvs = DNA(ref_complement[count_start:(count_start + srna_length)])
-    return query_seq_fwd, query_seq_rvs
+    return ref if _worker_refs is None else _worker_refs.sequence(ref)
 
 
-def _cdp_no_split_aligned_count(aligned_count_1, query_seq_fwd, query_seq_rvs, seq_dict_1):
+def _cdp_no_split_worker(ref_chunk):
     """
-    
-    :param aligned_count_1:
-    :param query_seq_fwd:
-    :param query_seq_rvs:
-    :param seq_dict_1:
-    :return:
+    Worker process - aligns reads from all read sets to each refseq in the chunk, with a single scan of
+    each refseq.  Counts are accumulated locally and returned once for the chunk.
+    :param ref_chunk: (first ordinal (int), [ref,...]) - see _worker_ref
+    :return: first ordinal (int),
+             aligned counts - row for each reference in the chunk, column for each read set
+             (numpy.array(float, ndim=2))
     """
-    if query_seq_fwd in seq_dict_1:
-        aligned_count_1 += seq_dict_1[query_seq_fwd]
-    if query_seq_rvs in seq_dict_1:
-        aligned_count_1 += seq_dict_1[query_seq_rvs]
-    return aligned_count_1
+    first_ordinal, ref_seqs = ref_chunk
+    chunk_counts = numpy.zeros((len(ref_seqs), len(_worker_reads)))
+    for i, ref in enumerate(ref_seqs):
+        chunk_counts[i] = _worker_reads.ref_counts(RefKmers(_worker_ref(ref), _worker_nt))
+    return first_ordinal, chunk_counts
 
 
 def cdp_split_alignment(seq_1, seq_2, seq_name_1, seq_name_2, ref_file,
-                        nt, file_fig, file_name, onscreen, no_csv, pub, cores, bok):
+                        nt, file_fig, file_name, onscreen, no_csv, pub, cores, bok, chunk_size=500, hit_matrix=None,
+                        compress=False, npz=False, dpi=None, rasterize=False, refs=None):
     """
     Special function to split read count according to number of times aligned
     """
 
-    workers = cores
-    work_queue = JoinableQueue()
-    processes = []
-    mgr = Manager()
-    count = 0
-
-    refs = RefSeq()
-    refs.load_ref_file(ref_file)
-
-    alignment_dict_1 = mgr.dict()  # header:aligned_sRNAs
-    alignment_dict_2 = mgr.dict()
-
     print(colored("------------------ALIGNING READS------------------\n", 'green'))
-    for header, seq in refs:
-        work_queue.put((header, seq,))
-        count += 1
-        if count % 10000 == 0:
-            _cdp_split_queue(alignment_dict_1, alignment_dict_2, nt, processes, seq_1, seq_2, work_queue,
-                             workers)
-    _cdp_split_queue(alignment_dict_1, alignment_dict_2, nt, processes, seq_1, seq_2, work_queue,
-                     workers)
-
-    alignment_dict_1 = alignment_dict_1.copy()
-    alignment_dict_2 = alignment_dict_2.copy()
-
-    times_align_1 = _cdp_split_times_read_aligns(alignment_dict_1)
-    times_align_2 = _cdp_split_times_read_aligns(alignment_dict_2)
-
-    header_split_count_1 = _cdp_split_reads_for_header(alignment_dict_1,
-                                                       times_align_1,
-                                                       seq_1)
-    header_split_count_2 = _cdp_split_reads_for_header(alignment_dict_2,
-                                                       times_align_2,
-                                                       seq_2)
-
-    counts_by_ref = _cdp_split_header_x_y_counts(header_split_count_1,
-                                                 header_split_count_2,
-                                                 refs)
+    headers = []
+    refs, indexed_refs = ref_records(ref_file, refs)
+    if hit_matrix is None:
+        ref_counts = _cdp_split_counts(refs, headers, [seq_1, seq_2], nt, cores, chunk_size, indexed_refs)
+    else:
+        ref_counts = _cdp_save_hit_matrix(refs, headers, [seq_1, seq_2], [seq_name_1, seq_name_2], nt, cores,
+                                          chunk_size, indexed_refs, hit_matrix).ref_counts(split=True)
+    counts_by_ref = {}  # header:(split count1, split count2) - references with alignments only
+    for ordinal in numpy.flatnonzero(ref_counts.any(axis=1)):
+        counts_by_ref[headers[ordinal]] = tuple(ref_counts[ordinal].tolist())
     if len(counts_by_ref) == 0:
         print("\nNo reads aligned to any reference sequence. \
         Output files not generated\n")
     else:
         _cdp_output(counts_by_ref, file_fig, file_name, onscreen, no_csv, seq_name_1,
-                    seq_name_2, ref_file, nt, pub, bok)
+                    seq_name_2, ref_file, nt, pub, bok, compress, npz, dpi, rasterize)
 
 
-def _cdp_split_queue(alignment_dict_1, alignment_dict_2, nt, processes, seq_1, seq_2, work_queue, workers):
-    """
-
-    :param alignment_dict_1:
-    :param alignment_dict_2:
-    :param nt:
-    :param processes:
-    :param seq_1:
-    :param seq_2:
-    :param work_queue:
-    :param workers:
-    :return:
+def _cdp_split_counts(refs, headers, read_sets, nt, cores, chunk_size, indexed_refs=None):
     """
-    for w in range(workers):
-        p = Process(target=_cdp_split_worker,
-                    args=(work_queue,
-                          alignment_dict_1,
-                          alignment_dict_2,
-                          seq_1,
-                          seq_2,
-                          nt))
-        p.start()
-        processes.append(p)
-    for p in processes:
-        p.join()
-
-
-def _cdp_split_worker(work_queue, alignment_dict_1, alignment_dict_2, seq_1,
-                      seq_2, nt):
-    # calc aligned sRNAs for each header, duplicate if necessary
-
-    try:
-        while not work_queue.empty():
-            single_ref = work_queue.get()
-            aligned_reads = _cdp_split_dict_align_reads(seq_1, seq_2, single_ref[1], nt)
-
-            if len(aligned_reads[0]) != 0:
-                alignment_dict_1[single_ref[0]] = aligned_reads[0]
-            if len(aligned_reads[1]) != 0:
-                alignment_dict_2[single_ref[0]] = aligned_reads[1]
-    except Exception as e:
-        print(e)
-    return True
-
-
-def _cdp_split_dict_align_reads(seq_dict_1, seq_dict_2, ref, nt):
-    """
-    Returns a dictionary with the number of times a read aligns to single
-    reference sequence
-    Out --> {read:times_aligned}
-    
-    """
-    count_start = 0
-    ref_complement = ref.complement()
-    split_alignment_dict_1 = {}  # aligned sRNAs
-    split_alignment_dict_2 = {}  # aligned sRNAs
-
-    while count_start < (len(ref) - (nt - 1)):
-        query_seq_fwd, query_seq_rvs = _get_query_seqs(count_start, ref, ref_complement, nt)
-        _cdp_split_single_align_reads(query_seq_fwd, query_seq_rvs, split_alignment_dict_1, seq_dict_1)
-        _cdp_split_single_align_reads(query_seq_fwd, query_seq_rvs, split_alignment_dict_2, seq_dict_2)
-        count_start += 1
-    return split_alignment_dict_1, split_alignment_dict_2
-
-
-def _cdp_split_single_align_reads(query_seq_fwd, query_seq_rvs, split_alignment_dict, seq_dict):
-    """
-
-    :param query_seq_fwd:
-    :param query_seq_rvs:
-    :param split_alignment_dict:
-    :return:
+    Count reads from each read set aligned to each reference sequence, with each read count split by the
+    number of times the read aligns to all reference sequences.  The first pass records the times each read
+    aligns to each reference as (reference ordinal, read, times) arrays; the second splits counts for all
+    references at once - see MultiSRNASeq.split_counts.
+    :param refs: reference sequences - iterable of (header, ref), see ref_records
+    :param headers: list that reference headers are appended to, in reference order (list)
+    :param read_sets: [seq_1 (SRNASeq),...] (list)
+    :param nt: read length to align (int)
+    :param cores: number of processes to spawn (int)
+    :param chunk_size: no. of reference sequences sent to a worker process at a time (int)
+    :param indexed_refs: indexed reference that ordinals in refs refer to (IndexedRefSeq)
+    :return: split counts - row for each reference ordinal, column for each read set
+             (numpy.array(float, ndim=2))
     """
-    if query_seq_fwd in seq_dict and query_seq_fwd in split_alignment_dict:
-        split_alignment_dict[query_seq_fwd] += 1
-    elif query_seq_fwd in seq_dict and query_seq_fwd \
-            not in split_alignment_dict:
-        split_alignment_dict[query_seq_fwd] = 1
-    if query_seq_rvs in seq_dict and query_seq_rvs in split_alignment_dict:
-        split_alignment_dict[query_seq_rvs] += 1
-    elif query_seq_rvs in seq_dict and query_seq_rvs \
-            not in split_alignment_dict:
-        split_alignment_dict[query_seq_rvs] = 1
+    merged_reads = MultiSRNASeq(read_sets, [nt])
+    ref_ordinals, reads, fwd_times, rvs_times = _cdp_alignments(refs, headers, merged_reads, nt, cores, chunk_size,
+                                                                indexed_refs)
+    return merged_reads.split_counts(nt, ref_ordinals, reads, fwd_times + rvs_times, len(headers))
 
 
-def _cdp_split_times_read_aligns(split_alignment_dict):
+def _cdp_save_hit_matrix(refs, headers, read_sets, sample_names, nt, cores, chunk_size, indexed_refs, file_name):
     """
-    Dict. of times a read aligns to all references
-    {read: times aligned} 
+    Align reads from each read set to each reference sequence, and save the alignment as a HitMatrix
+    :param refs: reference sequences - iterable of (header, ref), see ref_records
+    :param headers: list that reference headers are appended to, in reference order (list)
+    :param read_sets: [seq_1 (SRNASeq),...] (list)
+    :param sample_names: name for each read set (list(str))
+    :param nt: read length to align (int)
+    :param cores: number of processes to spawn (int)
+    :param chunk_size: no. of reference sequences sent to a worker process at a time (int)
+    :param indexed_refs: indexed reference that ordinals in refs refer to (IndexedRefSeq)
+    :param file_name: path/to/hit/matrix.npz (str)
+    :return: HitMatrix
+    """
+    merged_reads = MultiSRNASeq(read_sets, [nt])
+    ref_ordinals, reads, fwd_times, rvs_times = _cdp_alignments(refs, headers, merged_reads, nt, cores, chunk_size,
+                                                                indexed_refs)
+    read_idx, read_seqs, read_counts = merged_reads.aligned_read_table(nt, reads)
+    matrix = HitMatrix.from_alignments(headers, sample_names, ref_ordinals, read_idx, fwd_times, rvs_times,
+                                       read_seqs, read_counts)
+    matrix.save(file_name)
+    print("\nReference x read hit matrix ({0} x {1}) saved to {2}\n".format(matrix.shape[0], matrix.shape[1],
+                                                                           file_name))
+    return matrix
+
+
+def _cdp_alignments(refs, headers, merged_reads, nt, cores, chunk_size, indexed_refs=None):
+    """
+    Times each read aligns to each strand of each reference sequence
+    :param refs: reference sequences - iterable of (header, ref), see ref_records
+    :param headers: list that reference headers are appended to, in reference order (list)
+    :param merged_reads: read sets (MultiSRNASeq)
+    :param nt: read length to align (int)
+    :param cores: number of processes to spawn (int)
+    :param chunk_size: no. of reference sequences sent to a worker process at a time (int)
+    :param indexed_refs: indexed reference that ordinals in refs refer to (IndexedRefSeq)
+    :return: reference ordinal for each alignment (numpy.array(int)),
+             aligned read for each alignment - see MultiSRNASeq.ref_read_times (numpy.array),
+             times aligned to the fwd strand (numpy.array(int)), times aligned to the rvs strand (numpy.array(int))
     """
-
-    srna_align_counts = {}
-    for aligned_sRNAs in split_alignment_dict.values():
-        for aligned_sRNA, count in aligned_sRNAs.items():
-            if aligned_sRNA in srna_align_counts:
-                srna_align_counts[aligned_sRNA] += count
-            else:
-                srna_align_counts[aligned_sRNA] = count
-    return srna_align_counts
+    alignments = _empty_alignments()
+    for first_ordinal, chunk_alignments in _cdp_pool_map(_cdp_split_worker, refs, headers, merged_reads, nt,
+                                                         cores, chunk_size, indexed_refs):
+        chunk_alignments[0] += first_ordinal
+        for alignment_parts, chunk_part in zip(alignments, chunk_alignments):
+            alignment_parts.append(chunk_part)
+    return tuple(numpy.concatenate(alignment_parts) for alignment_parts in alignments)
 
 
-def _cdp_split_reads_for_header(split_align_dict, split_align_count_dict, seq_dict):
+def _cdp_split_worker(ref_chunk):
     """
-    Dict -->Even split read aligned counts, so total reads aligned = read count
-    in original seq file
-    {header:split_count}
+    Worker process - times each read from all read sets aligns to each refseq in the chunk, with a single
+    scan of each refseq
+    :param ref_chunk: (first ordinal (int), [ref,...]) - see _worker_ref
+    :return: first ordinal (int), [ordinal in the chunk for each alignment (numpy.array(int)),
+             aligned reads - see MultiSRNASeq.ref_read_times, times each read aligns to the fwd strand
+             (numpy.array(int)), times each read aligns to the rvs strand (numpy.array(int))]
     """
+    first_ordinal, ref_seqs = ref_chunk
+    alignments = _empty_alignments()
+    for i, ref in enumerate(ref_seqs):
+        reads, fwd_times, rvs_times = _worker_reads.ref_read_times(RefKmers(_worker_ref(ref), _worker_nt))
+        for alignment_parts, part in zip(alignments, [numpy.full(len(reads), i, dtype=numpy.int64), reads,
+                                                      fwd_times, rvs_times]):
+            alignment_parts.append(part)
+    return first_ordinal, [numpy.concatenate(alignment_parts) for alignment_parts in alignments]
 
-    header_split_count = {}
-    for header, sRNA_dict in split_align_dict.items():
-        header_split_count[header] = 0
-        for sRNA in sRNA_dict:
-            header_split_count[header] \
-                += ((seq_dict[sRNA] / split_align_count_dict[sRNA]) * split_align_dict[header][sRNA])
-    return header_split_count
 
-
-def _cdp_split_header_x_y_counts(header_split_count_1, header_split_count_2, refs):
+def _empty_alignments():
     """
-    For each header in reference that has > 0 alignments in 1 file
-    
-    dict --> {header: (split counts 1:split counts 2)}
+    Lists of arrays for collecting (reference ordinal, read, fwd times, rvs times) alignments - each starts with
+    an empty array so they can always be concatenated
+    :return: [[numpy.array(int)],...] - a list for each (list)
     """
-    # construct x,y counts for each header
-    counts_by_ref = {}
-    for header in refs.headers():
-        if header in header_split_count_1 and header in header_split_count_2:
-            counts_by_ref[header] = (header_split_count_1[header],
-                                     header_split_count_2[header])
-        elif header in header_split_count_1 and header \
-                not in header_split_count_2:
-            counts_by_ref[header] = (header_split_count_1[header], 0)
-        elif header not in header_split_count_1 and header in \
-                header_split_count_2:
-            counts_by_ref[header] = (0, header_split_count_2[header])
-    return counts_by_ref
+    return [[numpy.zeros(0, dtype=numpy.int64)] for _ in range(4)]
 
 
 def _cdp_output(counts_by_ref, file_fig, file_name, onscreen, no_csv, seq_name_1,
-                seq_name_2, ref_file, nt, pub, bok):
+                seq_name_2, ref_file, nt, pub, bok, compress=False, npz=False, dpi=None, rasterize=False):
     """
     Organise csv or pdf output for CDP analysis
     """
@@ -385,7 +398,9 @@ def _cdp_output(counts_by_ref, file_fig, file_name, onscreen, no_csv, seq_name_1
                     file_fig,
                     file_name,
                     pub,
-                    bok)
+                    bok,
+                    dpi,
+                    rasterize)
 
     if no_csv:
         out_csv_name = ah.cdp_file_output(seq_name_1,
@@ -397,249 +412,67 @@ def _cdp_output(counts_by_ref, file_fig, file_name, onscreen, no_csv, seq_name_1
         wtf.cdp_output(counts_by_ref,
                        seq_name_1,
                        seq_name_2,
-                       out_csv_name)
+                       out_csv_name,
+                       compress)
+    if npz:
+        out_npz_name = ah.cdp_file_output(seq_name_1,
+                                          seq_name_2,
+                                          ref_name,
+                                          nt,
+                                          "npz")
+        wtf.cdp_npz_output(list(counts_by_ref), list(counts_by_ref.values()), [seq_name_1, seq_name_2],
+                           out_npz_name, compress)
 
 
 def cdp_no_split_single(loaded_seq_list, loaded_seq_name_list,
                         ref_file,
-                        nt, cores):
+                        nt, cores, chunk_size=500, hit_matrix=None, compress=False, npz=False, refs=None):
     """
     Aligns a single SRNA_seq object to multiple refseq seqs in a Ref object
     at a time.  No splitting of read counts.
     """
 
-    refs = RefSeq()
-    refs.load_ref_file(ref_file)
     print(colored("------------------ALIGNING READS------------------\n", 'green'))
 
-    workers = cores
-    work_queue = JoinableQueue()
-    processes = []
-    mgr = Manager()
-    count = 0
-    counts_by_ref = mgr.dict()  # {header:[count1, count2,.......]}
-    for header, seq in refs:
-        work_queue.put((header, seq,))
-        count += 1
-        if count % 10000 == 0:
-            _cdp_no_split_single_queue(counts_by_ref, loaded_seq_list, nt, processes, work_queue, workers)
-    _cdp_no_split_single_queue(counts_by_ref, loaded_seq_list, nt, processes, work_queue, workers)
-
-    _cdp_single_output(counts_by_ref.copy(), loaded_seq_name_list, ref_file, nt)
-
-
-def _cdp_no_split_single_queue(counts_by_ref, loaded_seq_list, nt, processes, work_queue, workers):
-    """
-
-    :param counts_by_ref:
-    :param loaded_seq_list:
-    :param nt:
-    :param processes:
-    :param work_queue:
-    :param workers:
-    :return:
-    """
-    for w in range(workers):
-        p = Process(target=_cdp_no_split_single_worker, args=(work_queue,
-                                                              counts_by_ref,
-                                                              loaded_seq_list,
-                                                              nt))
-        p.start()
-        processes.append(p)
-    for p in processes:
-        p.join()
-
-
-def _cdp_no_split_single_worker(work_queue, counts_by_ref, loaded_seq_list, nt):
-    """
-    Worker process - get refseq from work queue, aligns reads from all seqs in seq
-    list and adds as list of counts to the refseq header in the dict
-    """
-    try:
-        while not work_queue.empty():
-            ref = work_queue.get()
-            for single_seq in loaded_seq_list:
-                aligned_count = _cdp_no_split_count_aligned_reads_to_seq_single(single_seq, ref[1], nt)
-                _cdp_worker_helper(aligned_count, counts_by_ref, ref)
-
-    except Exception as e:
-        print(e)
-    return True
-
-
-def _cdp_no_split_count_aligned_reads_to_seq_single(single_seq, ref, nt):
-    """
-
-    :param single_seq:
-    :param ref:
-    :param nt:
-    :return:
-    """
-
-    aligned_count = 0  # number of reads aligned
-    count_start = 0
-
-    ref_complement = ref.complement()
-
-    while count_start < (len(ref) - (nt - 1)):
-        query_seq_fwd, query_seq_rvs = _get_query_seqs(count_start, ref, ref_complement, nt)
-
-        aligned_count = _cdp_no_split_aligned_count(aligned_count, query_seq_fwd, query_seq_rvs, single_seq)
-
-        count_start += 1
-
-    return aligned_count
+    headers = []
+    refs, indexed_refs = ref_records(ref_file, refs)
+    if hit_matrix is None:
+        ref_counts = _cdp_no_split_counts(refs, headers, loaded_seq_list, nt, cores, chunk_size, indexed_refs)
+    else:
+        ref_counts = _cdp_save_hit_matrix(refs, headers, loaded_seq_list, loaded_seq_name_list, nt, cores,
+                                          chunk_size, indexed_refs, hit_matrix).ref_counts()
+    _cdp_single_output(headers, ref_counts, loaded_seq_name_list, ref_file, nt, compress, npz)
 
 
 def cdp_split_single(loaded_seq_list, loaded_seq_name_list,
                      ref_file,
-                     nt, cores):
+                     nt, cores, chunk_size=500, hit_matrix=None, compress=False, npz=False, refs=None):
     """
     Aligns a single SRNA_seq object to multiple refseq seqs in a Ref object
     at a time.  Splitting of read counts.
     """
 
-    refs = RefSeq()
-    refs.load_ref_file(ref_file)
     print(colored("------------------ALIGNING READS------------------\n", 'green'))
 
-    workers = cores
-    work_queue = JoinableQueue()
-    processes = []
-    mgr = Manager()
-    count = 0
-    counts_by_ref = mgr.dict()  # {header:[dict, dict2,.......]}
-    for header, seq in refs:
-        work_queue.put((header, seq,))
-        count += 1
-        if count % 10000 == 0:
-            _cdp_split_single_queue(counts_by_ref, loaded_seq_list, nt, processes, work_queue, workers)
-    _cdp_split_single_queue(counts_by_ref, loaded_seq_list, nt, processes, work_queue, workers)
-    counts_by_ref = counts_by_ref.copy()
-
-    # compile results
-    # [{},{},{}]
-    list_of_align_dicts = [{}]
-    for i in range(len(loaded_seq_list) - 1):
-        list_of_align_dicts.append({})
-
-    # Split the dicts up --> THIS COULD BE DONE BETTER
-
-    for header, list_of_dicts in counts_by_ref.items():
-        for i in range(len(list_of_align_dicts)):
-            list_of_align_dicts[i][header] = list_of_dicts[i]
-
-    # Process separately then compile
-    list_of_processed_dicts = []
-    count = 0
-    for align_dict in list_of_align_dicts:
-        times_align = _cdp_split_times_read_aligns(align_dict)
-        header_split_count = _cdp_split_reads_for_header(align_dict,
-                                                         times_align,
-                                                         loaded_seq_list[count])
-        list_of_processed_dicts.append(header_split_count)
-        count += 1
-    final_dict = {}  # output to csv writer
-    for header in list_of_processed_dicts[0]:
-        first_dict = True
-        for processed_dict in list_of_processed_dicts:
-            if first_dict:
-                final_dict[header] = [processed_dict[header]]
-                first_dict = False
-            else:
-                final_dict[header].append(processed_dict[header])
-    # remove 0 entries
-    final_dict = {k: v for k, v in final_dict.items() if v != [0] * len(loaded_seq_list)}
-
-    _cdp_single_output(final_dict, loaded_seq_name_list, ref_file, nt)
-
-
-def _cdp_split_single_queue(counts_by_ref, loaded_seq_list, nt, processes, work_queue, workers):
-    """
-
-    :param counts_by_ref:
-    :param loaded_seq_list:
-    :param nt:
-    :param processes:
-    :param work_queue:
-    :param workers:
-    :return:
-    """
-    for w in range(workers):
-        p = Process(target=_cdp_split_single_worker, args=(work_queue,
-                                                           counts_by_ref,
-                                                           loaded_seq_list,
-                                                           nt))
-        p.start()
-        processes.append(p)
-    for p in processes:
-        p.join()
-
-
-def _cdp_split_single_worker(work_queue, counts_by_ref, loaded_seq_list, nt):
-    """
-    Worker process - get refseq from work queue, aligns reads from all seqs in seq
-    list and adds as list of counts to the refseq header in the dict
-    """
-    try:
-        while not work_queue.empty():
-            ref = work_queue.get()
-            for single_seq in loaded_seq_list:
-                aligned_dict = _cdp_split_dict_align_reads_single(single_seq, ref[1], nt)
-                _cdp_worker_helper(aligned_dict, counts_by_ref, ref)
-
-    except Exception as e:
-        print(e)
-    return True
-
-
-def _cdp_split_dict_align_reads_single(seq_dict, ref, nt):
-    """
-
-    :param seq_dict:
-    :param ref:
-    :param nt:
-    :return:
-    """
-    count_start = 0
-    ref_complement = ref.complement()
-    split_alignment_dict = {}  # aligned sRNAs
-
-    while count_start < (len(ref) - (nt - 1)):
-        query_seq_fwd, query_seq_rvs = _get_query_seqs(count_start, ref, ref_complement, nt)
-        _cdp_split_single_align_reads(query_seq_fwd, query_seq_rvs, split_alignment_dict, seq_dict)
-        count_start += 1
-    return split_alignment_dict
-
-
-def _cdp_worker_helper(aligned_dict, counts_by_ref, ref):
-    if ref[0] not in counts_by_ref:
-        counts_by_ref[ref[0]] = [aligned_dict]
+    headers = []
+    refs, indexed_refs = ref_records(ref_file, refs)
+    if hit_matrix is None:
+        ref_counts = _cdp_split_counts(refs, headers, loaded_seq_list, nt, cores, chunk_size, indexed_refs)
     else:
-        new_count_list = counts_by_ref.get(ref[0]) + [aligned_dict]
-        counts_by_ref[ref[0]] = new_count_list
+        ref_counts = _cdp_save_hit_matrix(refs, headers, loaded_seq_list, loaded_seq_name_list, nt, cores,
+                                          chunk_size, indexed_refs, hit_matrix).ref_counts(split=True)
+    aligned = numpy.flatnonzero(ref_counts.any(axis=1))  # references with alignments only
+    _cdp_single_output([headers[ordinal] for ordinal in aligned], ref_counts[aligned], loaded_seq_name_list,
+                       ref_file, nt, compress, npz)
 
 
-def _cdp_split_single_times_read_aligns(split_alignment_dict, pos):
+def _cdp_single_output(headers, ref_counts, loaded_seq_name_list, ref_file, nt, compress=False, npz=False):
     """
-    Dict. of times a read aligns to all references
-    {read: times aligned} 
+    Takes reference headers and counts as an imput - a row of ref_counts [count1,count2,...] for each header.
+    CSV rows are written as they are generated.
     """
-
-    srna_align_counts = {}
-    for aligned_sRNAs in list(split_alignment_dict.values())[pos]:
-        for aligned_sRNA, count in aligned_sRNAs.items():
-            if aligned_sRNA in srna_align_counts:
-                srna_align_counts[aligned_sRNA][pos] += count
-            else:
-                srna_align_counts[aligned_sRNA][pos] = count
-    return srna_align_counts
-
-
-def _cdp_single_output(counts_by_ref, loaded_seq_name_list, ref_file, nt):
-    """
-    Takes counts by refseq dict as an imput {header:[count1,count2,...]}
-    """
-    out_file = "{0}_multiple_file_alignment_{1}.csv".format(ref_file.split("/")[-1], nt)
-
-    wtf.single_cdp_file_output(counts_by_ref, loaded_seq_name_list, out_file)
+    out_file = "{0}_multiple_file_alignment_{1}".format(ref_file.split("/")[-1], nt)
+    counts_by_ref = ((header, counts.tolist()) for header, counts in zip(headers, ref_counts))
+    wtf.single_cdp_file_output(counts_by_ref, loaded_seq_name_list, out_file + ".csv", compress)
+    if npz:
+        wtf.cdp_npz_output(headers, ref_counts, loaded_seq_name_list, out_file + ".npz", compress)
@@ -1,23 +1,29 @@
-from refseq import RefSeq
+from scram_modules.refseq import RefSeq, IndexedRefSeq
 from termcolor import colored
-from alignedreads import AlignedReads
-import analysis_helper as ah
+from scram_modules.alignedreads import AlignedReads, MultiAlignedReads
+from multiprocessing import Pool
+from scram_modules import analysis_helper as ah
 import numpy
-import write_to_file as wtf
-import post_process as pp
-import plot_reads as pr
-from multiprocessing import Process, JoinableQueue, Manager
-import sys
+from scram_modules import write_to_file as wtf
+from scram_modules import post_process as pp
+from scram_modules import plot_reads as pr
+from scram_modules.hitmatrix import HitMatrix
+from scram_modules import kmer
 
 """
 Module for generating sRNA alignment profiles
 """
 
+_worker_seq = None  # reads for this worker process - set once by _profile_init_worker
+_worker_refs = None  # reference sequences for this worker process
+_worker_settings = None  # profile settings for this worker process - see _ref_profile
+
 
 def srna_profile(seq, seq_output, ref_file, nt, smooth_win_size, file_fig,
-                 file_name, onscreen, no_csv, ylim, pub, split, bok):
+                 file_name, onscreen, no_csv, ylim, pub, split, bok, coverage=False, cores=1, multipage=False,
+                 hit_matrix=None, compress=False, npz=False, bedgraph=False, dpi=None, rasterize=False, refs=None):
     """
-    Align reads of one length to a single reference sequence
+    Align reads of one length to each reference sequence in a file
     :param seq: path/to/read file (str)
     :param seq_output: treatment name (str)
     :param ref_file: list of refseq file paths (list(str))
@@ -30,37 +36,33 @@ def srna_profile(seq, seq_output, ref_file, nt, smooth_win_size, file_fig,
     :param ylim: +/- y-limits for plot (int)
     :param pub: generate publication image (bool)
     :param split: split aligned read counts by number of times a read aligns (bool)
+    :param coverage: plot per-nucleotide coverage rather than counts at read centres (bool)
+    :param cores: number of processes to spawn (int)
+    :param multipage: output plots for multiple reference sequences to a single PDF (bool)
+    :param hit_matrix: path/to/hit/matrix.npz - save the alignment as a reference x read HitMatrix (str)
+    :param compress: gzip CSV and bedGraph files, and compress .npz files (bool)
+    :param npz: save alignments and profiles for each reference as columnar .npz files (bool)
+    :param bedgraph: save run-length encoded profiles for each reference and strand as bedGraph files (bool)
+    :param dpi: resolution of PNG plots and rasterized profiles (int) - matplotlib default if None
+    :param rasterize: draw profiles as images in PDF plots (bool)
+    :param refs: reference sequences already loaded from ref_file - loaded if None (IndexedRefSeq or RefSeq)
     """
-
-    ref_output, single_ref = _load_ref_shared(ref_file)
-    single_alignment = AlignedReads()
-    single_alignment.align_reads_to_ref(seq, single_ref, nt)
-    if split is False:
-        single_alignment.split()
-    single_sorted_alignments = single_alignment.aln_by_ref_pos(nt)
-    if no_csv:
-        wtf.csv_output(single_alignment,
-                       nt,
-                       seq_output,
-                       ref_output)
-    if file_fig or onscreen:
-
-        graph_processed = pp.fill_in_zeros(single_sorted_alignments,
-                                           len(single_ref), nt)
-        x_ref = graph_processed[0]
-        y_fwd_smoothed, y_rvs_smoothed = _smoothed_for_plot(graph_processed, smooth_win_size)
-
-        if file_name == "auto":
-            file_name = ah.ref_seq_nt_output(seq_output, ref_output, nt, "pdf")
-
-        pr.den_plot(x_ref, y_fwd_smoothed, y_rvs_smoothed, nt, file_fig,
-                    file_name, onscreen, ref_output, ylim, pub, bok)
+    with pr.FigureRenderer(_plot_processes(file_fig, onscreen, bok, multipage, cores)) as renderer:
+        for ref_output, plot_file_name, profile in _ref_profiles(seq, seq_output, ref_file, [nt], smooth_win_size,
+                                                                 file_fig, file_name, onscreen, no_csv, split, coverage,
+                                                                 cores, multipage, hit_matrix, compress,
+                                                                 npz, bedgraph, refs):
+            x_ref, [(y_fwd_smoothed, y_rvs_smoothed)] = profile
+            renderer.render(pr.den_plot, x_ref, y_fwd_smoothed, y_rvs_smoothed, nt, file_fig,
+                            plot_file_name, onscreen, ref_output, ylim, pub, bok, dpi, rasterize)
 
 
 def srna_profile_21_22_24(seq, seq_output, ref_file, smooth_win_size,
-                          file_fig, file_name, onscreen, no_csv, y_lim, pub, split, bok):
+                          file_fig, file_name, onscreen, no_csv, y_lim, pub, split, bok, coverage=False, cores=1,
+                          multipage=False, hit_matrix=None, compress=False, npz=False,
+                          bedgraph=False, dpi=None, rasterize=False, refs=None):
     """
-    Align reads of 21,22 and 24 nt to a single reference seq.
+    Align reads of 21,22 and 24 nt to each reference sequence in a file
     :param seq: path/to/read file (str)
     :param seq_output: treatment name (str)
     :param ref_file: list of refseq file paths (list(str))
@@ -72,116 +74,359 @@ def srna_profile_21_22_24(seq, seq_output, ref_file, smooth_win_size,
     :param ylim: +/- y-limits for plot (int)
     :param pub: generate publication image (bool)
     :param split: split aligned read counts by number of times a read aligns (bool)
+    :param coverage: plot per-nucleotide coverage rather than counts at read centres (bool)
+    :param cores: number of processes to spawn (int)
+    :param multipage: output plots for multiple reference sequences to a single PDF (bool)
+    :param hit_matrix: path/to/hit/matrix.npz - save the alignment as a reference x read HitMatrix (str)
+    :param compress: gzip CSV and bedGraph files, and compress .npz files (bool)
+    :param npz: save alignments and profiles for each reference as columnar .npz files (bool)
+    :param bedgraph: save run-length encoded profiles for each reference and strand as bedGraph files (bool)
+    :param dpi: resolution of PNG plots and rasterized profiles (int) - matplotlib default if None
+    :param rasterize: draw profiles as images in PDF plots (bool)
+    :param refs: reference sequences already loaded from ref_file - loaded if None (IndexedRefSeq or RefSeq)
+    """
+    with pr.FigureRenderer(_plot_processes(file_fig, onscreen, bok, multipage, cores)) as renderer:
+        for ref_output, plot_file_name, profile in _ref_profiles(seq, seq_output, ref_file, [21, 22, 24],
+                                                                 smooth_win_size, file_fig, file_name, onscreen, no_csv,
+                                                                 split, coverage, cores, multipage, hit_matrix,
+                                                                 compress, npz, bedgraph, refs):
+            x_ref, [(y_fwd_smoothed_21, y_rvs_smoothed_21), (y_fwd_smoothed_22, y_rvs_smoothed_22),
+                    (y_fwd_smoothed_24, y_rvs_smoothed_24)] = profile
+            renderer.render(pr.den_multi_plot_21_22_24, x_ref, y_fwd_smoothed_21, y_rvs_smoothed_21,
+                            y_fwd_smoothed_22, y_rvs_smoothed_22, y_fwd_smoothed_24, y_rvs_smoothed_24, file_fig,
+                            plot_file_name, onscreen, ref_output, y_lim, pub, bok, dpi, rasterize)
+
+
+def _plot_processes(file_fig, onscreen, bok, multipage, cores):
+    """
+    Number of processes for rendering plots - plots are only rendered in parallel if each is saved to its own file
+    :param file_fig: output plot to file (bool)
+    :param onscreen: display plot (bool)
+    :param bok: use bokeh for plotting (bool)
+    :param multipage: plots for multiple reference sequences to a single PDF (bool)
+    :param cores: number of processes to spawn (int)
+    :return: number of processes (int)
     """
+    if file_fig and not (onscreen or bok or multipage):
+        return cores
+    return 1
 
-    ref_output, single_ref = _load_ref_shared(ref_file)
-    srna_lens = [21, 22, 24]
-    work_queue = JoinableQueue()
-    processes = []
-    mgr = Manager()
-    alignments_dict = mgr.dict()
-
-    non_srt_alignments_dict = mgr.dict()  # for csv only
-    for x in srna_lens:
-        work_queue.put(x)
-    for w in range(3):
-        p = Process(target=_worker_21_22_24, args=(work_queue, seq, single_ref, split,
-                                                   alignments_dict,
-                                                   non_srt_alignments_dict,
-                                                   no_csv))
-        p.start()
-        processes.append(p)
-
-    for p in processes:
-        p.join()
-
-    if file_fig or onscreen:
-
-        graph_processed_21 = pp.fill_in_zeros(alignments_dict[21],
-                                              len(single_ref), 21)
-        graph_processed_22 = pp.fill_in_zeros(alignments_dict[22],
-                                              len(single_ref), 22)
-        graph_processed_24 = pp.fill_in_zeros(alignments_dict[24],
-                                              len(single_ref), 24)
-
-        x_ref = graph_processed_21[0]
-        y_fwd_smoothed_21, y_rvs_smoothed_21 = _smoothed_for_plot(graph_processed_21, smooth_win_size)
-        y_fwd_smoothed_22, y_rvs_smoothed_22 = _smoothed_for_plot(graph_processed_22, smooth_win_size)
-        y_fwd_smoothed_24, y_rvs_smoothed_24 = _smoothed_for_plot(graph_processed_24, smooth_win_size)
 
+def _ref_profiles(seq, seq_output, ref_file, lengths, smooth_win_size, file_fig, file_name, onscreen, no_csv,
+                  split, coverage, cores, multipage, hit_matrix=None, compress=False, npz=False,
+                  bedgraph=False, refs=None):
+    """
+    Align reads to each reference sequence in a file and write CSVs.  Multiple reference sequences are aligned
+    by a pool of worker processes sharing the loaded reads, and output files are named for each reference.
+    :param seq: reads (PackedSRNASeq)
+    :param seq_output: treatment name (str)
+    :param ref_file: path/to/refseq (str)
+    :param lengths: read lengths to align (list(int))
+    :param smooth_win_size: window size for smoothed profile (int)
+    :param file_fig: output pdf (bool)
+    :param file_name: manual file name, or "auto" (str)
+    :param onscreen: display plot (bool)
+    :param no_csv: generate CSV (bool)
+    :param split: split aligned read counts by number of times a read aligns (bool)
+    :param coverage: plot per-nucleotide coverage rather than counts at read centres (bool)
+    :param cores: number of processes to spawn (int)
+    :param multipage: output plots for multiple reference sequences to a single PDF (bool)
+    :param hit_matrix: path/to/hit/matrix.npz - save the alignment as a HitMatrix (str)
+    :param compress: gzip CSV and bedGraph files, and compress .npz files (bool)
+    :param npz: save alignments and profiles for each reference as columnar .npz files (bool)
+    :param bedgraph: save run-length encoded profiles for each reference and strand as bedGraph files (bool)
+    :param refs: reference sequences already loaded from ref_file - loaded if None (IndexedRefSeq or RefSeq)
+    :return: generator of (reference name (str), plot file name (str or PdfPages),
+             (x_ref, [(y_fwd_smoothed, y_rvs_smoothed),...] - one for each length)) in reference order -
+             only if plots are needed
+    """
+    if refs is None:
+        refs = load_refs(ref_file)
+    headers = list(refs.headers())
+    if len(headers) == 1:
+        ref_outputs = [ah.single_file_output(ref_file)]
+    else:
+        ref_outputs = ref_output_names(headers)
+    settings = {'seq_output': seq_output, 'lengths': lengths, 'split': split, 'no_csv': no_csv,
+                'compress': compress, 'npz': npz, 'bedgraph': bedgraph, 'plot': file_fig or onscreen,
+                'smooth_win_size': smooth_win_size, 'coverage': coverage,
+                'cores': cores if len(headers) == 1 else 1,  # a single reference is split between processes
+                'hits': hit_matrix is not None}
+    print(colored("------------------ALIGNING READS------------------\n", 'green'))
+    pdf_pages = None
+    if file_fig and multipage and len(headers) > 1:
+        from matplotlib.backends.backend_pdf import PdfPages
         if file_name == "auto":
-            file_name = ah.ref_seq_output(seq_output, ref_output, "pdf")
-
-        pr.den_multi_plot_21_22_24(x_ref, y_fwd_smoothed_21, y_rvs_smoothed_21, y_fwd_smoothed_22, y_rvs_smoothed_22,
-                                   y_fwd_smoothed_24, y_rvs_smoothed_24, file_fig, file_name, onscreen, ref_output,
-                                   y_lim, pub, bok)
-    if no_csv:
-        wtf.mnt_csv_output(non_srt_alignments_dict[21],
-                           non_srt_alignments_dict[22],
-                           non_srt_alignments_dict[24],
-                           seq_output,
-                           ref_output)
-
-
-def _worker_21_22_24(work_queue, seq, single_ref, split, alignments_dict,
-                     non_srt_alignments_dict,
-                     no_csv):
-    """
-    Worker function for parallel processing - 21,22 and 24 alignments as separate processes
-    :param work_queue:
-    :param seq:
-    :param single_ref:
-    :param split:
-    :param alignments_dict:
-    :param non_srt_alignments_dict:
-    :param no_csv:
-    :return: True (required)
+            file_name = _plot_file_name(seq_output, ah.single_file_output(ref_file), lengths)
+        pdf_pages = PdfPages(file_name)
+    try:
+        ref_hits = []
+        for ref_output, (profile, hits) in zip(ref_outputs, _map_ref_profiles(seq, refs, headers, ref_outputs,
+                                                                              settings, cores)):
+            ref_hits.append(hits)
+            if profile is None:
+                continue
+            if pdf_pages is not None:
+                plot_file_name = pdf_pages
+            elif file_name == "auto":
+                plot_file_name = _plot_file_name(seq_output, ref_output, lengths)
+            elif len(headers) > 1:
+                plot_file_name = ah.ref_file_name(file_name, ref_output)
+            else:
+                plot_file_name = file_name
+            yield ref_output, plot_file_name, profile
+        if hit_matrix is not None:
+            _save_hit_matrix(headers, seq_output, ref_hits, hit_matrix)
+    finally:
+        if pdf_pages is not None:
+            pdf_pages.close()
+
+
+def _map_ref_profiles(seq, refs, headers, ref_outputs, settings, cores):
+    """
+    Profile for each reference sequence - in this process for a single reference sequence, else with a pool
+    of worker processes
+    :param seq: reads (PackedSRNASeq)
+    :param refs: reference sequences (IndexedRefSeq or RefSeq)
+    :param headers: reference headers in file order (list(str))
+    :param ref_outputs: reference names for output files, in file order (list(str))
+    :param settings: profile settings - see _ref_profile (dict)
+    :param cores: number of processes to spawn (int)
+    :return: generator of profiles - see _ref_profile - in reference order
     """
+    if len(headers) == 1 or cores <= 1:
+        for header, ref_output in zip(headers, ref_outputs):
+            yield _ref_profile(seq, refs[header], ref_output, settings, ah.ref_track_name(header))
+        return
+    if isinstance(refs, IndexedRefSeq):
+        ref_items = [(ordinal, ref_output, ah.ref_track_name(header))
+                     for ordinal, (header, ref_output) in enumerate(zip(headers, ref_outputs))]
+        worker_refs = refs  # workers read their own sequences from the memory-mapped reference file
+    else:
+        ref_items = [(refs[header], ref_output, ah.ref_track_name(header))
+                     for header, ref_output in zip(headers, ref_outputs)]
+        worker_refs = None
+    shared_seq = _shared_reads(seq, settings['lengths'])
+    pool = Pool(cores, initializer=_profile_init_worker, initargs=(shared_seq, worker_refs, settings))
     try:
-        while not work_queue.empty():
-            single_alignment = AlignedReads()
-            srna_len = work_queue.get()
-            single_alignment.align_reads_to_ref(seq, single_ref, srna_len)
-
-            if split is False:
-                single_alignment.split()
-            if no_csv:
-                non_srt_alignments_dict[srna_len] = single_alignment
-            single_sorted_alignments = single_alignment.aln_by_ref_pos(srna_len)
-            alignments_dict[srna_len] = single_sorted_alignments
-    except Exception as e:
-        print(e)
-    return True
-
-
-def _smoothed_for_plot(graph_processed, smooth_win_size):
-    """
-    Return fwd and rvs smoothed profiles
-    :param graph_processed:
-    :param smooth_win_size:
-    :return:
-    """
-    y_fwd_smoothed = pp.smooth(numpy.array(graph_processed[1]),
-                               smooth_win_size, window='blackman')
-    y_rvs_smoothed = pp.smooth(numpy.array(graph_processed[2]),
-                               smooth_win_size, window='blackman')
-    return y_fwd_smoothed, y_rvs_smoothed
-
-
-def _load_ref_shared(ref_file):
-    """
-    Shared function for loading reference file
-    :param ref_file:
-    :return:
-    """
-    ref = RefSeq()
-    ref.load_ref_file(ref_file)
-    single_ref = ""
-    if len(ref) > 1:
-        print("\nMultiple reference sequences in file. Exiting.\n")
-        sys.exit()
-    ref_output = ah.single_file_output(ref_file)
-    for header in ref.headers():
-        single_ref = ref[header]
-    print(colored("------------------ALIGNING READS------------------\n", 'green'))
-    return ref_output, single_ref
+        for profile in pool.imap(_profile_worker, ref_items):
+            yield profile
+    finally:
+        pool.close()
+        pool.join()
+        if shared_seq is not seq:
+            shared_seq.release()
+
+
+def _shared_reads(seq, lengths):
+    """
+    Read-only copy of the reads for worker processes - in shared memory where all lengths can be packed
+    :param seq: reads (PackedSRNASeq)
+    :param lengths: read lengths to align (list(int))
+    :return: shared reads (SharedSRNASeq), or seq
+    """
+    if max(lengths) > kmer.MAX_KMER_LEN:  # shared reads only hold packed read tables
+        return seq
+    return seq.shared()
+
+
+def _profile_init_worker(seq, refs, settings):
+    """
+    Worker process initialiser - keep reads, reference and settings for all reference sequences
+    processed by the worker
+    :param seq: reads (PackedSRNASeq or SharedSRNASeq)
+    :param refs: indexed reference, or None if sequences are sent to the worker (IndexedRefSeq)
+    :param settings: profile settings - see _ref_profile (dict)
+    """
+    global _worker_seq, _worker_refs, _worker_settings
+    _worker_seq = seq
+    _worker_refs = refs
+    _worker_settings = settings
+
+
+def _profile_worker(ref_item):
+    """
+    Worker process - profile for a single reference sequence
+    :param ref_item: (ordinal in the worker's indexed reference (int) or sequence (DNA), reference name (str),
+                     sequence name for tracks (str))
+    :return: profile, hits - see _ref_profile
+    """
+    ref, ref_output, track_name = ref_item
+    if _worker_refs is not None:
+        ref = _worker_refs.sequence(ref)
+    return _ref_profile(_worker_seq, ref, ref_output, _worker_settings, track_name)
+
+
+def _ref_profile(seq, single_ref, ref_output, settings, track_name='ref'):
+    """
+    Align reads to a single reference sequence, write CSVs, .npz and bedGraph files, and calculate smoothed
+    profiles
+    :param seq: reads (PackedSRNASeq)
+    :param single_ref: reference sequence (DNA)
+    :param ref_output: reference name for output files (str)
+    :param settings: {'seq_output': treatment name (str), 'lengths': read lengths to align (list(int)),
+                      'split': split aligned read counts by number of times a read aligns (bool),
+                      'no_csv': generate CSV (bool), 'compress': gzip CSV, .npz and bedGraph files (bool),
+                      'npz': save a columnar .npz file (bool), 'bedgraph': save bedGraph files (bool),
+                      'plot': calculate profiles for plotting (bool),
+                      'smooth_win_size': window size for smoothed profile (int),
+                      'coverage': per-nucleotide coverage rather than counts at read centres (bool),
+                      'cores': number of processes to spawn for a long reference (int),
+                      'hits': return hits for a hit matrix (bool)} (dict)
+    :param track_name: reference sequence name for bedGraph tracks (str)
+    :return: (x_ref, [(y_fwd_smoothed, y_rvs_smoothed),...] - one for each length) or None if not plotting,
+             hits - see _ref_hits - or None
+    """
+    lengths = settings['lengths']
+    alignments = align_ref(seq, single_ref, lengths, settings['cores'])
+    hits = _ref_hits(seq, [alignments[nt] for nt in lengths]) if settings['hits'] else None
+    if settings['split'] is False:
+        for nt in lengths:
+            alignments[nt].split()
+    sorted_alignments = [alignments[nt].aln_by_ref_pos(nt) for nt in lengths]
+    if settings['no_csv']:
+        if len(lengths) == 1:
+            wtf.csv_output(alignments[lengths[0]], lengths[0], settings['seq_output'], ref_output,
+                           settings['compress'])
+        else:
+            wtf.mnt_csv_output(alignments[21], alignments[22], alignments[24], settings['seq_output'], ref_output,
+                               settings['compress'])
+    if not (settings['plot'] or settings['npz'] or settings['bedgraph']):
+        return None, hits
+    graphs_processed = [pp.fill_in_zeros(single_sorted_alignments, len(single_ref), nt, settings['coverage'])
+                        for nt, single_sorted_alignments in zip(lengths, sorted_alignments)]
+    if settings['npz']:
+        wtf.den_npz_output([(nt, alignments[nt]) for nt in lengths], graphs_processed, settings['seq_output'],
+                           ref_output, settings['coverage'], settings['compress'])
+    if settings['bedgraph']:
+        wtf.bedgraph_output(graphs_processed, lengths, settings['seq_output'], ref_output, track_name,
+                            settings['compress'])
+    if not settings['plot']:
+        return None, hits
+    return (graphs_processed[0][0], _smoothed_for_plot(graphs_processed, settings['smooth_win_size'])), hits
+
+
+def align_ref(seq, single_ref, lengths, cores=1):
+    """
+    Align reads of each length to a single reference sequence
+    :param seq: reads (PackedSRNASeq)
+    :param single_ref: reference sequence (DNA)
+    :param lengths: read lengths to align (list(int))
+    :param cores: number of processes to spawn for a long reference (int)
+    :return: {nt: AlignedReads} (dict or MultiAlignedReads)
+    """
+    if len(lengths) == 1:
+        alignments = {lengths[0]: AlignedReads()}
+        alignments[lengths[0]].align_reads_to_ref(seq, single_ref, lengths[0], cores)
+    else:
+        alignments = MultiAlignedReads()
+        alignments.align_reads_to_ref(seq, single_ref, lengths, cores)  # single pass for all lengths
+    return alignments
+
+
+def _ref_hits(seq, alignments):
+    """
+    Hits on each strand for each read aligned to a reference sequence
+    :param seq: reads (PackedSRNASeq)
+    :param alignments: alignments for each read length [AlignedReads,...] (list)
+    :return: read sequences (list(str)), fwd hits (numpy.array(int)), rvs hits (numpy.array(int)),
+             read counts (numpy.array(float))
+    """
+    reads = []
+    strand_hits = []
+    counts = []
+    for alignment in alignments:
+        for sRNA, sRNA_alignments in alignment:
+            fwd_hits = sum(1 for sRNA_alignment in sRNA_alignments if sRNA_alignment[1] > 0)
+            reads.append(str(sRNA))
+            strand_hits.append((fwd_hits, len(sRNA_alignments) - fwd_hits))
+            counts.append(seq[sRNA])
+    strand_hits = numpy.array(strand_hits, dtype=numpy.int64).reshape(-1, 2)
+    return reads, strand_hits[:, 0], strand_hits[:, 1], numpy.array(counts, dtype=float)
+
+
+def _save_hit_matrix(headers, seq_output, ref_hits, file_name):
+    """
+    Save the alignment to all reference sequences as a HitMatrix
+    :param headers: reference headers (list(str))
+    :param seq_output: treatment name (str)
+    :param ref_hits: hits for each reference - see _ref_hits - or None (list)
+    :param file_name: path/to/hit/matrix.npz (str)
+    """
+    ref_hits = [hits if hits is not None else ([], numpy.zeros(0, dtype=numpy.int64),
+                                               numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0))
+                for hits in ref_hits]
+    ref_ordinals = numpy.repeat(numpy.arange(len(ref_hits)), [len(hits[0]) for hits in ref_hits])
+    all_reads = numpy.array([read.encode('ascii') for hits in ref_hits for read in hits[0]], dtype=bytes)
+    reads, first_idx, read_idx = numpy.unique(all_reads, return_index=True, return_inverse=True)
+    all_counts = numpy.concatenate([numpy.zeros(0)] + [hits[3] for hits in ref_hits])
+    matrix = HitMatrix.from_alignments(headers, [seq_output], ref_ordinals, read_idx.reshape(-1),
+                                       numpy.concatenate([hits[1] for hits in ref_hits]),
+                                       numpy.concatenate([hits[2] for hits in ref_hits]),
+                                       reads, all_counts[first_idx].reshape(-1, 1))
+    matrix.save(file_name)
+    print("\nReference x read hit matrix ({0} x {1}) saved to {2}\n".format(matrix.shape[0], matrix.shape[1],
+                                                                           file_name))
+
+
+def _plot_file_name(seq_output, ref_output, lengths):
+    """
+    Auto-generated plot file name
+    :param seq_output: treatment name (str)
+    :param ref_output: reference name (str)
+    :param lengths: aligned read lengths (list(int))
+    :return: file name (str)
+    """
+    if len(lengths) == 1:
+        return ah.ref_seq_nt_output(seq_output, ref_output, lengths[0], "pdf")
+    return ah.ref_seq_output(seq_output, ref_output, "pdf")
+
+
+def ref_output_names(headers):
+    """
+    Reference names for output files - names repeated in the reference file are numbered
+    :param headers: reference headers (list(str))
+    :return: reference names (list(str))
+    """
+    ref_outputs = []
+    used = set()
+    for ordinal, header in enumerate(headers):
+        ref_output = ref_name = ah.ref_header_output(header)
+        number = ordinal + 1
+        while ref_output in used:  # a numbered name can also be in the reference file
+            ref_output = "{0}_{1}".format(ref_name, number)
+            number += 1
+        used.add(ref_output)
+        ref_outputs.append(ref_output)
+    return ref_outputs
+
+
+def _smoothed_for_plot(graphs_processed, smooth_win_size):
+    """
+    Return fwd and rvs smoothed profiles for each alignment - all profiles are smoothed in a single batch.
+    Profiles of a reference shorter than the window aren't smoothed.
+    :param graphs_processed: [(x_ref, y_fwd, y_rvs) from pp.fill_in_zeros,...] (list)
+    :param smooth_win_size: window size for smoothed profile (int)
+    :return: [(y_fwd_smoothed (numpy.array(float)), y_rvs_smoothed (numpy.array(float))),...] (list)
+    """
+    y_smoothed = numpy.vstack([y for graph_processed in graphs_processed for y in graph_processed[1:3]])
+    if y_smoothed.shape[-1] >= smooth_win_size:
+        y_smoothed = pp.smooth(y_smoothed, smooth_win_size, window='blackman')
+    return list(zip(y_smoothed[0::2], y_smoothed[1::2]))
+
+
+def load_refs(ref_file):
+    """
+    Load a reference file - only its index if it can be indexed, as sequences are read from the file when
+    needed, otherwise all of its sequences
+    :param ref_file: path/to/refseq (str)
+    :return: reference sequences (IndexedRefSeq or RefSeq)
+    """
+    ref = IndexedRefSeq()
+    try:
+        ref.load_ref_file(ref_file)  # index read on repeat runs, rather than a full parse
+    except ValueError as e:
+        print("\n{0} - reference not indexed\n".format(e))
+        ref = RefSeq()
+        ref.load_ref_file(ref_file)
+    return ref
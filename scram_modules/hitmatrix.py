@@ -0,0 +1,187 @@
+"""
+Sparse reference x read hit matrix
+
+A whole multi-reference alignment - for each reference, the unique reads that align to it and the number of
+times each read aligns to each strand - stored as a compressed sparse row (CSR) matrix in numpy arrays, with
+the count of every aligned read in each sample.  Aligned counts, split counts, sample totals and multi-mapping
+reads can be recalculated from the matrix for any subset of samples without realigning.
+
+Matrices are saved as compressed .npz files, and loaded with HitMatrix.load.
+"""
+import numpy
+
+_MATRIX_VERSION = 1  # change if the saved format changes
+
+
+class HitMatrix(object):
+    """
+    References x unique aligned reads.  The entries for reference i are ref_starts[i]:ref_starts[i + 1], and
+    each entry holds a read (index into reads), and its hits on the fwd and rvs strands.
+    """
+
+    def __init__(self, headers, sample_names, reads, read_counts, ref_starts, read_idx, fwd_hits, rvs_hits):
+        """
+        :param headers: reference headers, in reference order (list(str))
+        :param sample_names: sample names (list(str))
+        :param reads: read sequences (numpy.array(bytes))
+        :param read_counts: counts - row for each read, column for each sample (numpy.array(float, ndim=2))
+        :param ref_starts: first entry for each reference, then the number of entries (numpy.array(int))
+        :param read_idx: read for each entry (numpy.array(int))
+        :param fwd_hits: times the read aligns to the fwd strand for each entry (numpy.array(int))
+        :param rvs_hits: times the read aligns to the rvs strand for each entry (numpy.array(int))
+        """
+        self.headers = list(headers)
+        self.sample_names = list(sample_names)
+        self.reads = reads
+        self.read_counts = read_counts
+        self.ref_starts = ref_starts
+        self.read_idx = read_idx
+        self.fwd_hits = fwd_hits
+        self.rvs_hits = rvs_hits
+
+    @classmethod
+    def from_alignments(cls, headers, sample_names, ref_ordinals, read_idx, fwd_hits, rvs_hits, reads, read_counts):
+        """
+        Build a matrix from alignments in any order
+        :param headers: reference headers, in reference order (list(str))
+        :param sample_names: sample names (list(str))
+        :param ref_ordinals: reference ordinal for each alignment (numpy.array(int))
+        :param read_idx: read for each alignment - index into reads (numpy.array(int))
+        :param fwd_hits: times the read aligns to the fwd strand for each alignment (numpy.array(int))
+        :param rvs_hits: times the read aligns to the rvs strand for each alignment (numpy.array(int))
+        :param reads: read sequences (numpy.array(bytes))
+        :param read_counts: counts - row for each read, column for each sample (numpy.array(float, ndim=2))
+        :return: HitMatrix
+        """
+        order = numpy.lexsort((read_idx, ref_ordinals))
+        ref_starts = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(ref_ordinals, minlength=len(headers)))))
+        return cls(headers, sample_names, reads, read_counts, ref_starts.astype(numpy.int64),
+                   read_idx[order].astype(numpy.int64), fwd_hits[order].astype(numpy.int64),
+                   rvs_hits[order].astype(numpy.int64))
+
+    @classmethod
+    def load(cls, file_name):
+        """
+        Load a saved matrix
+        :param file_name: path/to/matrix.npz (str)
+        :return: HitMatrix
+        """
+        with numpy.load(file_name) as saved:
+            if int(saved['version']) != _MATRIX_VERSION:
+                raise ValueError("{0} is not a version {1} hit matrix".format(file_name, _MATRIX_VERSION))
+            return cls(saved['headers'].tolist(), saved['sample_names'].tolist(), saved['reads'],
+                       saved['read_counts'], saved['ref_starts'], saved['read_idx'], saved['fwd_hits'],
+                       saved['rvs_hits'])
+
+    def save(self, file_name):
+        """
+        Save the matrix as a compressed .npz file
+        :param file_name: path/to/matrix.npz (str)
+        """
+        with open(file_name, 'wb') as out_matrix:
+            numpy.savez_compressed(out_matrix, version=numpy.array(_MATRIX_VERSION),
+                                   headers=numpy.array(self.headers, dtype=str),
+                                   sample_names=numpy.array(self.sample_names, dtype=str), reads=self.reads,
+                                   read_counts=self.read_counts, ref_starts=self.ref_starts, read_idx=self.read_idx,
+                                   fwd_hits=self.fwd_hits, rvs_hits=self.rvs_hits)
+
+    def __len__(self):
+        return len(self.headers)  # number of references
+
+    @property
+    def shape(self):
+        return len(self.headers), len(self.reads)  # references x reads
+
+    def hits(self):
+        """
+        :return: times the read aligns to both strands for each entry (numpy.array(int))
+        """
+        return self.fwd_hits + self.rvs_hits
+
+    def ref_rows(self):
+        """
+        :return: reference ordinal for each entry (numpy.array(int))
+        """
+        return numpy.repeat(numpy.arange(len(self.headers)), numpy.diff(self.ref_starts))
+
+    def read_times(self):
+        """
+        Number of times each read aligns to all references
+        :return: times aligned for each read (numpy.array(int))
+        """
+        return numpy.bincount(self.read_idx, weights=self.hits(), minlength=len(self.reads)).astype(numpy.int64)
+
+    def ref_counts(self, split=False, samples=None):
+        """
+        Aligned read count for each reference
+        :param split: split the count for each read by the number of times it aligns to all references (bool)
+        :param samples: sample names or indices - all samples if None (list)
+        :return: counts - row for each reference, column for each sample (numpy.array(float, ndim=2))
+        """
+        columns = self._sample_columns(samples)
+        weights = self.hits().astype(float)
+        if split:
+            weights /= self.read_times()[self.read_idx]
+        ref_rows = self.ref_rows()
+        counts = numpy.zeros((len(self.headers), len(columns)))
+        for i, column in enumerate(columns):
+            counts[:, i] = numpy.bincount(ref_rows, weights=self.read_counts[self.read_idx, column] * weights,
+                                          minlength=len(self.headers))
+        return counts
+
+    def sample_totals(self, split=False, samples=None):
+        """
+        Total aligned read count for each sample
+        :param split: split the count for each read by the number of times it aligns to all references (bool)
+        :param samples: sample names or indices - all samples if None (list)
+        :return: total for each sample (numpy.array(float))
+        """
+        return self.ref_counts(split, samples).sum(axis=0)
+
+    def multimapping(self, min_refs=2):
+        """
+        Reads aligning to several references
+        :param min_refs: only reads aligning to at least min_refs references (int)
+        :return: read sequences (numpy.array(bytes)), number of references aligned to (numpy.array(int)),
+                 times aligned to all references (numpy.array(int)), counts - row for each read, column for
+                 each sample (numpy.array(float, ndim=2))
+        """
+        ref_numbers = numpy.bincount(self.read_idx, minlength=len(self.reads))
+        multi = numpy.flatnonzero(ref_numbers >= min_refs)
+        return self.reads[multi], ref_numbers[multi], self.read_times()[multi], self.read_counts[multi]
+
+    def ref_reads(self, ref):
+        """
+        Reads aligned to a single reference
+        :param ref: reference header (str) or ordinal (int)
+        :return: read sequences (numpy.array(bytes)), fwd hits (numpy.array(int)), rvs hits (numpy.array(int))
+        """
+        ordinal = self.headers.index(ref) if isinstance(ref, str) else ref
+        entries = slice(self.ref_starts[ordinal], self.ref_starts[ordinal + 1])
+        return self.reads[self.read_idx[entries]], self.fwd_hits[entries], self.rvs_hits[entries]
+
+    def subset(self, samples):
+        """
+        Matrix for a subset of samples - reads not in any of the samples are removed
+        :param samples: sample names or indices (list)
+        :return: HitMatrix
+        """
+        columns = self._sample_columns(samples)
+        read_counts = self.read_counts[:, columns]
+        kept_reads = read_counts.any(axis=1)
+        new_read_idx = numpy.cumsum(kept_reads) - 1
+        kept_entries = kept_reads[self.read_idx]
+        return HitMatrix.from_alignments(self.headers, [self.sample_names[column] for column in columns],
+                                         self.ref_rows()[kept_entries], new_read_idx[self.read_idx[kept_entries]],
+                                         self.fwd_hits[kept_entries], self.rvs_hits[kept_entries],
+                                         self.reads[kept_reads], read_counts[kept_reads])
+
+    def _sample_columns(self, samples):
+        """
+        Read count columns for samples
+        :param samples: sample names or indices - all samples if None (list)
+        :return: column indices (list(int))
+        """
+        if samples is None:
+            return list(range(len(self.sample_names)))
+        return [self.sample_names.index(sample) if isinstance(sample, str) else sample for sample in samples]
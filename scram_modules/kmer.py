@@ -0,0 +1,310 @@
+"""
+2-bit packed integer encoding of DNA k-mers
+
+A=0, C=1, G=2, T=3 - the first base is the most significant, so a read of up to 32 nt fits in a uint64.
+Any other character (eg. N) cannot be encoded, and encode functions return None.  Reads containing them are
+matched by sequence against the reference windows that contain the same characters (see MultiRefKmers.hits).
+
+Keys are length-aware codes - a single 1 bit is set above the 2-bit packed bases so reads of different
+lengths never collide (eg. AAA != AAAA).  Keys are Python ints and are used as dictionary keys.
+
+References are encoded once as a uint8 array, and k-mer codes for every window on both strands are
+calculated with vectorised numpy operations, then matched against a sorted array of read codes.
+"""
+import numpy
+
+MAX_KMER_LEN = 32  # longest k-mer that fits in a uint64 code
+
+_BASE_CODES = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+_BASES = 'ACGT'
+_BYTE_BASES = [a + b + c + d for a in _BASES for b in _BASES for c in _BASES for d in _BASES]  # 4-mer per byte
+_ENCODE_TABLE = str.maketrans('ACGT', '0123')
+_COMPLEMENT_TABLE = str.maketrans('ACGT', 'TGCA')
+_BLOCK_SIZE = 1 << 22  # max. windows encoded at a time - bounds memory use for long references
+
+_BASE_ARRAY_CODES = numpy.full(256, 4, dtype=numpy.uint8)  # ascii --> 2-bit code, 4 for non-ACGT
+for _base, _code in _BASE_CODES.items():
+    _BASE_ARRAY_CODES[ord(_base)] = _code
+    _BASE_ARRAY_CODES[ord(_base.lower())] = _code
+
+
+def encode(sequence):
+    """
+    2-bit packed code for a sequence
+    :param sequence: DNA sequence (str)
+    :return: packed code (int) or None if the sequence contains a non-ACGT character
+    """
+    if not sequence or sequence.strip('ACGTacgt'):  # int() would also accept '_', '+', '-' and whitespace
+        return None
+    return int(sequence.upper().translate(_ENCODE_TABLE), 4)
+
+
+def decode(code, nt):
+    """
+    Sequence for a 2-bit packed code
+    :param code: packed code (int)
+    :param nt: sequence length (int)
+    :return: DNA sequence (str)
+    """
+    chunks = []
+    for _ in range((nt + 3) // 4):
+        chunks.append(_BYTE_BASES[code & 255])
+        code >>= 8
+    return ''.join(reversed(chunks))[-nt:] if nt else ''
+
+
+def decode_array(codes, nt):
+    """
+    Sequences for an array of 2-bit packed codes
+    :param codes: packed codes (numpy.array(uint64))
+    :param nt: sequence length (int)
+    :return: DNA sequences (numpy.array(bytes))
+    """
+    shifts = (2 * numpy.arange(nt - 1, -1, -1)).astype(numpy.uint64)
+    base_codes = (codes.astype(numpy.uint64)[:, None] >> shifts) & numpy.uint64(3)
+    bases = numpy.frombuffer(_BASES.encode('ascii'), dtype=numpy.uint8)[base_codes.astype(numpy.intp)]
+    return numpy.ascontiguousarray(bases).view('S{0}'.format(nt)).ravel()
+
+
+def encode_key(sequence):
+    """
+    Length-aware key for a sequence
+    :param sequence: DNA sequence (str)
+    :return: key (int) or None if the sequence contains a non-ACGT character
+    """
+    code = encode(sequence)
+    if code is None:
+        return None
+    return code | length_flag(len(sequence))
+
+
+def decode_key(key):
+    """
+    Sequence for a length-aware key
+    :param key: key (int)
+    :return: DNA sequence (str)
+    """
+    nt = key_length(key)
+    return decode(key ^ length_flag(nt), nt)
+
+
+def key_length(key):
+    """
+    Sequence length encoded in a length-aware key
+    :param key: key (int)
+    :return: sequence length (int)
+    """
+    return (key.bit_length() - 1) >> 1
+
+
+def length_flag(nt):
+    """
+    Length bit set in all keys of length nt
+    :param nt: sequence length (int)
+    :return: length bit (int)
+    """
+    return 1 << (2 * nt)
+
+
+def encode_array(sequence):
+    """
+    Encode a sequence as an array of 2-bit base codes
+    :param sequence: DNA sequence (str)
+    :return: base codes - 4 for non-ACGT characters (numpy.array(uint8))
+    """
+    return _BASE_ARRAY_CODES[numpy.frombuffer(sequence.encode('ascii', 'replace'), dtype=numpy.uint8)]
+
+
+def window_codes(bases, nt):
+    """
+    Codes for every window of length nt in an encoded sequence - both strands.
+    The rvs code is for the reverse complement of the same window.
+    :param bases: base codes from encode_array (numpy.array(uint8))
+    :param nt: window length (int)
+    :return: fwd codes (numpy.array(uint64)), rvs codes (numpy.array(uint64)),
+             windows without non-ACGT characters (numpy.array(bool))
+    """
+    for _, fwd_codes, rvs_codes, valid in multi_window_codes(bases, [nt]):
+        return fwd_codes, rvs_codes, valid
+
+
+def multi_window_codes(bases, lengths):
+    """
+    Codes for every window of each length in an encoded sequence - both strands.  A single pass
+    extends every window by one base at a time, so codes for all lengths are built together.
+    :param bases: base codes from encode_array (numpy.array(uint8))
+    :param lengths: window lengths (list(int))
+    :return: generator of (window length (int), fwd codes, rvs codes, valid) - see window_codes - in
+             increasing length order
+    """
+    max_len = max(lengths)
+    if max_len > MAX_KMER_LEN:
+        raise ValueError("k-mers longer than {0} nt can't be packed into a uint64".format(MAX_KMER_LEN))
+    base_codes = (bases & 3).astype(numpy.uint64)
+    invalid = numpy.concatenate(([0], numpy.cumsum(bases > 3)))
+    fwd_codes = numpy.zeros(len(bases), dtype=numpy.uint64)
+    rvs_codes = numpy.zeros(len(bases), dtype=numpy.uint64)
+    for i in range(max_len):
+        nt = i + 1
+        n = max(len(bases) - i, 0)  # number of windows of length nt
+        window_base = base_codes[i:i + n]
+        fwd_codes = (fwd_codes[:n] << numpy.uint64(2)) | window_base
+        rvs_codes = rvs_codes[:n] | ((numpy.uint64(3) - window_base) << numpy.uint64(2 * i))
+        if nt in lengths:
+            yield nt, fwd_codes, rvs_codes, invalid[nt:nt + n] == invalid[:n]
+
+
+def match(codes, valid, read_codes):
+    """
+    Find codes present in a sorted array of read codes
+    :param codes: query codes (numpy.array(uint64))
+    :param valid: query codes that can be matched (numpy.array(bool))
+    :param read_codes: sorted read codes (numpy.array(uint64))
+    :return: indices of matched queries (numpy.array(int)), indices of matched reads (numpy.array(int))
+    """
+    if len(read_codes) == 0 or len(codes) == 0:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+    read_idx = numpy.minimum(numpy.searchsorted(read_codes, codes), len(read_codes) - 1)
+    hit = valid & (read_codes[read_idx] == codes)
+    return numpy.flatnonzero(hit), read_idx[hit]
+
+
+class MultiRefKmers(object):
+    """
+    k-mer codes of several lengths for a reference sequence - encoded once, and shared by every read
+    set aligned to it.  All lengths are generated in a single pass along the reference.
+    """
+
+    def __init__(self, ref, lengths):
+        """
+        :param ref: reference sequence (DNA)
+        :param lengths: k-mer lengths (list(int))
+        """
+        self.ref = ref
+        self.lengths = sorted(set(lengths))
+        self._bases = None
+        self._block = None  # cached codes when the reference is a single block
+
+    def blocks(self):
+        """
+        Window codes for the reference, in blocks of windows.  Each block holds at most _BLOCK_SIZE windows
+        over all lengths.
+        :return: generator of (first window position (int), window length (int), fwd codes, rvs codes, valid)
+                 - see window_codes
+        """
+        if not self.lengths:
+            return
+        if self._bases is None:
+            self._bases = encode_array(str(self.ref))
+        ref_len = len(self.ref)
+        max_len = self.lengths[-1]
+        block_size = max(_BLOCK_SIZE // len(self.lengths), 1)
+        if ref_len <= block_size:
+            if self._block is None:
+                self._block = [(0,) + codes for codes in multi_window_codes(self._bases, self.lengths)]
+            for block in self._block:
+                yield block
+        else:
+            for start in range(0, ref_len, block_size):
+                stop = min(start + block_size, ref_len)
+                block_bases = self._bases[start:stop + max_len - 1]
+                for nt, fwd_codes, rvs_codes, valid in multi_window_codes(block_bases, self.lengths):
+                    # windows starting in the next block are generated there
+                    yield start, nt, fwd_codes[:stop - start], rvs_codes[:stop - start], valid[:stop - start]
+
+    def hits(self, read_tables, other_reads=None):
+        """
+        Align reads of each length to the reference.  Positions are the 5' end of the read relative to the
+        5' end of the fwd strand.  Hits are ordered as the reference is scanned - a rvs hit in the ith window
+        of the reverse complement comes just after a fwd hit in the ith window of the fwd strand.
+        :param read_tables: {read length (int): sorted read codes (numpy.array(uint64))} (dict)
+        :param other_reads: {read length (int): {read sequence (str): read index (int)}} - reads with non-ACGT
+                            characters, which are matched by sequence (dict)
+        :return: {read length (int): (positions (numpy.array(int)), indices of aligned reads (numpy.array(int)),
+                 sense strand hits (numpy.array(bool)))} (dict)
+        """
+        ref_len = len(self.ref)
+        hit_parts = {nt: ([], [], [], []) for nt in self.lengths}  # positions, read_idx, order, sense
+        for start, nt, fwd_codes, rvs_codes, valid in self.blocks():
+            positions, read_idx, order, sense = hit_parts[nt]
+            fwd_windows, fwd_idx = match(fwd_codes, valid, read_tables[nt])
+            rvs_windows, rvs_idx = match(rvs_codes, valid, read_tables[nt])
+            fwd_windows += start
+            rvs_windows += start
+            positions += [fwd_windows, rvs_windows + (nt - 1)]
+            read_idx += [fwd_idx, rvs_idx]
+            order += [2 * fwd_windows, 2 * (ref_len - nt - rvs_windows) + 1]
+            sense += [numpy.ones(len(fwd_idx), dtype=bool), numpy.zeros(len(rvs_idx), dtype=bool)]
+        for nt, read_index in (other_reads or {}).items():
+            if read_index and nt in hit_parts:
+                positions, read_idx, order, sense = hit_parts[nt]
+                fwd_windows, fwd_idx, rvs_windows, rvs_idx = self._other_matches(nt, read_index)
+                positions += [fwd_windows, rvs_windows + (nt - 1)]
+                read_idx += [fwd_idx, rvs_idx]
+                order += [2 * fwd_windows, 2 * (ref_len - nt - rvs_windows) + 1]
+                sense += [numpy.ones(len(fwd_idx), dtype=bool), numpy.zeros(len(rvs_idx), dtype=bool)]
+        hits_by_length = {}
+        for nt, (positions, read_idx, order, sense) in hit_parts.items():
+            if not positions:
+                hits_by_length[nt] = (numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64),
+                                      numpy.zeros(0, dtype=bool))
+            else:
+                scan_order = numpy.argsort(numpy.concatenate(order), kind='stable')
+                hits_by_length[nt] = (numpy.concatenate(positions)[scan_order],
+                                      numpy.concatenate(read_idx)[scan_order],
+                                      numpy.concatenate(sense)[scan_order])
+        return hits_by_length
+
+    def _other_matches(self, nt, read_index):
+        """
+        Match reads with non-ACGT characters by sequence - only windows with a non-ACGT character can match
+        :param nt: read length (int)
+        :param read_index: {read sequence (str): read index (int)} (dict)
+        :return: fwd windows (numpy.array(int)), indices of reads matched to them (numpy.array(int)),
+                 rvs windows (numpy.array(int)), indices of reads matched to their reverse complement
+                 (numpy.array(int))
+        """
+        if self._bases is None:
+            self._bases = encode_array(str(self.ref))
+        ref = str(self.ref)
+        n = max(len(ref) - (nt - 1), 0)  # number of windows
+        invalid = numpy.concatenate(([0], numpy.cumsum(self._bases > 3)))
+        matches = ([], [], [], [])  # fwd windows, fwd read_idx, rvs windows, rvs read_idx
+        for window in numpy.flatnonzero(invalid[nt:nt + n] != invalid[:n]).tolist():
+            fwd_seq = ref[window:window + nt]
+            rvs_seq = fwd_seq.translate(_COMPLEMENT_TABLE)[::-1]
+            if fwd_seq in read_index:
+                matches[0].append(window)
+                matches[1].append(read_index[fwd_seq])
+            if rvs_seq in read_index:
+                matches[2].append(window)
+                matches[3].append(read_index[rvs_seq])
+        return tuple(numpy.array(match_part, dtype=numpy.int64) for match_part in matches)
+
+
+class RefKmers(MultiRefKmers):
+    """
+    k-mer codes of a single length for a reference sequence
+    """
+
+    def __init__(self, ref, nt):
+        """
+        :param ref: reference sequence (DNA)
+        :param nt: k-mer length (int)
+        """
+        super(RefKmers, self).__init__(ref, [nt])
+        self.nt = nt
+
+    def __len__(self):
+        return max(len(self.ref) - (self.nt - 1), 0)  # number of windows
+
+    def hits(self, read_codes, other_reads=None):
+        """
+        Align reads to the reference - see MultiRefKmers.hits
+        :param read_codes: sorted read codes (numpy.array(uint64))
+        :param other_reads: {read sequence (str): read index (int)} - reads with non-ACGT characters (dict)
+        :return: positions (numpy.array(int)), indices of aligned reads (numpy.array(int)),
+                 sense strand hits (numpy.array(bool))
+        """
+        return super(RefKmers, self).hits({self.nt: read_codes},
+                                          None if other_reads is None else {self.nt: other_reads})[self.nt]
@@ -1,14 +1,30 @@
-from pylab import *  # @UnusedWildImport
-import matplotlib.pyplot as plt  # @Reimport
-from bokeh.plotting import figure, output_file, show
-from bokeh.io import output_notebook
+import os
+import sys
+from collections import deque
+from multiprocessing import Pool
+import numpy
+from scram_modules import post_process as pp
 """
 Plotting Module
+
+matplotlib and bokeh are imported when a figure is first drawn, so runs without plots don't load them.
+Figures are drawn on their own matplotlib Figure, not pyplot's current figure - pyplot is only used to show
+plots on screen - so figures written to file can be rendered in parallel by a FigureRenderer.
 """
 
+_POINTS_PER_PIXEL = 2  # profile points plotted per pixel of output width
+_PENDING_PER_PROCESS = 2  # figures queued for each rendering process before render waits
+_DENSITY_POINTS = 20000  # CDP plots with more references are drawn as hexbin densities / decimated in bokeh
+_HEXBIN_GRID = 80  # hexagons across a CDP density plot
+_CDP_BOKEH_SIZE = 600  # bokeh CDP plot width and height (pixels)
+_DEN_BOKEH_WIDTH = 700  # bokeh profile plot width (pixels)
+_DEN_BOKEH_HEIGHT = 400  # bokeh profile plot height (pixels)
+
+plt = None  # matplotlib.pyplot - imported by _load_pyplot
+
 
 def den_plot(x_ref, y_fwd_smoothed, y_rvs_smoothed, nt, file_fig,
-             file_name, onscreen, x_label, plot_y_lim, pub=False, bok=False):
+             file_name, onscreen, x_label, plot_y_lim, pub=False, bok=False, dpi=None, rasterize=False):
     """
     Single alignment profile
     :param x_ref: x co-ords (list(int))
@@ -21,26 +37,35 @@ def den_plot(x_ref, y_fwd_smoothed, y_rvs_smoothed, nt, file_fig,
     :param x_label: x label (str)
     :param plot_y_lim: + / - y-axis limit (int)
     :param pub: publication plot (bool)
+    :param bok: use bokeh for plotting (bool)
+    :param dpi: resolution of PNG files and rasterized series (int) - figure dpi if None
+    :param rasterize: draw profiles as images in PDF files (bool)
     """
     if not bok:
-        plt.plot(x_ref, y_fwd_smoothed, color=_nt_colour(nt),
-                 label='{0} nt'.format(nt), lw=2)
-        plt.plot(x_ref, y_rvs_smoothed, color=_nt_colour(nt), lw=2)
-        axhline(y=0)
+        fig, ax = _new_figure(onscreen)
+        x_ref, (y_fwd_smoothed, y_rvs_smoothed) = _profile_points(x_ref, [y_fwd_smoothed, y_rvs_smoothed],
+                                                                  _figure_points(fig, dpi))
+        ax.plot(x_ref, y_fwd_smoothed, color=_nt_colour(nt),
+                label='{0} nt'.format(nt), lw=2, rasterized=rasterize)
+        ax.plot(x_ref, y_rvs_smoothed, color=_nt_colour(nt), lw=2, rasterized=rasterize)
+        ax.axhline(y=0)
         if pub:
-            _pub_plot()
+            _pub_plot(ax)
         else:
-            xlabel(x_label)
-            ylabel('Reads per million reads')
-            plt.legend(loc='best', fancybox=True, framealpha=0.5)
-        _generate_profile(file_fig, file_name, onscreen, plot_y_lim)
+            ax.set_xlabel(x_label)
+            ax.set_ylabel('Reads per million reads')
+            ax.legend(loc='best', fancybox=True, framealpha=0.5)
+        _generate_profile(fig, ax, file_fig, file_name, onscreen, plot_y_lim, dpi)
     else:
-        output_notebook()
+        figure, show = _load_bokeh()
         if plot_y_lim!=0:
-            p = figure(plot_width=700, plot_height=400, y_range=(-plot_y_lim, plot_y_lim))
+            p = figure(width=_DEN_BOKEH_WIDTH, height=_DEN_BOKEH_HEIGHT, y_range=(-plot_y_lim, plot_y_lim))
         else:
-            p = figure(plot_width=700, plot_height=400)
-        p.line(x_ref, y_fwd_smoothed, line_width=2, color=_nt_colour(nt), legend='{0} nt'.format(nt), alpha=0.9)
+            p = figure(width=_DEN_BOKEH_WIDTH, height=_DEN_BOKEH_HEIGHT)
+        x_ref, (y_fwd_smoothed, y_rvs_smoothed) = _profile_points(x_ref, [y_fwd_smoothed, y_rvs_smoothed],
+                                                                  _DEN_BOKEH_WIDTH * _POINTS_PER_PIXEL)
+        p.line(x_ref, y_fwd_smoothed, line_width=2, color=_nt_colour(nt), legend_label='{0} nt'.format(nt),
+               alpha=0.9)
         p.line(x_ref, y_rvs_smoothed, line_width=2, color=_nt_colour(nt), alpha=0.9)
         show(p)
 
@@ -49,7 +74,7 @@ def den_multi_plot_21_22_24(x_ref, y_fwd_smoothed_21, y_rvs_smoothed_21,
                             y_fwd_smoothed_22, y_rvs_smoothed_22,
                             y_fwd_smoothed_24, y_rvs_smoothed_24, file_fig,
                             file_name, onscreen, x_label, plot_y_lim,
-                            pub=False, bok=False):
+                            pub=False, bok=False, dpi=None, rasterize=False):
     """
     21, 22 and 24nt combined alignment profile
     :param x_ref: x co-ords (list(int))
@@ -66,45 +91,57 @@ def den_multi_plot_21_22_24(x_ref, y_fwd_smoothed_21, y_rvs_smoothed_21,
     :param x_label: x label (str)
     :param plot_y_lim: + / - y-axis limit (int)
     :param pub: publication plot (bool)
+    :param bok: use bokeh for plotting (bool)
+    :param dpi: resolution of PNG files and rasterized series (int) - figure dpi if None
+    :param rasterize: draw profiles as images in PDF files (bool)
     """
     if not bok:
-        plt.plot(x_ref, y_fwd_smoothed_21, color='#00CC00', label='21 nt', lw=2)
-        plt.plot(x_ref, y_rvs_smoothed_21, color='#00CC00', lw=2)
-        plt.plot(x_ref, y_fwd_smoothed_22, color='#FF3399', label='22 nt', lw=2)
-        plt.plot(x_ref, y_rvs_smoothed_22, color='#FF3399', lw=2)
-        plt.plot(x_ref, y_fwd_smoothed_24, color='#3333FF', label='24 nt', lw=2)
-        plt.plot(x_ref, y_rvs_smoothed_24, color='#3333FF', lw=2)
-        axhline(y=0)
+        fig, ax = _new_figure(onscreen)
+        x_ref, (y_fwd_smoothed_21, y_rvs_smoothed_21, y_fwd_smoothed_22, y_rvs_smoothed_22, y_fwd_smoothed_24,
+                y_rvs_smoothed_24) = _profile_points(x_ref, [y_fwd_smoothed_21, y_rvs_smoothed_21, y_fwd_smoothed_22,
+                                                             y_rvs_smoothed_22, y_fwd_smoothed_24, y_rvs_smoothed_24],
+                                                     _figure_points(fig, dpi))
+        ax.plot(x_ref, y_fwd_smoothed_21, color='#00CC00', label='21 nt', lw=2, rasterized=rasterize)
+        ax.plot(x_ref, y_rvs_smoothed_21, color='#00CC00', lw=2, rasterized=rasterize)
+        ax.plot(x_ref, y_fwd_smoothed_22, color='#FF3399', label='22 nt', lw=2, rasterized=rasterize)
+        ax.plot(x_ref, y_rvs_smoothed_22, color='#FF3399', lw=2, rasterized=rasterize)
+        ax.plot(x_ref, y_fwd_smoothed_24, color='#3333FF', label='24 nt', lw=2, rasterized=rasterize)
+        ax.plot(x_ref, y_rvs_smoothed_24, color='#3333FF', lw=2, rasterized=rasterize)
+        ax.axhline(y=0)
         if pub:
-            _pub_plot()
+            _pub_plot(ax)
 
         else:  # no_publication
-            xlabel(x_label)
-            ylabel('Reads per million reads')
-            plt.rc('font') #remove?
-            plt.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc=3,
-                       ncol=3, mode="expand", borderaxespad=0., fontsize=12)
-        _generate_profile(file_fig, file_name, onscreen, plot_y_lim)
+            ax.set_xlabel(x_label)
+            ax.set_ylabel('Reads per million reads')
+            ax.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc=3,
+                      ncol=3, mode="expand", borderaxespad=0., fontsize=12)
+        _generate_profile(fig, ax, file_fig, file_name, onscreen, plot_y_lim, dpi)
     else:
         ##Test bokeh package
-        output_notebook()
+        figure, show = _load_bokeh()
         if plot_y_lim!=0:
-            p = figure(plot_width=700, plot_height=400, y_range=(-plot_y_lim, plot_y_lim))
+            p = figure(width=_DEN_BOKEH_WIDTH, height=_DEN_BOKEH_HEIGHT, y_range=(-plot_y_lim, plot_y_lim))
         else:
-            p = figure(plot_width=700, plot_height=400)
-        p.line(x_ref, y_fwd_smoothed_21, line_width=2, color="#00CC00", legend= "21 nt", alpha=0.9)
+            p = figure(width=_DEN_BOKEH_WIDTH, height=_DEN_BOKEH_HEIGHT)
+        x_ref, (y_fwd_smoothed_21, y_rvs_smoothed_21, y_fwd_smoothed_22, y_rvs_smoothed_22, y_fwd_smoothed_24,
+                y_rvs_smoothed_24) = _profile_points(x_ref, [y_fwd_smoothed_21, y_rvs_smoothed_21, y_fwd_smoothed_22,
+                                                             y_rvs_smoothed_22, y_fwd_smoothed_24, y_rvs_smoothed_24],
+                                                     _DEN_BOKEH_WIDTH * _POINTS_PER_PIXEL)
+        p.line(x_ref, y_fwd_smoothed_21, line_width=2, color="#00CC00", legend_label="21 nt", alpha=0.9)
         p.line(x_ref, y_rvs_smoothed_21, line_width=2, color="#00CC00", alpha=0.9)
-        p.line(x_ref, y_fwd_smoothed_22, line_width=2, color="#FF3399", legend= "22 nt", alpha=0.9)
+        p.line(x_ref, y_fwd_smoothed_22, line_width=2, color="#FF3399", legend_label="22 nt", alpha=0.9)
         p.line(x_ref, y_rvs_smoothed_22, line_width=2, color="#FF3399", alpha=0.9)
-        p.line(x_ref, y_fwd_smoothed_24, line_width=2, color="#3333FF", legend= "24 nt", alpha=0.9)
+        p.line(x_ref, y_fwd_smoothed_24, line_width=2, color="#3333FF", legend_label="24 nt", alpha=0.9)
         p.line(x_ref, y_rvs_smoothed_24, line_width=2, color="#3333FF", alpha=0.9)
         show(p)
 
 
 def cdp_plot(counts_by_ref, seq1, seq2, nt, onscreen, file_fig, file_name, pub,
-             bok):
+             bok, dpi=None, rasterize=False, density=None):
     """
-    Scatter plot of alignments to references
+    Scatter plot of alignments to references.  Above _DENSITY_POINTS references, matplotlib plots show the
+    density of references as hexagonal bins, and bokeh plots show one point per pixel.
     :param counts_by_ref: dict of (x,y) counts for each reference (dict)
     :param seq1: x label (str)
     :param seq2: y label (str)
@@ -113,46 +150,64 @@ def cdp_plot(counts_by_ref, seq1, seq2, nt, onscreen, file_fig, file_name, pub,
     :param file_name: output filename (str)
     :param onscreen: show plot on screen (bool)
     :param pub: publication plot (bool)
+    :param bok: use bokeh for plotting (bool)
+    :param dpi: resolution of PNG files and rasterized points (int) - figure dpi if None
+    :param rasterize: draw points as an image in PDF files (bool)
+    :param density: density plot (bool) - chosen from the number of references if None
     """
-    results_list = []  # list of results
-    for counts in counts_by_ref.values():
-        results_list.append((counts[0] + 0.01, counts[1] + 0.01))
-        # hack that allows zero values to be plotted on a log scale
-    results_list = sorted(results_list)
+    # + 0.01 is a hack that allows zero values to be plotted on a log scale
+    counts = numpy.array(list(counts_by_ref.values()), dtype=float).reshape(-1, 2) + 0.01
+    x_vals, y_vals = counts[:, 0], counts[:, 1]
+    if density is None:
+        density = len(counts) > _DENSITY_POINTS
 
-    _max = max(results_list[-1][0], results_list[-1][1])  # sets up max x and y scale values
+    x_max = x_vals.max()
+    _max = max(x_max, y_vals[x_vals == x_max].max())  # sets up max x and y scale values
     _max += float(_max / 2)
 
     if not bok:
-        plt.scatter(*list(zip(*results_list)),
-                    s=10,
-                    color=_nt_colour(nt),
-                    marker='o',
-                    label="{0} nt".format(nt))
-
-        arrow(0.1, 0.1, _max, _max, color='r')
-        xscale('log')
-        yscale('log')
-        xlim(0.1, _max)
-        ylim(0.1, _max)
+        fig, ax = _new_figure(onscreen)
+        if density:
+            bins = ax.hexbin(x_vals, y_vals, xscale='log', yscale='log', bins='log', mincnt=1,
+                             gridsize=_HEXBIN_GRID, extent=(-1, numpy.log10(_max), -1, numpy.log10(_max)),
+                             cmap='viridis', rasterized=rasterize)
+            if not pub:
+                fig.colorbar(bins, ax=ax, label="References ({0} nt)".format(nt))
+        else:
+            ax.scatter(x_vals, y_vals,
+                       s=10,
+                       color=_nt_colour(nt),
+                       marker='o',
+                       label="{0} nt".format(nt),
+                       rasterized=rasterize)
+
+        ax.arrow(0.1, 0.1, _max, _max, color='r')
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlim(0.1, _max)
+        ax.set_ylim(0.1, _max)
         if pub:
-            _pub_plot()
+            _pub_plot(ax)
         else:
-            plt.legend(loc='upper left', fancybox=True, framealpha=0.5)
-            xlabel(seq1)
-            ylabel(seq2)
-        _shared_plot(file_fig, file_name, onscreen)
+            if not density:
+                ax.legend(loc='upper left', fancybox=True, framealpha=0.5)
+            ax.set_xlabel(seq1)
+            ax.set_ylabel(seq2)
+        _shared_plot(fig, file_fig, file_name, onscreen, dpi)
     else:
-        output_notebook()
-        x_vals = []
-        y_vals = []
-        for point in counts_by_ref.values():
-            x_vals.append(point[0]+ 0.01)
-            y_vals.append(point[1]+ 0.01)
-        p = figure(plot_width=600, plot_height=600,
+        figure, show = _load_bokeh()
+        from bokeh.models import ColumnDataSource
+        refs = numpy.array(list(counts_by_ref), dtype=object)
+        if density:
+            kept = _decimate(x_vals, y_vals, _max, _CDP_BOKEH_SIZE // 2)  # a point for each 2 x 2 pixels
+            x_vals, y_vals, refs = x_vals[kept], y_vals[kept], refs[kept]
+        source = ColumnDataSource(data={'x': x_vals, 'y': y_vals, 'ref': refs})
+        p = figure(width=_CDP_BOKEH_SIZE, height=_CDP_BOKEH_SIZE,
                    x_axis_type="log",  y_axis_type="log",
-                   x_range=(0.1, _max), y_range=(0.1, _max))
-        p.circle(x_vals, y_vals, size=5, color=_nt_colour(nt), alpha=0.9)
+                   x_range=(0.1, _max), y_range=(0.1, _max),
+                   output_backend="webgl", tooltips=[("reference", "@ref"), (seq1, "@x"), (seq2, "@y")])
+        p.lod_threshold = _DENSITY_POINTS // 10  # fewer points drawn while panning and zooming
+        p.scatter('x', 'y', source=source, marker='circle', size=5, color=_nt_colour(nt), alpha=0.9)
         p.line([0.1,_max],[0.1,_max])
         p.xaxis.axis_label = seq1
         p.yaxis.axis_label = seq2
@@ -160,24 +215,191 @@ def cdp_plot(counts_by_ref, seq1, seq2, nt, onscreen, file_fig, file_name, pub,
         show(p)
 
 
-def _generate_profile(file_fig, file_name, onscreen, plot_y_lim):
+def _decimate(x_vals, y_vals, max_val, cells):
+    """
+    Thin a log-log scatter plot to the first point in each grid cell - points drawn over each other are dropped,
+    so the plot looks the same but the browser draws at most cells x cells points
+    :param x_vals: x values (numpy.array(float))
+    :param y_vals: y values (numpy.array(float))
+    :param max_val: x and y axis maximum - the minimum is 0.1 (float)
+    :param cells: grid cells across the plot (int)
+    :return: indices of the points kept, in order (numpy.array(int))
+    """
+    scale = cells / (numpy.log10(max_val) + 1)
+    x_cells = numpy.clip(((numpy.log10(x_vals) + 1) * scale).astype(numpy.int64), 0, cells)
+    y_cells = numpy.clip(((numpy.log10(y_vals) + 1) * scale).astype(numpy.int64), 0, cells)
+    _, kept = numpy.unique(x_cells * (cells + 1) + y_cells, return_index=True)
+    return numpy.sort(kept)
+
+
+class FigureRenderer(object):
+    """
+    Draws and saves figures - in a pool of worker processes when there is more than one figure to render and
+    more than one process.  Only figures written to file (not shown on screen or drawn with bokeh) should be
+    rendered in parallel.  Use as a context manager - all figures are saved on exit.
+    """
+
+    def __init__(self, processes=1):
+        """
+        :param processes: number of processes to spawn for rendering (int)
+        """
+        self.processes = processes
+        self._pool = None
+        self._held = None  # first figure - rendered in this process if it is the only figure
+        self._pending = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def render(self, plot, *args, **kwargs):
+        """
+        Draw and save a figure.  Waits if too many figures are queued, so at most a few figures' data are
+        held at a time.
+        :param plot: plotting function - eg. den_plot (function)
+        :param args: arguments for plot
+        :param kwargs: keyword arguments for plot
+        """
+        job = (plot, args, kwargs)
+        if self.processes <= 1:
+            _render_job(job)
+            return
+        if self._pool is None:
+            if self._held is None:
+                self._held = job
+                return
+            self._pool = Pool(self.processes)
+            self._submit(self._held)
+            self._held = None
+        self._submit(job)
+
+    def close(self):
+        """
+        Wait for all figures to be saved
+        """
+        try:
+            if self._held is not None:
+                job, self._held = self._held, None
+                _render_job(job)
+            while self._pending:
+                self._pending.popleft().get()
+        finally:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+    def _submit(self, job):
+        """
+        Queue a figure for a worker process
+        :param job: (plot, args, kwargs) (tuple)
+        """
+        self._pending.append(self._pool.apply_async(_render_job, (job,)))
+        while len(self._pending) > self.processes * _PENDING_PER_PROCESS:
+            self._pending.popleft().get()
+
+
+def _render_job(job):
+    """
+    Draw and save a figure
+    :param job: (plotting function, args, kwargs) (tuple)
+    """
+    plot, args, kwargs = job
+    plot(*args, **kwargs)
+
+
+def _new_figure(onscreen):
+    """
+    New figure with a single set of axes.  Figures shown on screen are pyplot figures; figures only written
+    to file are independent of pyplot, so pyplot's global state isn't touched.
+    :param onscreen: show plot on screen (bool)
+    :return: matplotlib.figure.Figure, matplotlib.axes.Axes
+    """
+    if onscreen:
+        _load_pyplot(onscreen)
+        fig = plt.figure()
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure()
+    return fig, fig.add_subplot(1, 1, 1)
+
+
+def _load_pyplot(onscreen):
+    """
+    Import matplotlib.pyplot when a figure is first shown.  The non-interactive Agg backend is used unless
+    the plot is shown on screen, or a backend has already been chosen (MPLBACKEND, or pyplot imported
+    elsewhere eg. in a notebook), so batch runs don't need a display.
+    :param onscreen: show plot on screen (bool)
+    """
+    global plt
+    if plt is None:
+        import matplotlib
+        if not onscreen and 'MPLBACKEND' not in os.environ and 'matplotlib.pyplot' not in sys.modules:
+            matplotlib.use('Agg')
+        import matplotlib.pyplot
+        plt = matplotlib.pyplot
+
+
+def _load_bokeh():
+    """
+    Import bokeh for inline notebook plots
+    :return: bokeh.plotting.figure, bokeh.plotting.show
+    """
+    from bokeh.plotting import figure, show
+    from bokeh.io import output_notebook
+    output_notebook()
+    return figure, show
+
+
+def _figure_points(fig, dpi=None):
+    """
+    No. of profile points needed for a figure - based on its width in pixels
+    :param fig: figure (matplotlib.figure.Figure)
+    :param dpi: output resolution (int) - figure dpi if None
+    :return: no. of points (int)
+    """
+    return int(fig.get_size_inches()[0] * (dpi or fig.dpi)) * _POINTS_PER_PIXEL
+
+
+def _profile_points(x_ref, y_profiles, points):
+    """
+    Co-ords for plotting profiles at the output resolution.  Long profiles are binned, keeping the peak of
+    each bin (see pp.ProfilePyramid), so large references plot quickly and give small files.
+    :param x_ref: x co-ords - consecutive reference positions (list(int))
+    :param y_profiles: y co-ords for each profile [y_fwd (list(float)),...] (list)
+    :param points: no. of points needed (int)
+    :return: x co-ords, [y co-ords,...] - one for each profile (list)
+    """
+    if len(x_ref) <= points:
+        return x_ref, y_profiles
+    x_binned, y_binned = pp.ProfilePyramid(numpy.vstack(y_profiles)).for_plot(points)
+    return x_binned + x_ref[0], list(y_binned)
+
+
+def _generate_profile(fig, ax, file_fig, file_name, onscreen, plot_y_lim, dpi=None):
     """
     Generate profile
+    :param fig: figure (matplotlib.figure.Figure)
+    :param ax: profile axes (matplotlib.axes.Axes)
     :param file_fig: output plot to pdf (bool)
     :param file_name: output filename (str)
     :param onscreen: show plot on screen (bool)
     :param plot_y_lim: + / - y-axis limit (int)
+    :param dpi: resolution of PNG files and rasterized series (int) - figure dpi if None
     """
     if plot_y_lim != 0:
-        ylim(-plot_y_lim, plot_y_lim)
-    _shared_plot(file_fig, file_name, onscreen)
+        ax.set_ylim(-plot_y_lim, plot_y_lim)
+    _shared_plot(fig, file_fig, file_name, onscreen, dpi)
 
 
-def _pub_plot():
+def _pub_plot(ax):
     """
     Remove axis, labels, legend from plot
+    :param ax: axes (matplotlib.axes.Axes)
     """
-    plt.tick_params(
+    ax.tick_params(
         axis='both',  # changes apply to the x-axis
         which='both',  # both major and minor ticks are affected
         bottom='on',  # ticks along the bottom edge are off
@@ -188,34 +410,46 @@ def _pub_plot():
         labelleft='off',
         labelright='off',
         labelsize=15)  # labels along the bottom edge are off
-    _clear_frame()
+    _clear_frame(ax)
 
 
-def _clear_frame(ax=None):
+def _clear_frame(ax):
     """
     Removes frame for publishing plots
+    :param ax: axes (matplotlib.axes.Axes)
     """
-    if ax is None:
-        ax = plt.gca()
     ax.xaxis.set_visible(True)
     ax.yaxis.set_visible(True)
     for spine in ax.spines.values():
         spine.set_visible(False)
 
 
-def _shared_plot(file_fig, file_name, onscreen):
+def _shared_plot(fig, file_fig, file_name, onscreen, dpi=None):
     """
-
-    :param file_fig: output plot to pdf (bool)
-    :param file_name: output filename (str)
+    Show and save a figure - as PNG if the file name ends with .png, else PDF
+    :param fig: figure (matplotlib.figure.Figure)
+    :param file_fig: output plot to file (bool)
+    :param file_name: output filename (str), or multi-page PDF (PdfPages)
     :param onscreen: show plot on screen (bool)
+    :param dpi: resolution of PNG files and rasterized series (int) - figure dpi if None
     """
-    fig1 = plt.gcf()
     if onscreen:
         plt.show()
     if file_fig:
-        fig1.savefig(file_name, format='pdf')
-    plt.close(fig1)
+        fig.savefig(file_name, format=_file_format(file_name), dpi=dpi or 'figure')
+    if onscreen:
+        plt.close(fig)
+
+
+def _file_format(file_name):
+    """
+    Figure file format from a file name
+    :param file_name: output filename (str), or multi-page PDF (PdfPages)
+    :return: 'png' or 'pdf' (str)
+    """
+    if isinstance(file_name, str) and file_name.lower().endswith('.png'):
+        return 'png'
+    return 'pdf'
 
 
 def _nt_colour(nt):
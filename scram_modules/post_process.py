@@ -5,38 +5,175 @@ Alignment post-processing module
 import numpy
 
 
-def fill_in_zeros(fwd_rvs_align_list, ref_len, nt):
+def fill_in_zeros(fwd_rvs_align_list, ref_len, nt, coverage=False):
     """
-    Generate alignment counts for every nucleotide in the reference
+    Generate alignment counts for every nucleotide in the reference.  Counts for alignments at the
+    same position are summed.
     :param fwd_rvs_align_list:  list of sorted forwards and reverse alignments
     :param ref_len: number of nucleotides in the reference sequence (int)
     :param nt: length of the aligned reads (int)
-    :return: reference_x_axis ([0,0,...] (list(int)) - length of refseq seq,
-             fwd_alignment_y_axis [2,4,5.2,6,....] (list(float)) - sense strand alignment count (positive),
-             fwd_rvs_align_list [-3,-4,-5.6,...] (list(float)) - antisense strand alignment count (negative)
+    :param coverage: count each read at every nucleotide it covers, rather than at the centre of the
+                     read (bool)
+    :return: reference_x_axis [0,1,2,...] (numpy.array(int)) - length of refseq seq,
+             fwd_alignment_y_axis [2,4,5.2,6,....] (numpy.array(float)) - sense strand alignment count (positive),
+             revs_alignment_y_axis [-3,-4,-5.6,...] (numpy.array(float)) - antisense strand alignment count
+             (negative)
     """
-    sorted_fwd_alignment = fwd_rvs_align_list[0]
-    sorted_rvs_alignment = fwd_rvs_align_list[1]
+    fwd_positions, fwd_counts = _alignment_arrays(fwd_rvs_align_list[0])
+    rvs_positions, rvs_counts = _alignment_arrays(fwd_rvs_align_list[1])
+
+    reference_x_axis = numpy.arange(ref_len)
+    if coverage:
+        # rvs alignments are at the 5' end of the read on the antisense strand - the highest position covered
+        fwd_alignment_y_axis = _coverage(fwd_positions, fwd_counts, ref_len, nt)
+        revs_alignment_y_axis = _coverage(rvs_positions - (nt - 1), rvs_counts, ref_len, nt)
+    else:
+        # Note alignment position for graphing is in the centre of the read (and not the 5' end)
+        fwd_alignment_y_axis = numpy.bincount(fwd_positions + nt // 2, weights=fwd_counts, minlength=ref_len)
+        revs_alignment_y_axis = numpy.bincount(rvs_positions - nt // 2, weights=rvs_counts, minlength=ref_len)
 
-    fwd_alignment_y_axis = [0] * ref_len
-    revs_alignment_y_axis = [0] * ref_len
+    return reference_x_axis, fwd_alignment_y_axis[:ref_len], revs_alignment_y_axis[:ref_len]
+
+
+def _alignment_arrays(sorted_alignment):
+    """
+    Positions and counts for alignments as arrays
+    :param sorted_alignment: [(position, count),...] (list)
+    :return: positions (numpy.array(int)), counts (numpy.array(float))
+    """
+    alignment_array = numpy.array(sorted_alignment, dtype=float).reshape(-1, 2)
+    return alignment_array[:, 0].astype(numpy.int64), alignment_array[:, 1]
+
+
+def _coverage(start_positions, counts, ref_len, nt):
+    """
+    Sum of counts for reads covering each nucleotide - counts are added at the first nucleotide covered
+    and subtracted after the last, then accumulated along the reference
+    :param start_positions: lowest position covered by each read (numpy.array(int))
+    :param counts: read counts (numpy.array(float))
+    :param ref_len: number of nucleotides in the reference sequence (int)
+    :param nt: length of the aligned reads (int)
+    :return: coverage (numpy.array(float))
+    """
+    changes = numpy.bincount(numpy.concatenate((start_positions, start_positions + nt)),
+                             weights=numpy.concatenate((counts, -counts)), minlength=ref_len + 1)
+    return numpy.cumsum(changes[:ref_len])
 
-    reference_x_axis = list(range(0, ref_len))
-    #Note alignment position for graphing is in the centre of the read (and not the 5' end)
-    for i in sorted_fwd_alignment:
-        fwd_alignment_y_axis[i[0] + int(nt / 2)] = i[1]
-    for i in sorted_rvs_alignment:
-        revs_alignment_y_axis[i[0] - int(nt / 2)] = i[1]
 
-    # #Coverage per nucleotide instead - maybe use?
-    #     for i in sorted_fwd_alignment:
-    #         for j in range(nt):
-    #             fwd_alignment_y_axis[i[0]+j]+=i[1]
-    #     for i in sorted_rvs_alignment:
-    #         for j in range(nt):
-    #             revs_alignment_y_axis[i[0]-j]+=i[1]
+class ProfilePyramid(object):
+    """
+    Binned summaries of profiles at several resolutions, for plotting long references.  Level 0 is the
+    profiles themselves, and each level above has bins factor times wider than the level below, up to a
+    level with no more than min_bins bins.  Each level holds the sum, max and min of each bin.
+    """
 
-    return reference_x_axis, fwd_alignment_y_axis, revs_alignment_y_axis
+    def __init__(self, profiles, factor=4, min_bins=256):
+        """
+        :param profiles: profile, or profiles of the same length - one per row (numpy.array(float))
+        :param factor: no. of bins merged into each bin of the next level (int)
+        :param min_bins: stop when a level has this many bins or fewer (int)
+        """
+        profiles = numpy.atleast_2d(numpy.asarray(profiles, dtype=float))
+        self.ref_len = profiles.shape[-1]
+        self.levels = [(1, profiles, profiles, profiles)]  # [(bin size, sums, maxs, mins),...]
+        while self.levels[-1][1].shape[-1] > min_bins:
+            bin_size, sums, maxs, mins = self.levels[-1]
+            self.levels.append((bin_size * factor, _merge_bins(sums, factor, numpy.add),
+                                _merge_bins(maxs, factor, numpy.maximum), _merge_bins(mins, factor, numpy.minimum)))
+
+    def __len__(self):
+        return len(self.levels)  # number of levels
+
+    def level(self, points):
+        """
+        Coarsest level with at least the given number of bins
+        :param points: no. of bins needed - eg. the output width in pixels (int)
+        :return: level (int)
+        """
+        for level in range(len(self.levels) - 1, 0, -1):
+            if self.levels[level][1].shape[-1] >= points:
+                return level
+        return 0
+
+    def bins(self, level):
+        """
+        Bins for a level
+        :param level: level (int)
+        :return: first position in each bin (numpy.array(int)), bin widths (numpy.array(int))
+        """
+        bin_size = self.levels[level][0]
+        starts = numpy.arange(0, self.ref_len, bin_size)
+        return starts, numpy.minimum(bin_size, self.ref_len - starts)
+
+    def summary(self, level, stat):
+        """
+        Summary of each bin for a level
+        :param level: level (int)
+        :param stat: 'sum', 'max', 'min' or 'mean' (str)
+        :return: summaries - one row per profile (numpy.array(float, ndim=2))
+        """
+        if stat == 'mean':
+            return self.levels[level][1] / self.bins(level)[1]
+        return self.levels[level][['sum', 'max', 'min'].index(stat) + 1]
+
+    def peaks(self, level):
+        """
+        Value furthest from zero in each bin for a level - keeps the outline of positive (fwd) and negative
+        (rvs) profiles when plotted
+        :param level: level (int)
+        :return: peaks - one row per profile (numpy.array(float, ndim=2))
+        """
+        maxs = self.summary(level, 'max')
+        mins = self.summary(level, 'min')
+        return numpy.where(maxs >= -mins, maxs, mins)
+
+    def for_plot(self, points):
+        """
+        Bin centres and peaks for the level matching the output resolution
+        :param points: no. of bins needed - eg. the output width in pixels (int)
+        :return: x co-ords (numpy.array(float)), y co-ords - one row per profile (numpy.array(float, ndim=2))
+        """
+        level = self.level(points)
+        starts, widths = self.bins(level)
+        return starts + (widths - 1) / 2.0, self.peaks(level)
+
+
+def _merge_bins(values, factor, ufunc):
+    """
+    Merge each group of factor adjacent bins - the last group may be incomplete
+    :param values: bin values - one row per profile (numpy.array(float, ndim=2))
+    :param factor: no. of bins in each group (int)
+    :param ufunc: reduction (numpy.ufunc)
+    :return: merged bin values (numpy.array(float, ndim=2))
+    """
+    n_bins = values.shape[-1]
+    complete = n_bins - n_bins % factor
+    merged = numpy.empty((values.shape[0], -(-n_bins // factor)))
+    for row, merged_row in zip(values, merged):
+        complete_row = merged_row[:complete // factor]
+        complete_row[:] = row[0:complete:factor]
+        for offset in range(1, factor):  # strided views - much faster than reducing a short trailing axis
+            ufunc(complete_row, row[offset:complete:factor], out=complete_row)
+        if complete < n_bins:
+            merged_row[-1] = ufunc.reduce(row[complete:])
+    return merged
+
+
+def run_lengths(values):
+    """
+    Run-length encode a profile - runs of equal values, with runs of zeros removed
+    :param values: value at each position (numpy.array(float))
+    :return: first position of each run (numpy.array(int)), last position + 1 of each run (numpy.array(int)),
+             value of each run (numpy.array(float))
+    """
+    values = numpy.asarray(values)
+    if len(values) == 0:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64), values
+    starts = numpy.concatenate(([0], numpy.flatnonzero(values[1:] != values[:-1]) + 1))
+    ends = numpy.append(starts[1:], len(values))
+    run_values = values[starts]
+    non_zero = run_values != 0
+    return starts[non_zero], ends[non_zero], run_values[non_zero]
 
 
 def calc_alignments_by_strand(fwd_rvs_align_list):
@@ -57,32 +194,57 @@ def calc_alignments_by_strand(fwd_rvs_align_list):
 
 def smooth(x, window_len, window='hamming'):
     """
-    Smoothing function from scipy cookbook
-    :param x:
-    :param window_len:
-    :param window:
-    :return:
+    Smoothing function from scipy cookbook.  The ends of each profile are padded with reflected copies,
+    then convolved with a normalised window - a running sum for flat windows, FFT convolution for large
+    tapered windows - so the cost doesn't depend on window size for long profiles.
+    :param x: profile (numpy.array(float)), or profiles to smooth together - one per row
+              (numpy.array(float, ndim=2))
+    :param window_len: window size (int)
+    :param window: window type - 'flat', 'hanning', 'hamming', 'bartlett' or 'blackman' (str)
+    :return: smoothed profile/s, same shape as x (numpy.array(float))
     """
 
-    if x.ndim != 1:
-        raise ValueError("smooth only accepts 1 dimension arrays.")
+    if x.ndim not in (1, 2):
+        raise ValueError("smooth only accepts 1 or 2 dimension arrays.")
 
-    if x.size < window_len:
+    if x.shape[-1] < window_len:
         raise ValueError("Input vector needs to be bigger than window size.")
 
     if window_len < 6:
         return x
 
-    if not window in ['flat', 'hanning', 'hamming', 'bartlett', 'blackman']:
+    if window not in _WINDOWS:
         raise ValueError("Window is one of 'flat', 'hanning', 'hamming', 'bartlett', 'blackman'")
 
-    s = numpy.r_[x[window_len - 1:0:-1], x, x[-1:-window_len:-1]]
+    s = numpy.concatenate((x[..., window_len - 1:0:-1], x, x[..., -1:-window_len:-1]), axis=-1)
     if window == 'flat':  # moving average
-        w = numpy.ones(window_len, 'd')
+        sums = numpy.cumsum(s, axis=-1)
+        y = numpy.concatenate((sums[..., window_len - 1:window_len], sums[..., window_len:] - sums[..., :-window_len]),
+                              axis=-1) / window_len
     else:
-        w = eval('numpy.' + window + '(window_len)')
+        w = _WINDOWS[window](window_len)
+        y = _convolve_valid(s, w / w.sum())
+    start = (window_len - 1) // 2
+    return y[..., start:start + x.shape[-1]]
 
-    y = numpy.convolve(w / w.sum(), s, mode='valid')
-    return y[int(window_len / 2 - 1):-int(window_len / 2)]
 
+_WINDOWS = {'flat': numpy.ones, 'hanning': numpy.hanning, 'hamming': numpy.hamming, 'bartlett': numpy.bartlett,
+            'blackman': numpy.blackman}
+_FFT_MIN_WINDOW = 64  # direct convolution is faster for smaller windows
 
+
+def _convolve_valid(s, w):
+    """
+    Convolve each row with a window, keeping only points where the window fully overlaps the row
+    :param s: profile/s - one per row (numpy.array(float))
+    :param w: window (numpy.array(float))
+    :return: convolved profile/s (numpy.array(float))
+    """
+    n = s.shape[-1]
+    if len(w) < _FFT_MIN_WINDOW:
+        if s.ndim == 1:
+            return numpy.convolve(w, s, mode='valid')
+        return numpy.array([numpy.convolve(w, row, mode='valid') for row in s]).reshape(s.shape[:-1] + (-1,))
+    fft_len = 1 << (n + len(w) - 2).bit_length()  # power of 2 >= full convolution length
+    full = numpy.fft.irfft(numpy.fft.rfft(s, fft_len) * numpy.fft.rfft(w, fft_len), fft_len)
+    return full[..., len(w) - 1:n]
@@ -1,7 +1,12 @@
+import mmap
+import os
 import time
 from scram_modules.dna import DNA
 from termcolor import colored
 
+_INDEX_SUFFIX = '.scram.idx'  # not '.fai' - samtools indexes keep only the first word of each header
+_INDEX_HEADER = '#scram reference index'
+
 
 class RefSeq(object):
     """
@@ -38,36 +43,210 @@ class RefSeq(object):
         :param ref_file: /path/to/refseq/file
         """
         print(colored("\n-----------------LOADING REFERENCE----------------", 'green'))
-        start = time.clock()
-        # ref_dict = {}
+        start = time.time()
         ref_count = 0
-        loaded_ref = open(ref_file, 'r')
-        full_len_seq = ''
-        key = ''
-        first_header = True
+        for header, sequence in read_ref_file(ref_file):
+            self._internal_dict[header] = sequence
+            ref_count += 1
+        print('\n----{0} reference sequences loaded for alignment----'.format(ref_count))
+        if len(self._internal_dict) == 1:
+            print("\n{0} length = {1} bp".format(ref_file.split('/')[-1], len(sequence)))
+        print("\nReference sequence loading time = " + str((time.time() - start)) + " seconds\n")
+
+
+def read_ref_file(ref_file):
+    """
+    Stream reference sequences from a FASTA file one at a time, so only a single sequence is held in
+    memory.  Sequence lines are collected and joined once per sequence.
+
+    :param ref_file: /path/to/refseq/file (str)
+    :return: generator of (header (str), sequence (DNA)), in file order
+    """
+    with open(ref_file, 'r') as loaded_ref:
+        header = None
+        seq_lines = []
         for line in loaded_ref:
-            if line[0] == '>' and full_len_seq == '':
-                key = line.strip()
-                ref_count += 1
-                if first_header:
-                    first_header = False
-            elif line[0] == '>' and full_len_seq != '':
-                self._internal_dict.update({key: DNA(full_len_seq)})
-                key = line.strip()
-                full_len_seq = ''
-                ref_count += 1
-            elif line[0] == '' and full_len_seq != '':
-                self._internal_dict.update({key: DNA(full_len_seq)})
-                key = line.strip()
-                full_len_seq = ''
-            elif line[0] == '':
-                pass
+            if line[0] == '>':
+                if header is not None:
+                    yield header, DNA(''.join(seq_lines))
+                header = line.strip()
+                seq_lines = []
             else:
-                full_len_seq += line.strip().upper()
+                seq_lines.append(line.strip())
+        if header is not None or seq_lines:
+            yield header if header is not None else '', DNA(''.join(seq_lines))
 
-        self._internal_dict.update({key: DNA(full_len_seq)})
-        loaded_ref.close()
-        print('\n----{0} reference sequences loaded for alignment----'.format(ref_count))
-        if len(self._internal_dict) == 1:
-            print("\n{0} length = {1} bp".format(ref_file.split('/')[-1], len(full_len_seq)))
-        print("\nReference sequence loading time = " + str((time.clock() - start)) + " seconds\n")
+
+class IndexedRefSeq(object):
+    """
+    Reference sequences read on demand from a memory-mapped FASTA file, using a .fai-style index stored
+    next to it (ref_file + '.scram.idx').  Sequences are in file order, and can be fetched by header or ordinal.
+
+    The first index line holds the size of the indexed reference file.  Each following line is: header
+    (without '>'), sequence length, byte offset of the first base, bases per line, bytes per line (tab
+    separated).  The full header line is kept, so headers match RefSeq.
+    """
+
+    def __init__(self):
+        self.ref_file = None
+        self._headers = []  # headers in file order
+        self._entries = []  # (length, offset, line bases, line width) for each ordinal
+        self._ordinals = {}  # header:ordinal
+        self._mmap = None  # opened on first fetch - in the process that uses it
+
+    def __getitem__(self, header):
+        return self.sequence(self._ordinals[header])  # get DNA sequence for header
+
+    def __iter__(self):
+        return ((header, self.sequence(ordinal)) for ordinal, header in enumerate(self._headers))
+
+    def __len__(self):
+        return len(self._headers)  # number of refseq seqs in object
+
+    def __getstate__(self):
+        return {'ref_file': self.ref_file, '_headers': self._headers, '_entries': self._entries}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._ordinals = {header: ordinal for ordinal, header in enumerate(self._headers)}
+        self._mmap = None
+
+    def headers(self):
+        return list(self._headers)  # headers in file order
+
+    def sequences(self):
+        return (self.sequence(ordinal) for ordinal in range(len(self._headers)))  # DNA sequences
+
+    def ref_length(self, ordinal):
+        """
+        Length of a reference sequence, from the index
+        :param ordinal: position of the sequence in the reference file (int)
+        :return: sequence length (int)
+        """
+        return self._entries[ordinal][0]
+
+    def sequence(self, ordinal, start=0, stop=None):
+        """
+        Reference sequence or region - only the pages of the file holding the region are read
+        :param ordinal: position of the sequence in the reference file (int)
+        :param start: first base, 0-based (int)
+        :param stop: end of region, exclusive - None for the end of the sequence (int)
+        :return: sequence (DNA)
+        """
+        length, offset, line_bases, line_width = self._entries[ordinal]
+        stop = length if stop is None else min(stop, length)
+        if start >= stop:
+            return DNA('')
+        if self._mmap is None:
+            with open(self.ref_file, 'rb') as loaded_ref:
+                self._mmap = mmap.mmap(loaded_ref.fileno(), 0, access=mmap.ACCESS_READ)
+        first = offset + (start // line_bases) * line_width + start % line_bases
+        last = offset + ((stop - 1) // line_bases) * line_width + (stop - 1) % line_bases
+        return DNA(self._mmap[first:last + 1].translate(None, b'\r\n').decode('ascii', 'replace'))
+
+    def load_ref_file(self, ref_file):
+        """
+        Load the index for a reference file in FASTA format - the index is built and saved if it is
+        missing, older than the reference file or for a reference file of a different size
+
+        :param ref_file: /path/to/refseq/file (str)
+        :raises ValueError: if a sequence has lines of different lengths, so can't be indexed
+        """
+        print(colored("\n-----------------LOADING REFERENCE----------------", 'green'))
+        start = time.time()
+        self.ref_file = ref_file
+        self._mmap = None
+        index_file = ref_file + _INDEX_SUFFIX
+        ref_size = os.path.getsize(ref_file)
+        index = None
+        if os.path.isfile(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(ref_file):
+            index = _read_ref_index(index_file, ref_size)
+        if index is not None:
+            self._headers, self._entries = index
+        else:
+            print("\nIndexing {0}\n".format(ref_file.split('/')[-1]))
+            self._headers, self._entries = _build_ref_index(ref_file)
+            try:
+                _write_ref_index(index_file, ref_size, self._headers, self._entries)
+            except (IOError, OSError) as e:
+                print("\nReference index not saved: {0}\n".format(e))
+        self._ordinals = {header: ordinal for ordinal, header in enumerate(self._headers)}
+        print('\n----{0} reference sequences indexed for alignment----'.format(len(self._headers)))
+        if len(self._headers) == 1:
+            print("\n{0} length = {1} bp".format(ref_file.split('/')[-1], self.ref_length(0)))
+        print("\nReference index loading time = " + str((time.time() - start)) + " seconds\n")
+
+
+def _build_ref_index(ref_file):
+    """
+    Index a reference file in FASTA format in a single pass
+    :param ref_file: /path/to/refseq/file (str)
+    :return: headers (list(str)), [(length, offset, line bases, line width),...] (list)
+    """
+    headers = []
+    entries = []
+    with open(ref_file, 'rb') as loaded_ref:
+        pos = 0
+        record = None  # [header, length, offset, line bases, line width, short line seen]
+        for line in loaded_ref:
+            if line[:1] == b'>':
+                if record is not None:
+                    headers.append(record[0])
+                    entries.append(tuple(record[1:5]))
+                record = [line.strip().decode(), 0, pos + len(line), 0, 0, False]
+            elif record is None:
+                if line.strip():
+                    raise ValueError("{0} doesn't start with a FASTA header".format(ref_file))
+            else:
+                line_bases = len(line.rstrip(b'\r\n'))
+                if line_bases == 0:
+                    record[5] = True  # blank lines are only allowed after a sequence
+                elif record[5] or (record[3] and (line_bases > record[3] or
+                                                  (line_bases == record[3] and len(line) != record[4]))):
+                    raise ValueError("{0} has lines of different lengths in {1}".format(ref_file, record[0]))
+                elif record[3] == 0:
+                    record[3], record[4] = line_bases, len(line)
+                elif line_bases < record[3]:
+                    record[5] = True  # only the last line of a sequence can be short
+                record[1] += line_bases
+            pos += len(line)
+        if record is not None:
+            headers.append(record[0])
+            entries.append(tuple(record[1:5]))
+    return headers, entries
+
+
+def _read_ref_index(index_file, ref_size):
+    """
+    Read a reference index file
+    :param index_file: /path/to/index/file (str)
+    :param ref_size: size of the reference file in bytes (int)
+    :return: headers (list(str)), [(length, offset, line bases, line width),...] (list) or None if the index
+             isn't a scram index for a reference file of ref_size bytes
+    """
+    headers = []
+    entries = []
+    with open(index_file, 'r') as loaded_index:
+        if loaded_index.readline() != "{0}\t{1}\n".format(_INDEX_HEADER, ref_size):
+            return None
+        for line in loaded_index:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 5:
+                return None
+            headers.append('>' + fields[0])
+            entries.append(tuple(int(field) for field in fields[1:5]))
+    return headers, entries
+
+
+def _write_ref_index(index_file, ref_size, headers, entries):
+    """
+    Write a reference index file
+    :param index_file: /path/to/index/file (str)
+    :param ref_size: size of the reference file in bytes (int)
+    :param headers: headers (list(str))
+    :param entries: [(length, offset, line bases, line width),...] (list)
+    """
+    with open(index_file, 'w') as out_index:
+        out_index.write("{0}\t{1}\n".format(_INDEX_HEADER, ref_size))
+        for header, entry in zip(headers, entries):
+            out_index.write('\t'.join([header[1:]] + [str(field) for field in entry]) + '\n')
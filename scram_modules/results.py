@@ -0,0 +1,130 @@
+"""
+Columnar binary results
+
+den/mnt3dm alignments and profiles, and CDP count tables, can be saved as NumPy .npz files - a zip archive
+holding a .npy file for each column and a JSON metadata record.  Strings are fixed width (numpy 'S' or 'U'),
+so load_results memory-maps each column of an uncompressed file straight from the archive rather than reading
+and parsing it.  Compressed files are smaller, but columns are read into memory.
+
+Kinds of results and their columns:
+
+den - alignments and profile for a single reference, for each read length aligned
+    nt, read, position, count - an alignment row for each read at each position, by length then position
+                                (as the CSV output: 1-based 5' position, antisense counts negative)
+    profile_nt, profile_position, profile_fwd, profile_rvs - profile at every position with a non-zero count
+                                on either strand (1-based position; as plotted, before smoothing)
+cdp - aligned read counts for multiple references
+    headers - reference headers
+    sample_names - sample names
+    counts - row for each reference, column for each sample
+"""
+import json
+import zipfile
+
+import numpy
+from numpy.lib import format as npy_format
+
+_RESULTS_VERSION = 1  # change if the saved format changes
+_META = '_meta'
+
+
+def save_results(file_name, kind, columns, compress=False, **meta):
+    """
+    Save columns as a .npz file
+    :param file_name: path/to/results.npz (str)
+    :param kind: kind of results - eg. 'den' or 'cdp' (str)
+    :param columns: {column name (str): column (numpy.array)} (dict)
+    :param compress: compress columns - they can't then be memory-mapped (bool)
+    :param meta: metadata - must be JSON serialisable
+    """
+    meta = dict(meta, version=_RESULTS_VERSION, kind=kind)
+    save = numpy.savez_compressed if compress else numpy.savez
+    with open(file_name, 'wb') as out_results:
+        save(out_results, **dict(columns, **{_META: numpy.array(json.dumps(meta))}))
+
+
+def load_results(file_name, mmap=True):
+    """
+    Load saved results
+    :param file_name: path/to/results.npz (str)
+    :param mmap: memory-map columns rather than reading them into memory (bool)
+    :return: Results
+    """
+    return Results(file_name, mmap)
+
+
+class Results(object):
+    """
+    Columns of saved results - each column is loaded when first accessed
+    """
+
+    def __init__(self, file_name, mmap=True):
+        """
+        :param file_name: path/to/results.npz (str)
+        :param mmap: memory-map columns rather than reading them into memory (bool)
+        """
+        self.file_name = file_name
+        self.mmap = mmap
+        with zipfile.ZipFile(file_name) as archive:
+            self._members = {info.filename[:-len('.npy')]: info for info in archive.infolist()}
+            if _META not in self._members:
+                raise ValueError("{0} is not a saved results file".format(file_name))
+            self.meta = json.loads(str(numpy.load(archive.open(self._members[_META].filename))))
+        if self.meta['version'] != _RESULTS_VERSION:
+            raise ValueError("{0} is not a version {1} results file".format(file_name, _RESULTS_VERSION))
+        self.kind = self.meta['kind']
+        self._columns = {}
+
+    def __getitem__(self, column):
+        if column not in self._columns:
+            if column == _META or column not in self._members:
+                raise KeyError(column)
+            self._columns[column] = self._load_column(self._members[column])
+        return self._columns[column]
+
+    def __contains__(self, column):
+        return column != _META and column in self._members
+
+    def __iter__(self):
+        return iter(self.columns())
+
+    def __len__(self):
+        return len(self._members) - 1  # number of columns
+
+    def columns(self):
+        return sorted(column for column in self._members if column != _META)  # column names
+
+    def _load_column(self, info):
+        """
+        Load a column from the archive - memory-mapped if possible
+        :param info: archive member for the column (zipfile.ZipInfo)
+        :return: column (numpy.array or numpy.memmap)
+        """
+        if self.mmap and info.compress_type == zipfile.ZIP_STORED:
+            column = self._map_column(info)
+            if column is not None:
+                return column
+        with zipfile.ZipFile(self.file_name) as archive:
+            return numpy.load(archive.open(info.filename))
+
+    def _map_column(self, info):
+        """
+        Memory-map an uncompressed column in place in the archive
+        :param info: archive member for the column (zipfile.ZipInfo)
+        :return: column (numpy.memmap) or None if the column can't be mapped (empty, 0-d or object arrays)
+        """
+        with open(self.file_name, 'rb') as in_results:
+            # data follows the local file header - a fixed 30 bytes, the file name and an extra field
+            in_results.seek(info.header_offset + 26)
+            name_len, extra_len = numpy.frombuffer(in_results.read(4), dtype='<u2').tolist()
+            in_results.seek(info.header_offset + 30 + name_len + extra_len)
+            version = npy_format.read_magic(in_results)
+            if version == (1, 0):
+                shape, fortran_order, dtype = npy_format.read_array_header_1_0(in_results)
+            else:
+                shape, fortran_order, dtype = npy_format.read_array_header_2_0(in_results)
+            offset = in_results.tell()
+        if dtype.hasobject or not shape or 0 in shape:
+            return None
+        return numpy.memmap(self.file_name, dtype=dtype, mode='r', offset=offset, shape=shape,
+                            order='F' if fortran_order else 'C')
@@ -0,0 +1,154 @@
+"""
+On-disk cache of parsed collapsed FASTA sequence files
+
+Each entry holds the reads and raw counts loaded from a single sequence file with a set of length and count
+cutoffs, and is keyed by a hash of the file contents and the cutoffs - a cached entry is reused for an
+identical file at any path.  Reads are stored as 2-bit packed codes (see kmer module) with their lengths;
+reads that can't be packed (longer than kmer.MAX_KMER_LEN or containing non-ACGT characters) are stored as
+sequences.
+
+The cache directory is set with the SCRAM_CACHE_DIR environment variable (default ~/.cache/scram) and its
+size with SCRAM_CACHE_MB (default 4096).  When the cache is full the least recently used entries are
+removed.  SCRAM_CACHE_MB=0 turns caching off.
+"""
+import hashlib
+import os
+import tempfile
+import numpy
+from scram_modules import kmer
+
+_CACHE_VERSION = 1  # change if the entry format changes
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def cache_dir():
+    """
+    Cache directory
+    :return: path/to/cache (str)
+    """
+    return os.environ.get('SCRAM_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'scram'))
+
+
+def cache_size():
+    """
+    Max. total size of cache entries
+    :return: size in bytes (int)
+    """
+    return int(float(os.environ.get('SCRAM_CACHE_MB', 4096)) * 1024 * 1024)
+
+
+def cache_file(seq_file, sRNA_max_len_cutoff, min_reads, sRNA_min_len_cutoff):
+    """
+    Cache entry path for a sequence file loaded with a set of cutoffs
+    :param seq_file: path/to/seq/file (str)
+    :param sRNA_max_len_cutoff: only reads  of length <= sRNA_max_len_cutoff loaded (int)
+    :param min_reads: only reads >= min_reads count loaded (int)
+    :param sRNA_min_len_cutoff: only reads  of length >= sRNA_min_len_cutoff loaded (int)
+    :return: path/to/cache/entry (str) or None if caching is off
+    """
+    if cache_size() <= 0:
+        return None
+    return os.path.join(cache_dir(), "v{0}_{1}_{2}_{3}_{4}.npz".format(_CACHE_VERSION, file_hash(seq_file),
+                                                                       sRNA_max_len_cutoff, min_reads,
+                                                                       sRNA_min_len_cutoff))
+
+
+def file_hash(seq_file):
+    """
+    Hash of the contents of a file
+    :param seq_file: path/to/seq/file (str)
+    :return: hex digest (str)
+    """
+    file_digest = hashlib.sha1()
+    with open(seq_file, 'rb') as loaded_seq:
+        for block in iter(lambda: loaded_seq.read(_HASH_BLOCK_SIZE), b''):
+            file_digest.update(block)
+    return file_digest.hexdigest()
+
+
+def load(entry_file):
+    """
+    Load a cache entry, and mark it as most recently used
+    :param entry_file: path/to/cache/entry (str)
+    :return: {'codes': packed codes (numpy.array(uint64)), 'lengths': read lengths (numpy.array(uint8)),
+             'counts': raw counts (numpy.array(int64)), 'other_seqs': unpacked reads (numpy.array(bytes)),
+             'other_counts': raw counts (numpy.array(int64)), 'read_count': total read count (int)} (dict)
+             or None if there is no entry
+    """
+    if entry_file is None or not os.path.isfile(entry_file):
+        return None
+    try:
+        with numpy.load(entry_file) as loaded_entry:
+            entry = {name: loaded_entry[name] for name in loaded_entry.files}
+        entry['read_count'] = int(entry['read_count'])
+        os.utime(entry_file, None)
+    except Exception as e:
+        print("\nCached sequence file {0} not loaded: {1}".format(entry_file, e))
+        return None
+    return entry
+
+
+def save(entry_file, reads, read_count):
+    """
+    Save a cache entry, then remove least recently used entries until the cache fits in cache_size()
+    :param entry_file: path/to/cache/entry (str)
+    :param reads: [(read sequence (str), raw count (int)),...] (list)
+    :param read_count: total read count for the file (inside of cutoffs) (int)
+    """
+    if entry_file is None:
+        return
+    codes = []
+    lengths = []
+    counts = []
+    other_seqs = []
+    other_counts = []
+    for sequence, count in reads:
+        code = kmer.encode(sequence) if len(sequence) <= kmer.MAX_KMER_LEN else None
+        if code is None:
+            other_seqs.append(sequence.encode('ascii', 'replace'))
+            other_counts.append(count)
+        else:
+            codes.append(code)
+            lengths.append(len(sequence))
+            counts.append(count)
+    temp_file = None
+    try:
+        entry_arrays = {'codes': numpy.array(codes, dtype=numpy.uint64),
+                        'lengths': numpy.array(lengths, dtype=numpy.uint8),
+                        'counts': numpy.array(counts, dtype=numpy.int64),
+                        'other_seqs': numpy.array(other_seqs, dtype=bytes),
+                        'other_counts': numpy.array(other_counts, dtype=numpy.int64),
+                        'read_count': numpy.array(read_count, dtype=numpy.int64)}
+        os.makedirs(os.path.dirname(entry_file), exist_ok=True)
+        fd, temp_file = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(entry_file))
+        with os.fdopen(fd, 'wb') as out_entry:
+            numpy.savez(out_entry, **entry_arrays)
+        os.replace(temp_file, entry_file)  # entries appear complete to other processes
+        temp_file = None
+        _evict(os.path.dirname(entry_file), cache_size())
+    except Exception as e:  # a failed cache write never stops the sequence file loading
+        print("\nSequence file not cached: {0}".format(e))
+        if temp_file is not None and os.path.isfile(temp_file):
+            os.remove(temp_file)
+
+
+def _evict(entry_dir, max_size):
+    """
+    Remove least recently used cache entries until the total size is <= max_size
+    :param entry_dir: path/to/cache (str)
+    :param max_size: size in bytes (int)
+    """
+    entries = []
+    for name in os.listdir(entry_dir):
+        if name.endswith('.npz'):
+            entry_stat = os.stat(os.path.join(entry_dir, name))
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, name))
+    total_size = sum(entry[1] for entry in entries)
+    for _, size, name in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(os.path.join(entry_dir, name))
+        except OSError:
+            pass  # already removed by another process
+        total_size -= size
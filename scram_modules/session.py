@@ -0,0 +1,247 @@
+"""
+Session module
+
+In-process analysis for interactive use (eg. Jupyter notebooks).  A Session keeps loaded samples (read sets,
+with the read tables built for alignment) and references (or their indexes) in memory, so repeated analyses
+of the same files don't reload them.  The least recently used entries are evicted when the cache is over its
+size limit.  Analyses return numpy arrays rather than writing files - plotting is optional.
+
+    session = Session(max_cache_mb=8192)
+    x_ref, y_fwd, y_rvs = session.profile("seq1.fa", "ref.fa", [21, 22, 24], smooth_win_size=50, plot=True)
+    headers, sample_names, counts = session.counts(["seq1.fa", "seq2.fa"], "cDNAs.fa", 21)
+
+The scram_modules package must be importable - install it, or put the repository directory on the module
+search path.
+"""
+import os
+from collections import OrderedDict
+
+import numpy
+
+_READ_BYTES = 120  # approx. memory for each stored read - dict entry, packed key, count and read table entries
+_INDEX_ENTRY_BYTES = 200  # approx. memory for each sequence in a reference index
+_PLOT_LENGTHS = ([21, 22, 24],)  # read lengths plotted together, rather than as a single length
+
+
+class Session(object):
+    """
+    Cached samples and references, and analyses that return numpy arrays
+    """
+
+    def __init__(self, max_cache_mb=4096, min_read_size=18, max_read_size=32, min_read_no=1, processes=4,
+                 chunk_size=500):
+        """
+        :param max_cache_mb: max. approx. memory used by cached samples and references (float)
+        :param min_read_size: exclude reads with lengths < min_read_size (int)
+        :param max_read_size: exclude reads with lengths > max_read_size (int)
+        :param min_read_no: exclude reads with counts below min_read_no (int)
+        :param processes: no. of processes for long references and multiple reference alignments (int)
+        :param chunk_size: no. of reference sequences sent to a process at a time for counts (int)
+        """
+        self.cache = SizedCache(int(max_cache_mb * 1024 * 1024))
+        self.min_read_size = min_read_size
+        self.max_read_size = max_read_size
+        self.min_read_no = min_read_no
+        self.processes = processes
+        self.chunk_size = chunk_size
+
+    def sample(self, seq_files):
+        """
+        Load a sample, or get it from the cache
+        :param seq_files: path/to/seq, or [path/to/seq, path/to/seq2,...] - counts are averaged (str or list)
+        :return: reads (PackedSRNASeq), sample name (str)
+        """
+        seq_files = [seq_files] if isinstance(seq_files, str) else list(seq_files)
+        key = ('sample', _file_keys(seq_files), self.min_read_size, self.max_read_size, self.min_read_no)
+        if key not in self.cache:
+            from scram_modules import analysis
+            seq, seq_name = analysis.load_sample(seq_files, self.min_read_size, self.max_read_size,
+                                                 self.min_read_no)
+            self.cache.add(key, (seq, seq_name), len(seq) * _READ_BYTES)
+        return self.cache[key]
+
+    def reference(self, ref_file):
+        """
+        Load a reference (its index, if it can be indexed), or get it from the cache
+        :param ref_file: path/to/reference (str)
+        :return: reference sequences (IndexedRefSeq or RefSeq)
+        """
+        key = ('reference',) + _file_keys([ref_file])
+        if key not in self.cache:
+            from scram_modules import den as dn
+            refs = dn.load_refs(ref_file)
+            if hasattr(refs, 'ref_length'):  # index only - sequences are read from the file when needed
+                nbytes = len(refs) * _INDEX_ENTRY_BYTES
+            else:
+                nbytes = sum(len(seq) for seq in refs.sequences()) + len(refs) * _INDEX_ENTRY_BYTES
+            self.cache.add(key, refs, nbytes)
+        return self.cache[key]
+
+    def profile(self, seq_files, ref_file, nt=21, header=None, smooth_win_size=0, split=False, coverage=False,
+                plot=False, ylim=0, pub=False, bok=False):
+        """
+        Alignment profile of a sample to a single reference sequence
+        :param seq_files: path/to/seq, or [path/to/seq, path/to/seq2,...] (str or list)
+        :param ref_file: path/to/reference (str)
+        :param nt: read length, or lengths, to align (int or list(int))
+        :param header: reference sequence header - needed if the reference has more than one sequence (str)
+        :param smooth_win_size: window size for smoothing the profile - not smoothed if < 6 or longer than the
+                                reference (int)
+        :param split: split aligned read counts by number of times a read aligns (bool)
+        :param coverage: per-nucleotide coverage rather than counts at read centres (bool)
+        :param plot: plot the profile - a single length, or 21, 22 and 24 nt (bool)
+        :param ylim: +/- y-axis limit for the plot (int)
+        :param pub: publication plot with no axes, legend (bool)
+        :param bok: plot with bokeh (bool)
+        :return: x_ref (numpy.array(int)), y_fwd - reads per million reads on the sense strand at each position,
+                 y_rvs - negative counts for the antisense strand; a row for each length if nt is a list
+                 (numpy.array(float))
+        """
+        from scram_modules import den as dn
+        from scram_modules import post_process as pp
+        lengths = [nt] if isinstance(nt, int) else list(nt)
+        seq, seq_name = self.sample(seq_files)
+        refs = self.reference(ref_file)
+        headers = list(refs.headers())
+        if header is None:
+            if len(headers) != 1:
+                raise ValueError("{0} has {1} sequences - a header is needed".format(ref_file, len(headers)))
+            header = headers[0]
+        single_ref = refs[header]
+        alignments = dn.align_ref(seq, single_ref, lengths, self.processes)
+        if split:
+            for length in lengths:
+                alignments[length].split()
+        graphs_processed = [pp.fill_in_zeros(alignments[length].aln_by_ref_pos(length), len(single_ref), length,
+                                             coverage)
+                            for length in lengths]
+        y_fwd = numpy.vstack([graph_processed[1] for graph_processed in graphs_processed])
+        y_rvs = numpy.vstack([graph_processed[2] for graph_processed in graphs_processed])
+        if 5 < smooth_win_size <= len(single_ref):  # a reference shorter than the window isn't smoothed
+            y_smoothed = pp.smooth(numpy.vstack([y_fwd, y_rvs]), smooth_win_size, window='blackman')
+            y_fwd, y_rvs = y_smoothed[:len(lengths)], y_smoothed[len(lengths):]
+        x_ref = graphs_processed[0][0]
+        if plot:
+            _plot_profile(x_ref, y_fwd, y_rvs, lengths, dn.ref_output_names([header])[0], ylim, pub, bok)
+        if isinstance(nt, int):
+            return x_ref, y_fwd[0], y_rvs[0]
+        return x_ref, y_fwd, y_rvs
+
+    def counts(self, samples, ref_file, nt=21, split=False, plot=False, pub=False, bok=False):
+        """
+        Aligned read counts for each sample and reference sequence
+        :param samples: samples - each path/to/seq, or [path/to/seq, path/to/seq2,...] (list)
+        :param ref_file: path/to/reference (str)
+        :param nt: read length to align (int)
+        :param split: split aligned read counts by number of times a read aligns (bool)
+        :param plot: scatter plot of two samples' counts - references with alignments only (bool)
+        :param pub: publication plot with no axes, legend (bool)
+        :param bok: plot with bokeh (bool)
+        :return: reference headers (list(str)), sample names (list(str)), reads per million reads aligned -
+                 a row for each reference, column for each sample (numpy.array(float, ndim=2))
+        """
+        from scram_modules import cdp
+        loaded_samples = [self.sample(seq_files) for seq_files in samples]
+        read_sets = [seq for seq, _ in loaded_samples]
+        sample_names = [seq_name for _, seq_name in loaded_samples]
+        headers = []
+        refs, indexed_refs = cdp.ref_records(ref_file, self.reference(ref_file))
+        ref_counts = cdp.ref_counts(refs, headers, read_sets, nt, self.processes, self.chunk_size, indexed_refs,
+                                    split)
+        if plot:
+            if len(samples) != 2:
+                raise ValueError("Counts for 2 samples are plotted - not {0}".format(len(samples)))
+            from scram_modules import plot_reads as pr
+            counts_by_ref = {headers[ordinal]: tuple(ref_counts[ordinal].tolist())
+                             for ordinal in numpy.flatnonzero(ref_counts.any(axis=1))}
+            pr.cdp_plot(counts_by_ref, sample_names[0], sample_names[1], nt, not bok, False, None, pub, bok)
+        return headers, sample_names, ref_counts
+
+    def clear(self):
+        """
+        Remove all cached samples and references
+        """
+        self.cache.clear()
+
+
+class SizedCache(object):
+    """
+    Least recently used cache with a limit on the total size of its entries.  Entry sizes are given when they
+    are added; an entry larger than the limit is kept until the next entry is added.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        :param max_bytes: max. total size of entries (int)
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key: (value, size) - least recently used first
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __getitem__(self, key):
+        value, size = self._entries.pop(key)
+        self._entries[key] = (value, size)  # most recently used
+        return value
+
+    def __len__(self):
+        return len(self._entries)  # number of entries
+
+    def add(self, key, value, size):
+        """
+        Add an entry, evicting the least recently used entries to keep within max_bytes
+        :param key: key (hashable)
+        :param value: cached object
+        :param size: approx. size of the object (int)
+        """
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        while self._entries and self.nbytes + size > self.max_bytes:
+            self.nbytes -= self._entries.popitem(last=False)[1][1]
+        self._entries[key] = (value, size)
+        self.nbytes += size
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        self._entries.clear()
+        self.nbytes = 0
+
+
+def _file_keys(in_files):
+    """
+    Cache key for files - a changed file gives a new key
+    :param in_files: file paths (list(str))
+    :return: (absolute path, modification time, size) for each file (tuple)
+    """
+    keys = []
+    for in_file in in_files:
+        file_stat = os.stat(in_file)
+        keys.append((os.path.abspath(in_file), file_stat.st_mtime, file_stat.st_size))
+    return tuple(keys)
+
+
+def _plot_profile(x_ref, y_fwd, y_rvs, lengths, ref_name, ylim, pub, bok):
+    """
+    Plot a profile on screen (or inline in a notebook)
+    :param x_ref: positions (numpy.array(int))
+    :param y_fwd: sense strand profile - a row for each length (numpy.array(float, ndim=2))
+    :param y_rvs: antisense strand profile - a row for each length (numpy.array(float, ndim=2))
+    :param lengths: read lengths (list(int))
+    :param ref_name: reference name for the x-axis label (str)
+    :param ylim: +/- y-axis limit (int)
+    :param pub: publication plot with no axes, legend (bool)
+    :param bok: plot with bokeh (bool)
+    """
+    from scram_modules import plot_reads as pr
+    if len(lengths) == 1:
+        pr.den_plot(x_ref, y_fwd[0], y_rvs[0], lengths[0], False, None, not bok, ref_name, ylim, pub, bok)
+    elif sorted(lengths) in _PLOT_LENGTHS:
+        rows = {length: row for row, length in enumerate(lengths)}
+        pr.den_multi_plot_21_22_24(x_ref, y_fwd[rows[21]], y_rvs[rows[21]], y_fwd[rows[22]], y_rvs[rows[22]],
+                                   y_fwd[rows[24]], y_rvs[rows[24]], False, None, not bok, ref_name, ylim, pub, bok)
+    else:
+        raise ValueError("Profiles of a single length, or 21, 22 and 24 nt, are plotted - not {0}".format(lengths))
@@ -6,8 +6,16 @@ Automatic normalisation to RPMR once loaded from file
 '''
 
 from scram_modules.dna import DNA
+from scram_modules import kmer
+from scram_modules import seqcache
+import numpy
 import time
 
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
 
 class SRNASeq(object):
     def __init__(self):
@@ -34,6 +42,89 @@ class SRNASeq(object):
     def counts(self):
         return self._internal_dict.values()  # returns a view all counts
 
+    def iter_ref_kmers(self, ref, nt):
+        """
+        Query keys for each position of a reference, in the form used to index this object
+        :param ref: reference sequence (DNA)
+        :param nt: read length to align (int)
+        :return: generator of (fwd query (DNA), rvs query (DNA)) - rvs query is taken from the
+        reverse complement at the same offset
+        """
+        ref_complement = ref.complement()
+        for count_start in range(len(ref) - (nt - 1)):
+            yield DNA(ref[count_start:(count_start + nt)]), DNA(ref_complement[count_start:(count_start + nt)])
+
+    def ref_hits(self, ref_kmers):
+        """
+        Align reads to a reference
+        :param ref_kmers: reference and read length to align (kmer.RefKmers)
+        :return: positions (numpy.array(int)), read keys [DNA,...] (list),
+                 counts - negative for the rvs strand (numpy.array(float)), ordered as the reference is scanned
+        """
+        ref_len = len(ref_kmers.ref)
+        positions = []
+        reads = []
+        counts = []
+        count_start = 0
+        for query_seq_fwd, query_seq_rvs in self.iter_ref_kmers(ref_kmers.ref, ref_kmers.nt):
+            if query_seq_fwd in self:
+                positions.append(count_start)
+                reads.append(query_seq_fwd)
+                counts.append(self[query_seq_fwd])
+            if query_seq_rvs in self:
+                positions.append(ref_len - count_start - 1)
+                reads.append(query_seq_rvs)
+                counts.append(0 - self[query_seq_rvs])
+            count_start += 1
+        return numpy.array(positions, dtype=numpy.int64), reads, numpy.array(counts, dtype=float)
+
+    def ref_hits_by_length(self, multi_ref_kmers):
+        """
+        Align reads of several lengths to a reference
+        :param multi_ref_kmers: reference and read lengths to align (kmer.MultiRefKmers)
+        :return: {read length (int): (positions, read keys, counts) - see ref_hits} (dict)
+        """
+        return {nt: self.ref_hits(kmer.RefKmers(multi_ref_kmers.ref, nt)) for nt in multi_ref_kmers.lengths}
+
+    def lengths(self):
+        """
+        Lengths of stored reads
+        :return: sorted read lengths (list(int))
+        """
+        return sorted(set(len(sRNA) for sRNA in self.sRNAs()))
+
+    def shared(self):
+        """
+        Read-only copy of the stored reads for worker processes
+        :return: this object - DNA keyed reads can't be placed in shared memory (SRNASeq)
+        """
+        return self
+
+    def to_dna(self, key):
+        """
+        Read sequence for a key returned by iter_ref_kmers or ref_hits
+        :param key: query key (DNA)
+        :return: read sequence (DNA)
+        """
+        return key
+
+    def _seq_key(self, sequence):
+        """
+        Key used to store a read loaded from file
+        :param sequence: read sequence (str)
+        :return: key (DNA)
+        """
+        return DNA(sequence)
+
+    def _cached_seq_keys(self, codes, lengths):
+        """
+        Keys for reads loaded from the sequence file cache
+        :param codes: packed codes (numpy.array(uint64))
+        :param lengths: read lengths (numpy.array(uint8))
+        :return: keys [DNA,...] (list)
+        """
+        return [DNA(kmer.decode(code, nt)) for code, nt in zip(codes.tolist(), lengths.tolist())]
+
     def load_seq_file(self, seq_file, sRNA_max_len_cutoff, min_reads, sRNA_min_len_cutoff):
         """
         Load collapsed FASTA  sequence file
@@ -48,16 +139,16 @@ class SRNASeq(object):
         :param sRNA_min_len_cutoff: only reads  of length >= sRNA_min_len_cutoff loaded (int)
 
         """
-        start = time.clock()
+        start = time.time()
         _seq_dict = {}
         read_count = self._single_seq_file_load(_seq_dict, min_reads, sRNA_max_len_cutoff, sRNA_min_len_cutoff,
                                                 seq_file)
 
         # final RPMR - could simplify in future
         for sRNA, count in _seq_dict.items():
-            self._internal_dict[sRNA] = count * (float(1000000) / read_count)
+            self[sRNA] = count * (float(1000000) / read_count)
         print("\n{0} load time = {1} seconds for {2} reads".format(seq_file.split('/')[-1],
-                                                                   str((time.clock() - start)), read_count))
+                                                                   str((time.time() - start)), read_count))
         print("-" * 50)
 
     def load_seq_file_arg_list(self, seq_file_arg_list, sRNA_max_len_cutoff,
@@ -76,14 +167,14 @@ class SRNASeq(object):
         :param sRNA_min_len_cutoff: only reads  of length >= sRNA_min_len_cutoff loaded (int)
 
         """
-        start = time.clock()
+        start = time.time()
 
         # read_count_1 = 0
         indv_seq_dict_list = []  # list of individual seq_dics
         indv_seq_dict_list_factor = []  # RPMR for each seq. disc
 
         for seq_file in seq_file_arg_list:
-            single_start = time.clock()
+            single_start = time.time()
             _seq_dict = {}
             read_count = self._single_seq_file_load(_seq_dict, min_reads, sRNA_max_len_cutoff, sRNA_min_len_cutoff,
                                                     seq_file)
@@ -91,22 +182,23 @@ class SRNASeq(object):
             indv_seq_dict_list.append(_seq_dict)
             indv_seq_dict_list_factor.append(float(1000000) / read_count)
             print("\n{0} load time = {1} seconds for {2} reads".format(seq_file.split('/')[-1],
-                                                                       str((time.clock() - single_start)), read_count))
+                                                                       str((time.time() - single_start)), read_count))
         for sRNA, count in indv_seq_dict_list[0].items():
             if all(sRNA in d for d in indv_seq_dict_list):
                 total_count = 0
                 for i in range(len(indv_seq_dict_list)):
                     total_count += (indv_seq_dict_list[i][sRNA] * indv_seq_dict_list_factor[i])
 
-                self._internal_dict[sRNA] = total_count / len(indv_seq_dict_list)
+                self[sRNA] = total_count / len(indv_seq_dict_list)
 
         print("\nTotal sequence file processing time = " \
-              + str((time.clock() - start)) + " seconds\n")
+              + str((time.time() - start)) + " seconds\n")
         print("-" * 50)
 
     def _single_seq_file_load(self, _seq_dict, min_reads, sRNA_max_len_cutoff, sRNA_min_len_cutoff, seq_file):
         """
-        Internal class function for a single seq file load.  No normalisation.
+        Internal class function for a single seq file load.  No normalisation.  Reads are loaded from the
+        sequence file cache if the file has been loaded with the same cutoffs before (see seqcache module).
         :param _seq_dict: class internal dict for loading collapsed fasta file {sRNA;count} (dict)
         :param min_reads: only reads >= min_reads count loaded (int)
         :param sRNA_max_len_cutoff: only reads  of length <= sRNA_max_len_cutoff loaded (int)
@@ -114,7 +206,15 @@ class SRNASeq(object):
         :param seq_file: path/to/seq/file (str)
         :return: total read count for the file (inside of cutoffs) (int)
         """
+        entry_file = seqcache.cache_file(seq_file, sRNA_max_len_cutoff, min_reads, sRNA_min_len_cutoff)
+        entry = seqcache.load(entry_file)
+        if entry is not None:
+            _seq_dict.update(zip(self._cached_seq_keys(entry['codes'], entry['lengths']), entry['counts'].tolist()))
+            for sequence, count in zip(entry['other_seqs'].tolist(), entry['other_counts'].tolist()):
+                _seq_dict[self._seq_key(sequence.decode('ascii'))] = count
+            return entry['read_count']
         read_count = 0
+        cache_reads = []  # [(read, count),...] for the sequence file cache
         with open(seq_file, 'r') as loaded_seq:
             next_line = False
             for line in loaded_seq:
@@ -123,10 +223,694 @@ class SRNASeq(object):
                     count = int(line.split('-')[1])
                     next_line = True
                 elif count >= min_reads and sRNA_min_len_cutoff <= len(line) <= sRNA_max_len_cutoff and next_line:
-                    _seq_dict[DNA(line)] = count
+                    if entry_file is not None:
+                        cache_reads.append((line, count))
+                    _seq_dict[self._seq_key(line)] = count
                     read_count += count
                     next_line = False
                 else:
                     pass
         loaded_seq.close()
-        return read_count
\ No newline at end of file
+        seqcache.save(entry_file, cache_reads, read_count)
+        return read_count
+
+
+class PackedSRNASeq(SRNASeq):
+    """
+    Small RNA storage keyed by length-aware 2-bit packed integers (see kmer module) rather than DNA objects.
+
+    Reads can be accessed with a DNA/str sequence or an integer key.  Reads containing non-ACGT characters
+    cannot be packed - they are kept in a side table keyed by sequence, and matched by sequence to the
+    reference windows that contain the same characters.
+    """
+
+    def __init__(self):
+        super(PackedSRNASeq, self).__init__()
+        self._other_reads = {}  # {sequence (str): count} - reads that can't be packed
+        self._read_tables = None  # {nt: (sorted codes, counts)} - built on first alignment
+        self._other_tables = None  # {nt: (sequences, counts, {sequence: read index})} - built on first alignment
+
+    def __setitem__(self, sequence, count):
+        key = self._key(sequence)
+        if key is None:
+            self._other_reads[str(sequence).upper()] = count  # {sequence:count}
+        else:
+            self._internal_dict[key] = count  # {key:count}
+        self._read_tables = None
+        self._other_tables = None
+
+    def __getitem__(self, sequence):
+        key = self._key(sequence)
+        if key is None:
+            return self._other_reads[str(sequence).upper()]
+        return self._internal_dict[key]  # get count for sequence
+
+    def __iter__(self):
+        for key, count in self._internal_dict.items():
+            yield DNA(kmer.decode_key(key)), count
+        for sequence, count in self._other_reads.items():
+            yield DNA(sequence), count
+
+    def __len__(self):
+        return len(self._internal_dict) + len(self._other_reads)  # number of sequences stored
+
+    def __contains__(self, sequence):
+        key = self._key(sequence)
+        if key is None:
+            return sequence is not None and str(sequence).upper() in self._other_reads
+        return key in self._internal_dict  # true if sequence stored
+
+    def sRNAs(self):
+        return [DNA(kmer.decode_key(key)) for key in self._internal_dict] + \
+            [DNA(sequence) for sequence in self._other_reads]  # list of all sequences
+
+    def counts(self):
+        return list(self._internal_dict.values()) + list(self._other_reads.values())  # list of all counts
+
+    def read_table(self, nt):
+        """
+        Sorted codes and counts for all reads of a single length
+        :param nt: read length (int)
+        :return: sorted codes (numpy.array(uint64)), counts (numpy.array(float))
+        """
+        return self._get_read_tables().get(nt, (numpy.zeros(0, dtype=numpy.uint64), numpy.zeros(0)))
+
+    def other_read_table(self, nt):
+        """
+        Reads of a single length with non-ACGT characters.  Their read indices in alignments follow the packed
+        reads - read i of this table is read len(read_table(nt)[0]) + i.
+        :param nt: read length (int)
+        :return: sequences (list(str)), counts (numpy.array(float))
+        """
+        return self._get_other_tables().get(nt, ([], numpy.zeros(0), {}))[:2]
+
+    def _get_read_tables(self):
+        """
+        Read tables for all lengths - built on first use
+        :return: {nt: (sorted codes (numpy.array(uint64)), counts (numpy.array(float)))} (dict)
+        """
+        if self._read_tables is None:
+            self._read_tables = self._build_read_tables()
+        return self._read_tables
+
+    def _get_other_tables(self):
+        """
+        Tables of reads with non-ACGT characters for all lengths <= kmer.MAX_KMER_LEN - built on first use
+        :return: {nt: (sequences (list(str)), counts (numpy.array(float)),
+                 {sequence (str): read index (int)} (dict))} (dict)
+        """
+        if self._other_tables is None:
+            sequences_by_len = {}
+            for sequence in sorted(self._other_reads):
+                if len(sequence) <= kmer.MAX_KMER_LEN:
+                    sequences_by_len.setdefault(len(sequence), []).append(sequence)
+            self._other_tables = {}
+            for nt, sequences in sequences_by_len.items():
+                first_idx = len(self.read_table(nt)[0])
+                self._other_tables[nt] = (sequences,
+                                          numpy.array([self._other_reads[sequence] for sequence in sequences],
+                                                      dtype=float),
+                                          {sequence: first_idx + i for i, sequence in enumerate(sequences)})
+        return self._other_tables
+
+    def _other_index(self, nt):
+        """
+        Read indices of reads with non-ACGT characters, for alignment - see kmer.MultiRefKmers.hits
+        :param nt: read length (int)
+        :return: {sequence (str): read index (int)} (dict)
+        """
+        return self._get_other_tables().get(nt, (None, None, {}))[2]
+
+    def _build_read_tables(self):
+        """
+        Split stored reads by length into sorted code and count arrays
+        :return: {nt: (sorted codes (numpy.array(uint64)), counts (numpy.array(float)))} (dict)
+        """
+        codes_by_len = {}
+        counts_by_len = {}
+        for key, count in self._internal_dict.items():
+            nt = kmer.key_length(key)
+            if nt <= kmer.MAX_KMER_LEN:
+                codes_by_len.setdefault(nt, []).append(key ^ kmer.length_flag(nt))
+                counts_by_len.setdefault(nt, []).append(count)
+        read_tables = {}
+        for nt, codes in codes_by_len.items():
+            codes = numpy.array(codes, dtype=numpy.uint64)
+            order = numpy.argsort(codes)
+            read_tables[nt] = codes[order], numpy.array(counts_by_len[nt], dtype=float)[order]
+        return read_tables
+
+    def ref_hits(self, ref_kmers):
+        """
+        Align reads to a reference using vectorised k-mer matching
+        :param ref_kmers: reference and read length to align (kmer.RefKmers)
+        :return: positions (numpy.array(int)), read keys [int,...] (list),
+                 counts - negative for the rvs strand (numpy.array(float)), ordered as the reference is scanned
+        """
+        nt = ref_kmers.nt
+        if nt > kmer.MAX_KMER_LEN:
+            return super(PackedSRNASeq, self).ref_hits(ref_kmers)
+        return self._hits_to_reads(nt, ref_kmers.hits(self.read_table(nt)[0], self._other_index(nt)))
+
+    def ref_hits_by_length(self, multi_ref_kmers):
+        """
+        Align reads of several lengths to a reference in a single pass using vectorised k-mer matching
+        :param multi_ref_kmers: reference and read lengths to align (kmer.MultiRefKmers)
+        :return: {read length (int): (positions, read keys, counts) - see ref_hits} (dict)
+        """
+        if multi_ref_kmers.lengths and multi_ref_kmers.lengths[-1] > kmer.MAX_KMER_LEN:
+            return super(PackedSRNASeq, self).ref_hits_by_length(multi_ref_kmers)
+        read_tables = {nt: self.read_table(nt)[0] for nt in multi_ref_kmers.lengths}
+        other_reads = {nt: self._other_index(nt) for nt in multi_ref_kmers.lengths}
+        return {nt: self._hits_to_reads(nt, hits)
+                for nt, hits in multi_ref_kmers.hits(read_tables, other_reads).items()}
+
+    def lengths(self):
+        """
+        Lengths of stored reads that can be aligned in a single pass (<= kmer.MAX_KMER_LEN)
+        :return: sorted read lengths (list(int))
+        """
+        return sorted(set(self._get_read_tables()) | set(self._get_other_tables()))
+
+    def _hits_to_reads(self, nt, hits):
+        """
+        Convert read table indices from kmer alignment to read keys and counts
+        :param nt: read length (int)
+        :param hits: positions, read table indices, sense strand hits - see kmer.RefKmers.hits
+        :return: positions (numpy.array(int)), read keys - int, or str for reads with non-ACGT characters (list),
+                 counts - negative for the rvs strand (numpy.array(float))
+        """
+        positions, read_idx, sense = hits
+        read_codes, read_counts = self.read_table(nt)
+        flag = kmer.length_flag(nt)
+        packed = read_idx < len(read_codes)
+        if packed.all():
+            reads = [flag | code for code in read_codes[read_idx].tolist()]
+        else:
+            other_seqs, other_counts = self.other_read_table(nt)
+            read_counts = numpy.concatenate((read_counts, other_counts))
+            read_keys = numpy.empty(len(read_idx), dtype=object)
+            read_keys[packed] = [flag | code for code in read_codes[read_idx[packed]].tolist()]
+            read_keys[~packed] = [other_seqs[i] for i in (read_idx[~packed] - len(read_codes)).tolist()]
+            reads = read_keys.tolist()
+        counts = numpy.where(sense, read_counts[read_idx], 0 - read_counts[read_idx])
+        return positions, reads, counts
+
+    def shared(self):
+        """
+        Read-only copy of the stored reads in shared memory for worker processes - see SharedArrays
+        :return: SharedSRNASeq, or this object if shared memory isn't available (Python < 3.8)
+        """
+        if shared_memory is None:
+            return self
+        return SharedSRNASeq(self)
+
+    def to_dna(self, key):
+        """
+        Read sequence for a key returned by iter_ref_kmers or ref_hits
+        :param key: query key (DNA, str or int)
+        :return: read sequence (DNA)
+        """
+        packed_key = self._key(key)
+        if packed_key is None:
+            return DNA(str(key))
+        return DNA(kmer.decode_key(packed_key))
+
+    def _seq_key(self, sequence):
+        """
+        Key used to store a read loaded from file
+        :param sequence: read sequence (str)
+        :return: key (int), or the sequence (str) if the read can't be packed
+        """
+        key = kmer.encode_key(sequence)
+        return sequence.upper() if key is None else key
+
+    def _cached_seq_keys(self, codes, lengths):
+        """
+        Keys for reads loaded from the sequence file cache
+        :param codes: packed codes (numpy.array(uint64))
+        :param lengths: read lengths (numpy.array(uint8))
+        :return: keys [int,...] (list)
+        """
+        return [code | kmer.length_flag(nt) for code, nt in zip(codes.tolist(), lengths.tolist())]
+
+    @staticmethod
+    def _key(sequence):
+        """
+        Convert a sequence to a key - integer keys are passed through
+        :param sequence: read sequence (DNA or str) or key (int)
+        :return: key (int) or None
+        """
+        if sequence is None or isinstance(sequence, int):
+            return sequence
+        return kmer.encode_key(str(sequence))
+
+
+class SharedSRNASeq(PackedSRNASeq):
+    """
+    Read-only packed small RNA storage with its read tables in shared memory - see SharedArrays
+    """
+
+    def __init__(self, seq_dict):
+        """
+        :param seq_dict: reads to share - reads longer than kmer.MAX_KMER_LEN aren't included (PackedSRNASeq)
+        """
+        super(SharedSRNASeq, self).__init__()
+        arrays = {}
+        self._total = 0
+        for nt in seq_dict.lengths():
+            arrays[nt, 'codes'], arrays[nt, 'counts'] = seq_dict.read_table(nt)
+            sequences, counts = seq_dict.other_read_table(nt)
+            self._other_reads.update(zip(sequences, counts.tolist()))
+            self._total += len(arrays[nt, 'codes']) + len(sequences)
+        self._arrays = SharedArrays(arrays)
+
+    def __getstate__(self):
+        return {'arrays': self._arrays, 'total': self._total, 'other_reads': self._other_reads}
+
+    def __setstate__(self, state):
+        self._internal_dict = {}
+        self._other_reads = state['other_reads']
+        self._read_tables = None
+        self._other_tables = None
+        self._arrays = state['arrays']
+        self._total = state['total']
+
+    def __setitem__(self, sequence, count):
+        raise TypeError("SharedSRNASeq is read-only")
+
+    def __getitem__(self, sequence):
+        nt, pos = self._find(sequence)
+        if nt is None:
+            return self._other_reads[str(sequence).upper()]
+        if pos is None:
+            raise KeyError(sequence)
+        return float(self.read_table(nt)[1][pos])  # get count for sequence
+
+    def __iter__(self):
+        for nt, (codes, counts) in sorted(self._get_read_tables().items()):
+            for code, count in zip(codes.tolist(), counts.tolist()):
+                yield DNA(kmer.decode(code, nt)), count
+        for sequence, count in self._other_reads.items():
+            yield DNA(sequence), count
+
+    def __len__(self):
+        return self._total  # number of sequences stored
+
+    def __contains__(self, sequence):
+        nt, pos = self._find(sequence)
+        if nt is None:
+            return sequence is not None and str(sequence).upper() in self._other_reads
+        return pos is not None  # true if sequence stored
+
+    def sRNAs(self):
+        return [sRNA for sRNA, count in self]  # list of all sequences
+
+    def counts(self):
+        return [count for sRNA, count in self]  # list of all counts
+
+    def shared(self):
+        """
+        :return: this object - already in shared memory
+        """
+        return self
+
+    def release(self):
+        """
+        Release the shared memory block - see SharedArrays.release
+        """
+        self._read_tables = None  # arrays must be released before the block is closed
+        self._arrays.release()
+
+    def _build_read_tables(self):
+        """
+        Arrays for each read length backed by the shared memory block
+        :return: {nt: (sorted codes (numpy.array(uint64)), counts (numpy.array(float)))} (dict)
+        """
+        return {nt: (self._arrays[nt, 'codes'], self._arrays[nt, 'counts'])
+                for nt, name in self._arrays.names() if name == 'codes'}
+
+    def _find(self, sequence):
+        """
+        Find a read in the read tables
+        :param sequence: read sequence (DNA or str) or key (int)
+        :return: read length (int) or None if the read can't be packed, position in read table (int) or None if
+                 not stored
+        """
+        key = self._key(sequence)
+        if key is None:
+            return None, None
+        nt = kmer.key_length(key)
+        codes = self.read_table(nt)[0]
+        if nt > kmer.MAX_KMER_LEN or len(codes) == 0:
+            return nt, None
+        code = numpy.uint64(key ^ kmer.length_flag(nt))
+        pos = int(numpy.searchsorted(codes, code))
+        if pos < len(codes) and codes[pos] == code:
+            return nt, pos
+        return nt, None
+
+
+class MultiSRNASeq(object):
+    """
+    Reads from several read sets merged into a single table for each read length.  Each read in the table has
+    a count for every read set it's in, so a single alignment to a reference gives the alignments for every
+    read set.
+
+    Read sets must have packed read tables (PackedSRNASeq) to be merged - otherwise, or for reads longer than
+    kmer.MAX_KMER_LEN, reads are aligned for each read set in turn.  Reads with non-ACGT characters are merged
+    into rows after the packed reads, and matched by sequence.
+    """
+
+    def __init__(self, read_sets, lengths):
+        """
+        :param read_sets: [seq_1 (PackedSRNASeq),...] (list)
+        :param lengths: read lengths to align (list(int))
+        """
+        self.read_sets = read_sets
+        self._n_sets = len(read_sets)
+        self._lengths = sorted(set(lengths))
+        self._merged = max(self._lengths) <= kmer.MAX_KMER_LEN and \
+            all(hasattr(read_set, 'read_table') for read_set in read_sets)
+        self._read_tables = None  # {nt: (sorted codes, row starts, read set indices, counts)} - built on first use
+        self._other_rows = {}  # {nt: {sequence: row}} - rows for reads with non-ACGT characters
+
+    def __len__(self):
+        return self._n_sets  # number of read sets
+
+    def read_table(self, nt):
+        """
+        Merged reads of a single length - entries for the read with sorted code codes[i] are
+        row_starts[i]:row_starts[i + 1].  Rows from len(codes) are reads with non-ACGT characters - see other_rows.
+        :param nt: read length (int)
+        :return: sorted codes (numpy.array(uint64)), row starts (numpy.array(int)),
+                 read set index for each entry (numpy.array(int)), count for each entry (numpy.array(float))
+        """
+        if self._read_tables is None:
+            self._read_tables = self._build_read_tables()
+        return self._read_tables[nt]
+
+    def other_rows(self, nt):
+        """
+        Rows of the merged read table for reads of a single length with non-ACGT characters
+        :param nt: read length (int)
+        :return: {sequence (str): row (int)} (dict)
+        """
+        self.read_table(nt)
+        return self._other_rows[nt]
+
+    def _build_read_tables(self):
+        """
+        Merge read tables for each length from all read sets
+        :return: {nt: (sorted codes, row starts, read set indices, counts) - see read_table} (dict)
+        """
+        read_tables = {}
+        for nt in self._lengths:
+            tables = [read_set.read_table(nt) for read_set in self.read_sets]
+            codes = numpy.concatenate([numpy.zeros(0, dtype=numpy.uint64)] + [table[0] for table in tables])
+            counts = numpy.concatenate([numpy.zeros(0)] + [table[1] for table in tables])
+            set_idx = numpy.repeat(numpy.arange(self._n_sets), [len(table[0]) for table in tables])
+            order = numpy.lexsort((set_idx, codes))
+            codes = codes[order]
+            first = numpy.flatnonzero(numpy.concatenate(([True], codes[1:] != codes[:-1])))[:len(codes)]
+            row_starts = [first]
+            set_idx = [set_idx[order]]
+            counts = [counts[order]]
+            other_entries = {}  # {sequence: ([read set index,...], [count,...])}
+            for read_set_idx, read_set in enumerate(self.read_sets):
+                for sequence, count in zip(*read_set.other_read_table(nt)):
+                    entries = other_entries.setdefault(sequence, ([], []))
+                    entries[0].append(read_set_idx)
+                    entries[1].append(count)
+            n_entries = len(codes)
+            self._other_rows[nt] = {}
+            for row, sequence in enumerate(sorted(other_entries), len(first)):
+                self._other_rows[nt][sequence] = row
+                row_starts.append(numpy.array([n_entries]))
+                set_idx.append(numpy.array(other_entries[sequence][0]))
+                counts.append(numpy.array(other_entries[sequence][1]))
+                n_entries += len(other_entries[sequence][0])
+            read_tables[nt] = (codes[first], numpy.concatenate(row_starts + [numpy.array([n_entries])]),
+                               numpy.concatenate(set_idx).astype(numpy.int64), numpy.concatenate(counts))
+        return read_tables
+
+    def ref_counts(self, ref_kmers):
+        """
+        Total count of reads from each read set aligned to both strands of a reference
+        :param ref_kmers: reference and read length to align (kmer.RefKmers)
+        :return: aligned count for each read set (numpy.array(float))
+        """
+        if not self._merged:
+            return numpy.array([sum(numpy.abs(read_set.ref_hits(ref_kmers)[2]).tolist())
+                                for read_set in self.read_sets], dtype=float)
+        reads, times, entry_rows, entries = self._ref_entries(ref_kmers)
+        _, _, set_idx, counts = self.read_table(ref_kmers.nt)
+        return numpy.bincount(set_idx[entries], weights=counts[entries] * times[entry_rows],
+                              minlength=self._n_sets)
+
+    def ref_read_times(self, ref_kmers):
+        """
+        Number of times each read aligns to each strand of a reference
+        :param ref_kmers: reference and read length to align (kmer.RefKmers)
+        :return: aligned reads - rows of the merged table (numpy.array(int)), or read keys if read sets aren't
+                 merged (numpy.array(DNA)), times each read aligns to the fwd strand (numpy.array(int)),
+                 times each read aligns to the rvs strand (numpy.array(int))
+        """
+        if not self._merged:
+            read_times = {}  # {read: [fwd times, rvs times]}
+            for read_set in self.read_sets:
+                single_read_times = {}  # times are the same for every read set a read is in
+                _, reads, counts = read_set.ref_hits(ref_kmers)
+                for read, count in zip(reads, counts.tolist()):
+                    single_read_times.setdefault(read_set.to_dna(read), [0, 0])[count < 0] += 1
+                read_times.update(single_read_times)
+            strand_times = numpy.array(list(read_times.values()), dtype=numpy.int64).reshape(-1, 2)
+            return numpy.fromiter(read_times, dtype=object, count=len(read_times)), strand_times[:, 0], \
+                strand_times[:, 1]
+        codes, _, _, _ = self.read_table(ref_kmers.nt)
+        _, read_idx, sense = ref_kmers.hits(codes, self.other_rows(ref_kmers.nt))
+        reads, hit_reads = numpy.unique(read_idx, return_inverse=True)
+        fwd_times = numpy.bincount(hit_reads[sense], minlength=len(reads))
+        return reads, fwd_times, numpy.bincount(hit_reads, minlength=len(reads)) - fwd_times
+
+    def aligned_read_table(self, nt, reads):
+        """
+        Unique aligned reads, with their count in each read set
+        :param nt: aligned read length (int)
+        :param reads: aligned read for each alignment - see ref_read_times (numpy.array)
+        :return: unique read for each alignment - index into read sequences (numpy.array(int)),
+                 read sequences (numpy.array(bytes)),
+                 counts - row for each read sequence, column for each read set (numpy.array(float, ndim=2))
+        """
+        if not self._merged:
+            read_ordinals = {}
+            read_idx = numpy.array([read_ordinals.setdefault(read, len(read_ordinals)) for read in reads.tolist()],
+                                   dtype=numpy.int64)
+            unique_reads = list(read_ordinals)
+            sequences = numpy.array([str(read).encode('ascii') for read in unique_reads], dtype=bytes)
+            row_starts, set_idx, counts = self._unmerged_entries(unique_reads)
+            unique_rows = numpy.arange(len(unique_reads))
+        else:
+            unique_rows, read_idx = numpy.unique(reads, return_inverse=True)
+            codes, row_starts, set_idx, counts = self.read_table(nt)
+            packed = unique_rows < len(codes)
+            sequences = kmer.decode_array(codes[unique_rows[packed]], nt)
+            if not packed.all():
+                other_seqs = numpy.array([sequence.encode('ascii', 'replace') for sequence in self.other_rows(nt)],
+                                         dtype=sequences.dtype)
+                sequences = numpy.concatenate((sequences, other_seqs[unique_rows[~packed] - len(codes)]))
+        entry_rows, entries = _row_entries(row_starts, unique_rows)
+        read_counts = numpy.zeros((len(unique_rows), self._n_sets))
+        read_counts[entry_rows, set_idx[entries]] = counts[entries]
+        return read_idx.reshape(-1), sequences, read_counts
+
+    def split_counts(self, nt, ref_ordinals, reads, times, ref_count):
+        """
+        Aligned counts for each reference, with the count for each read split by the number of times it
+        aligns to all references - total hits for each read come from a single bincount, and split counts
+        for every reference and read set from a single weighted bincount
+        :param nt: aligned read length (int)
+        :param ref_ordinals: reference ordinal for each alignment (numpy.array(int))
+        :param reads: aligned read for each alignment - see ref_read_times (numpy.array)
+        :param times: times the read aligns to the reference for each alignment (numpy.array(int))
+        :param ref_count: number of references (int)
+        :return: split counts - row for each reference ordinal, column for each read set
+                 (numpy.array(float, ndim=2))
+        """
+        if not self._merged:
+            read_ordinals = {}
+            reads = numpy.array([read_ordinals.setdefault(read, len(read_ordinals)) for read in reads.tolist()],
+                                dtype=numpy.int64)
+            row_starts, set_idx, counts = self._unmerged_entries(list(read_ordinals))
+        else:
+            _, row_starts, set_idx, counts = self.read_table(nt)
+        total_times = numpy.bincount(reads, weights=times, minlength=len(row_starts) - 1)
+        entry_rows, entries = _row_entries(row_starts, reads)
+        weights = counts[entries] * (times / total_times[reads])[entry_rows]
+        return numpy.bincount(ref_ordinals[entry_rows] * self._n_sets + set_idx[entries], weights=weights,
+                              minlength=ref_count * self._n_sets).reshape(ref_count, self._n_sets)
+
+    def _unmerged_entries(self, reads):
+        """
+        Merged table entries for reads looked up in each read set
+        :param reads: read keys (list)
+        :return: row starts (numpy.array(int)), read set index for each entry (numpy.array(int)),
+                 count for each entry (numpy.array(float)) - see read_table
+        """
+        row_starts = [0]
+        set_idx = []
+        counts = []
+        for read in reads:
+            for read_set_idx, read_set in enumerate(self.read_sets):
+                if read in read_set:
+                    set_idx.append(read_set_idx)
+                    counts.append(read_set[read])
+            row_starts.append(len(set_idx))
+        return numpy.array(row_starts, dtype=numpy.int64), numpy.array(set_idx, dtype=numpy.int64), \
+            numpy.array(counts, dtype=float)
+
+    def _ref_entries(self, ref_kmers):
+        """
+        Align merged reads to a reference
+        :param ref_kmers: reference and read length to align (kmer.RefKmers)
+        :return: aligned reads - rows of the merged table (numpy.array(int)),
+                 times each read aligns (numpy.array(int)),
+                 aligned read for each entry - index into aligned reads (numpy.array(int)),
+                 read table entries for the aligned reads (numpy.array(int))
+        """
+        reads, fwd_times, rvs_times = self.ref_read_times(ref_kmers)
+        entry_rows, entries = _row_entries(self.read_table(ref_kmers.nt)[1], reads)
+        return reads, fwd_times + rvs_times, entry_rows, entries
+
+    def shared(self):
+        """
+        Read-only copy of the merged reads in shared memory for worker processes - see SharedArrays
+        :return: SharedMultiSRNASeq, or this object if reads aren't merged or shared memory isn't available
+        """
+        if shared_memory is None or not self._merged:
+            return self
+        return SharedMultiSRNASeq(self)
+
+
+class SharedMultiSRNASeq(MultiSRNASeq):
+    """
+    Read-only merged read tables in shared memory - see SharedArrays
+    """
+
+    def __init__(self, multi_seq):
+        """
+        :param multi_seq: merged reads to share (MultiSRNASeq)
+        """
+        super(SharedMultiSRNASeq, self).__init__([], multi_seq._lengths)
+        self._n_sets = len(multi_seq)
+        self._merged = True
+        arrays = {}
+        for nt in self._lengths:
+            for name, array in zip(['codes', 'row_starts', 'set_idx', 'counts'], multi_seq.read_table(nt)):
+                arrays[nt, name] = array
+            self._other_rows[nt] = multi_seq.other_rows(nt)
+        self._arrays = SharedArrays(arrays)
+
+    def __getstate__(self):
+        return {'arrays': self._arrays, 'n_sets': self._n_sets, 'lengths': self._lengths,
+                'other_rows': self._other_rows}
+
+    def __setstate__(self, state):
+        self.read_sets = []
+        self._n_sets = state['n_sets']
+        self._lengths = state['lengths']
+        self._merged = True
+        self._read_tables = None
+        self._other_rows = state['other_rows']
+        self._arrays = state['arrays']
+
+    def shared(self):
+        """
+        :return: this object - already in shared memory
+        """
+        return self
+
+    def release(self):
+        """
+        Release the shared memory block - see SharedArrays.release
+        """
+        self._read_tables = None  # arrays must be released before the block is closed
+        self._arrays.release()
+
+    def _build_read_tables(self):
+        """
+        Merged read tables backed by the shared memory block
+        :return: {nt: (sorted codes, row starts, read set indices, counts) - see read_table} (dict)
+        """
+        return {nt: tuple(self._arrays[nt, name] for name in ['codes', 'row_starts', 'set_idx', 'counts'])
+                for nt in self._lengths}
+
+
+class SharedArrays(object):
+    """
+    numpy arrays copied once into a single shared memory block.  When pickled only the block name and layout
+    are sent, and the receiving process attaches to the same memory without copying.
+
+    The block lives until the original copy is released - the process that created it calls release() once
+    workers have finished.  Copies attached in worker processes are detached when the worker exits, or by
+    calling release().  Small objects that aren't arrays (eg. reads with non-ACGT characters) are pickled
+    alongside the block by the classes that use it.
+    """
+
+    def __init__(self, arrays):
+        """
+        :param arrays: {name: array (numpy.array)} (dict)
+        """
+        self._layout = {}  # {name: (offset, dtype, shape)}
+        size = 0
+        for name, array in arrays.items():
+            self._layout[name] = (size, array.dtype.str, array.shape)
+            size += -(-array.nbytes // 8) * 8  # keep arrays 8 byte aligned
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self._owner = True
+        self._views = None
+        for name, array in arrays.items():
+            self[name][...] = array
+
+    def __getstate__(self):
+        return {'name': self._shm.name, 'layout': self._layout}
+
+    def __setstate__(self, state):
+        self._layout = state['layout']
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._owner = False
+        self._views = None
+
+    def __getitem__(self, name):
+        if self._views is None:
+            self._views = {array_name: numpy.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+                           for array_name, (offset, dtype, shape) in self._layout.items()}
+        return self._views[name]  # array backed by the shared memory block
+
+    def names(self):
+        return self._layout.keys()  # view of array names
+
+    def release(self):
+        """
+        Detach from the shared memory block, and free it if this is the original copy.  Arrays from this
+        object must not be used afterwards.
+        """
+        self._views = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _row_entries(row_starts, rows):
+    """
+    Entries of a CSR table for a set of rows
+    :param row_starts: entries for row i are row_starts[i]:row_starts[i + 1] (numpy.array(int))
+    :param rows: rows (numpy.array(int))
+    :return: index into rows for each entry (numpy.array(int)), entries (numpy.array(int))
+    """
+    starts = row_starts[rows]
+    entry_counts = row_starts[rows + 1] - starts
+    entry_rows = numpy.repeat(numpy.arange(len(rows)), entry_counts)
+    entries = numpy.arange(len(entry_rows)) + numpy.repeat(starts - (numpy.cumsum(entry_counts) - entry_counts),
+                                                           entry_counts)
+    return entry_rows, entries
@@ -8,56 +8,53 @@ Write alignment results to file (csv format)
 """
 
 import csv
+import gzip
 
+import numpy
 
-def csv_output(alignment_dict, nt, seq_file_name, header):
+from scram_modules.post_process import run_lengths
+from scram_modules.results import save_results
+
+
+def csv_output(alignment_dict, nt, seq_file_name, header, compress=False):
     """
     Writes to file in CSV format --> sRNA seq , pos, count
-    Single reference alignment - den; single sRNA length
-    :param alignment_dict: {sRNA sequence (str): position (int), count(float)} (dict)
+    Single reference alignment - den; single sRNA length.  Rows are streamed in position order from the
+    alignment, so every alignment is never held as a list of rows.
+    :param alignment_dict: alignments for the reference (AlignedReads)
     :param nt: aligned read length (int)
     :param seq_file_name: sequence file name (str)
     :param header: reference name (str)
+    :param compress: gzip the CSV file (bool)
 
     """
-
-    alignment_list = []
-
-    for sRNA, alignment in alignment_dict:
-        for i in alignment:
-            alignment_list.append((sRNA, i[0], i[1]))
-    alignment_list.sort(key=lambda tup: tup[1])
-    with open(header + '_' + seq_file_name + '_' + str(nt) \
-                      + '.csv', 'w') as csvfile:
-        mycsv = csv.writer(csvfile, delimiter=',')
-        mycsv.writerow(['sRNA', '5-prime nuc. position', 'Count'])
-        for alignment in alignment_list:
-            out = [str(alignment[0]), alignment[1] + 1, alignment[2]]
-            mycsv.writerow(out)
-    csvfile.close()
+    rows = ([str(sRNA), pos + 1, count] for sRNA, pos, count in alignment_dict.by_position())
+    _write_csv(header + '_' + seq_file_name + '_' + str(nt) + '.csv',
+               ['sRNA', '5-prime nuc. position', 'Count'], rows, compress)
 
 
 def mnt_csv_output(alignment_dict_21, alignment_dict_22, alignment_dict_24,
-                   seq_file_name, header):
+                   seq_file_name, header, compress=False):
     """
     Writes to file in CSV format --> sRNA seq , pos, count
     Single reference alignment - mnt3dm; 3 sRNA lengths = 21nt, 22nt and 24nt
 
-    :param alignment_dict_21: {sRNA sequence (str): position (int), count(float)} (dict) - 21 nt alignments
-    :param alignment_dict_22: {sRNA sequence (str): position (int), count(float)} (dict) - 22 nt alignments
-    :param alignment_dict_24: {sRNA sequence (str): position (int), count(float)} (dict) - 24 nt alignments
+    :param alignment_dict_21: 21 nt alignments (AlignedReads)
+    :param alignment_dict_22: 22 nt alignments (AlignedReads)
+    :param alignment_dict_24: 24 nt alignments (AlignedReads)
     :param seq_file_name: sequence file name (str)
     :param header: reference name (str)
+    :param compress: gzip the CSV files (bool)
     """
     """
     For mnt - write 3 seperate csvs for 21,22,24 nt sRNA lengths
     """
-    csv_output(alignment_dict_21, 21, seq_file_name, header)
-    csv_output(alignment_dict_22, 22, seq_file_name, header)
-    csv_output(alignment_dict_24, 24, seq_file_name, header)
+    csv_output(alignment_dict_21, 21, seq_file_name, header, compress)
+    csv_output(alignment_dict_22, 22, seq_file_name, header, compress)
+    csv_output(alignment_dict_24, 24, seq_file_name, header, compress)
 
 
-def cdp_output(counts_by_ref, header1, header2, out_file):
+def cdp_output(counts_by_ref, header1, header2, out_file, compress=False):
     """
     Writes to file in CSV format --> reference_header, aligned_count_x, aligned_count_y
     Multiple reference alignment - CDP; single sRNA length
@@ -65,48 +62,121 @@ def cdp_output(counts_by_ref, header1, header2, out_file):
     :param header1: column header_x (str)
     :param header2: column_header_y (str)
     :param out_file: CSV file name for output (str)
+    :param compress: gzip the CSV file - .gz is added to out_file (bool)
     """
-    """
-    Write to file --> csv
-    sRNA, seq1_count, seq2_count
-    """
-    results_list = []
-    for header, counts in counts_by_ref.items():
-        results_list.append((header, counts[0], counts[1]))
-    with open(out_file, 'w') as csvfile:
-        mycsv = csv.writer(csvfile, delimiter=',')
-        mycsv.writerow(['', header1, header2])
-        for result in results_list:
-            out = [result[0], result[1], result[2]]
-            mycsv.writerow(out)
-
-    csvfile.close()
+    rows = ([header, counts[0], counts[1]] for header, counts in counts_by_ref.items())
+    _write_csv(out_file, ['', header1, header2], rows, compress)
 
 
-def single_cdp_file_output(counts_by_ref, loaded_seq_name_list, out_file):
+def single_cdp_file_output(counts_by_ref, loaded_seq_name_list, out_file, compress=False):
     """
     Writes to file in CSV format --> reference_header, aligned_count_1, aligned_count_2,.......
     Multiple reference alignment - single CDP; single sRNA length, multiple sequences
     :param counts_by_ref: {reference header (str): seq_1 aligned count (float), seq 2 aligned count (float), .....}
-    (dict)
+    (dict), or an iterable of (reference header, counts) pairs - written as it is generated
     :param loaded_seq_name_list: [seq_1 name (str), seq_2 name (str),....] (list)
     :param out_file: CSV file name for output (str)
+    :param compress: gzip the CSV file - .gz is added to out_file (bool)
     """
-    """
-    csv output for sinlge CDP alignments
-    
+    if isinstance(counts_by_ref, dict):
+        counts_by_ref = counts_by_ref.items()
+    rows = ([header] + list(counts) for header, counts in counts_by_ref)
+    _write_csv(out_file, ["Reference"] + loaded_seq_name_list, rows, compress)
+
 
-    Each row is a refseq seq header
-    
-    header, seq1, seq2 etc)
+def bedgraph_output(profiles, lengths, seq_file_name, header, track_name, compress=False):
+    """
+    Writes run-length encoded profiles to bedGraph files --> track name, start, end, value
+    Single reference alignment - den and mnt3dm; a file for each sRNA length and strand.  Positions are
+    0-based, end exclusive, and runs of zeros are left out.  Antisense values are negative, as plotted.
+    :param profiles: [(reference_x_axis, fwd_alignment_y_axis, revs_alignment_y_axis),...] - one for each read
+                     length, see post_process.fill_in_zeros (list)
+    :param lengths: read length of each profile (list(int))
+    :param seq_file_name: sequence file name (str)
+    :param header: reference name (str)
+    :param track_name: reference sequence name for the genome browser (str)
+    :param compress: gzip the bedGraph files (bool)
     """
+    for nt, (_, y_fwd, y_rvs) in zip(lengths, profiles):
+        for strand, values in [('fwd', y_fwd), ('rvs', y_rvs)]:
+            name = header + '_' + seq_file_name + '_' + str(nt) + '_' + strand
+            starts, ends, run_values = run_lengths(values)
+            with _open_output(name + '.bedgraph', compress) as bedgraph_file:
+                bedgraph_file.write('track type=bedGraph name={0}\n'.format(name))
+                bedgraph_file.writelines('{0}\t{1}\t{2}\t{3}\n'.format(track_name, start, end, value)
+                                         for start, end, value in zip(starts.tolist(), ends.tolist(),
+                                                                      run_values.tolist()))
+
+
+def den_npz_output(alignments, profiles, seq_file_name, header, coverage=False, compress=False):
+    """
+    Writes alignments and profiles to a columnar .npz file - see results
+    Single reference alignment - den and mnt3dm; one or more sRNA lengths
+    :param alignments: [(read length (int), alignments (AlignedReads)),...] (list)
+    :param profiles: [(reference_x_axis, fwd_alignment_y_axis, revs_alignment_y_axis),...] - one for each read
+                     length, see post_process.fill_in_zeros (list)
+    :param seq_file_name: sequence file name (str)
+    :param header: reference name (str)
+    :param coverage: profiles are per-nucleotide coverage (bool)
+    :param compress: compress the .npz file - columns can't then be memory-mapped (bool)
+    """
+    columns = {'nt': [], 'read': [], 'position': [], 'count': [], 'profile_nt': [], 'profile_position': [],
+               'profile_fwd': [], 'profile_rvs': []}
+    for (nt, alignment), (x_ref, y_fwd, y_rvs) in zip(alignments, profiles):
+        reads, positions, counts = alignment.position_arrays()
+        columns['nt'].append(numpy.full(len(reads), nt, dtype=numpy.uint8))
+        columns['read'].append(reads.astype('S{0}'.format(nt)))
+        columns['position'].append(positions + 1)
+        columns['count'].append(counts)
+        profile_positions = numpy.flatnonzero((y_fwd != 0) | (y_rvs != 0))
+        columns['profile_nt'].append(numpy.full(len(profile_positions), nt, dtype=numpy.uint8))
+        columns['profile_position'].append(x_ref[profile_positions] + 1)
+        columns['profile_fwd'].append(y_fwd[profile_positions])
+        columns['profile_rvs'].append(y_rvs[profile_positions])
+    nts = [nt for nt, _ in alignments]
+    save_results(header + '_' + seq_file_name + '_' + '_'.join(str(nt) for nt in nts) + '.npz', 'den',
+                 {name: numpy.concatenate(column) for name, column in columns.items()},
+                 compress, seq=seq_file_name, ref=header, lengths=nts, ref_len=len(profiles[0][0]),
+                 coverage=coverage)
+
+
+def cdp_npz_output(headers, counts, seq_names, out_file, compress=False):
+    """
+    Writes aligned counts to a columnar .npz file - see results
+    Multiple reference alignment - CDP and single CDP; single sRNA length
+    :param headers: reference headers (list(str))
+    :param counts: counts - row for each reference, column for each sequence (numpy.array(float, ndim=2))
+    :param seq_names: [seq_1 name (str), seq_2 name (str),....] (list)
+    :param out_file: .npz file name for output (str)
+    :param compress: compress the .npz file - columns can't then be memory-mapped (bool)
+    """
+    save_results(out_file, 'cdp', {'headers': numpy.array(headers, dtype=str),
+                                   'sample_names': numpy.array(seq_names, dtype=str),
+                                   'counts': numpy.asarray(counts, dtype=numpy.float64).reshape(-1, len(seq_names))},
+                 compress)
+
 
-    first_row = ["Reference"] + loaded_seq_name_list
-    with open(out_file, 'w') as csvfile:
+def _write_csv(out_file, first_row, rows, compress):
+    """
+    Write rows to a CSV file as they are generated
+    :param out_file: CSV file name for output (str)
+    :param first_row: column headers (list)
+    :param rows: iterable of rows (list)
+    :param compress: gzip the CSV file on the fly - .gz is added to out_file (bool)
+    """
+    with _open_output(out_file, compress) as csvfile:
         mycsv = csv.writer(csvfile, delimiter=',')
         mycsv.writerow(first_row)
+        mycsv.writerows(rows)
 
-        for header, counts in counts_by_ref.items():
-            out = [header] + counts
-            mycsv.writerow(out)
-    csvfile.close()
+
+def _open_output(out_file, compress):
+    """
+    Open a text file for output
+    :param out_file: file name for output (str)
+    :param compress: gzip the file on the fly - .gz is added to out_file (bool)
+    :return: file object
+    """
+    if compress:
+        return gzip.open(out_file + '.gz', 'wt')
+    return open(out_file, 'w')
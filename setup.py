@@ -36,12 +36,18 @@ setup(name='scram',
       'scram_modules/analysis.py',
       'scram_modules/alignedreads.py',
       'scram_modules/analysis_helper.py',
+      'scram_modules/batch.py',
       'scram_modules/cdp.py',
       'scram_modules/den.py',
       'scram_modules/dna.py',
+      'scram_modules/hitmatrix.py',
+      'scram_modules/kmer.py',
       'scram_modules/plot_reads.py',
       'scram_modules/post_process.py',
       'scram_modules/refseq.py',
+      'scram_modules/results.py',
+      'scram_modules/seqcache.py',
+      'scram_modules/session.py',
       'scram_modules/srnaseq.py',
       'scram_modules/write_to_file.py',
       ],
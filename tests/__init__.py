@@ -0,0 +1,11 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Sequence files loaded by the tests are cached in a temporary directory, not the user's cache.  Spawned
+# worker processes import this package too - they inherit the directory, and the first process removes it.
+if 'SCRAM_TEST_CACHE_DIR' not in os.environ:
+    os.environ['SCRAM_TEST_CACHE_DIR'] = tempfile.mkdtemp(prefix="scram_test_cache_")
+    atexit.register(shutil.rmtree, os.environ['SCRAM_TEST_CACHE_DIR'], True)
+os.environ['SCRAM_CACHE_DIR'] = os.environ['SCRAM_TEST_CACHE_DIR']
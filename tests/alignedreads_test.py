@@ -90,13 +90,79 @@ class TestARMethods(unittest.TestCase):
         test_aligned[dna.DNA("ATGCGTATGGCGATGAGAGTA")]=[[0, 250000.0],[27,250000.0]]
         self.assertEqual(aligned, test_aligned)
 
-    def load_test_read_file(self):
+    def test_srna_profile_packed(self):
+        """
+        Test packed read storage gives the same alignments as DNA read storage
+        """
+        test_seq = self.load_test_read_file()
+        test_packed_seq = self.load_test_read_file(srna.PackedSRNASeq)
+        for ref_name in ["test_ref_1.fa", "test_ref_2.fa", "test_ref_3.fa", "test_ref_4.fa"]:
+            single_ref = self.load_test_ref_file(ref_name)
+            self.assertEqual(self.align_reads(single_ref, test_packed_seq),
+                             self.align_reads(single_ref, test_seq))
+
+    def test_srna_profile_multi_length(self):
+        """
+        Test a single pass alignment of all read lengths gives the same alignments as aligning each length
+        """
+        test_packed_seq = self.load_test_read_file(srna.PackedSRNASeq)
+        single_ref = self.load_test_ref_file("test_ref_3.fa")
+        aligned = ar.MultiAlignedReads()
+        aligned.align_reads_to_ref(test_packed_seq, single_ref)
+        self.assertEqual(aligned.lengths(), [21, 22])
+        for nt, alignment in aligned:
+            test_aligned = ar.AlignedReads()
+            test_aligned.align_reads_to_ref(test_packed_seq, single_ref, nt)
+            self.assertEqual(alignment, test_aligned)
+
+    def test_srna_profile_chunked(self):
+        """
+        Test a reference split into chunks aligned in parallel gives the same alignments, in the same order,
+        as a single scan
+        """
+        min_chunk_windows = ar._MIN_CHUNK_WINDOWS
+        ar._MIN_CHUNK_WINDOWS = 8
+        try:
+            for seq_class in [srna.SRNASeq, srna.PackedSRNASeq]:
+                test_seq = self.load_test_read_file(seq_class)
+                ref_3 = str(self.load_test_ref_file("test_ref_3.fa"))
+                single_ref = dna.DNA(ref_3 + ref_3[::-1] + ref_3 * 3)
+                aligned = ar.AlignedReads()
+                aligned.align_reads_to_ref(test_seq, single_ref, 21, 3)
+                test_aligned = self.align_reads(single_ref, test_seq)
+                self.assertEqual(aligned, test_aligned)
+                self.assertEqual(list(aligned), list(test_aligned))
+                multi_aligned = ar.MultiAlignedReads()
+                multi_aligned.align_reads_to_ref(test_seq, single_ref, [21, 22], 3)
+                test_multi_aligned = ar.MultiAlignedReads()
+                test_multi_aligned.align_reads_to_ref(test_seq, single_ref, [21, 22])
+                self.assertEqual(multi_aligned, test_multi_aligned)
+                for nt, alignment in multi_aligned:
+                    self.assertEqual(list(alignment), list(test_multi_aligned[nt]))
+        finally:
+            ar._MIN_CHUNK_WINDOWS = min_chunk_windows
+
+    def test_by_position(self):
+        """
+        Test alignments are generated in position order, with alignments at the same position in alignment order
+        """
+        test_aligned = ar.AlignedReads()
+        test_aligned[dna.DNA("GTGCGTATGGCGATGAGAGTA")] = [[47, -250000.0], [3, 1.0]]
+        test_aligned[dna.DNA("ATGCGTATGGCGATGAGAGTA")] = [[0, 500000.0], [47, 2.0], [3, 3.0]]
+        self.assertEqual([(str(sRNA), pos, count) for sRNA, pos, count in test_aligned.by_position()],
+                         [("ATGCGTATGGCGATGAGAGTA", 0, 500000.0), ("GTGCGTATGGCGATGAGAGTA", 3, 1.0),
+                          ("ATGCGTATGGCGATGAGAGTA", 3, 3.0), ("GTGCGTATGGCGATGAGAGTA", 47, -250000.0),
+                          ("ATGCGTATGGCGATGAGAGTA", 47, 2.0)])
+        self.assertEqual(list(ar.AlignedReads().by_position()), [])
+
+    def load_test_read_file(self, seq_class=srna.SRNASeq):
         """
         Load test read file
+        :param seq_class: read storage class
         :return: SRNASeq object
         """
         seq_file = _BASE_DIR + "/test_seq.fa"
-        test_seq = srna.SRNASeq()
+        test_seq = seq_class()
         test_seq.load_seq_file(seq_file, 50, 1, 0)
         return test_seq
 
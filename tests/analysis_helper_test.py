@@ -8,5 +8,18 @@ class TestAHMethods(unittest.TestCase):
         out_name= "my_file"
         self.assertEqual(ah.single_file_output(in_file), out_name)
 
+    def test_ref_header_output(self):
+        self.assertEqual(ah.ref_header_output(">chr1 description"), "chr1")
+        self.assertEqual(ah.ref_header_output(">gi|123|ref|NC_1.1|"), "gi_123_ref_NC_1.1_")
+        self.assertEqual(ah.ref_header_output(">"), "ref")
+
+    def test_ref_track_name(self):
+        self.assertEqual(ah.ref_track_name(">chr1 description"), "chr1")
+        self.assertEqual(ah.ref_track_name(">gi|123|ref|NC_1.1|"), "gi|123|ref|NC_1.1|")
+        self.assertEqual(ah.ref_track_name(">"), "ref")
+
+    def test_ref_file_name(self):
+        self.assertEqual(ah.ref_file_name("figs/fig.pdf", "chr1"), "figs/fig_chr1.pdf")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import scram_modules.batch as batch
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestBatchMethods(unittest.TestCase):
+
+    def test_read_manifest(self):
+        """
+        Test TSV and JSON manifests give the same analyses, with defaults for missing fields
+        """
+        manifest_dir = tempfile.mkdtemp()
+        try:
+            tsv_file = os.path.join(manifest_dir, "manifest.tsv")
+            with open(tsv_file, 'w') as manifest:
+                manifest.write("analysis\treference\ts1\ts2\tnt\tfile_name\n"
+                               "den\tref.fa\ta.fa\t\t22\tauto\n"
+                               "# skipped\t\t\t\t\t\n"
+                               "CDP\tref.fa\ta.fa,b.fa\tc.fa\t\t\n")
+            json_file = os.path.join(manifest_dir, "manifest.json")
+            with open(json_file, 'w') as manifest:
+                json.dump([{"analysis": "den", "reference": "ref.fa", "s1": ["a.fa"], "nt": 22, "file_name": "auto"},
+                           {"analysis": "CDP", "reference": "ref.fa", "s1": ["a.fa", "b.fa"], "s2": "c.fa"}],
+                          manifest)
+            jobs = batch.read_manifest(tsv_file)
+            self.assertEqual(jobs, batch.read_manifest(json_file))
+            self.assertEqual(jobs[0], {'analysis': 'den', 'reference': 'ref.fa', 's1': ('a.fa',), 's2': (),
+                                       'nt': 22, 'file_name': 'auto'})
+            self.assertEqual(jobs[1]['s1'], ('a.fa', 'b.fa'))
+            self.assertEqual(jobs[1]['nt'], 21)
+            self.assertEqual(jobs[1]['file_name'], "NO_PLOT")
+        finally:
+            shutil.rmtree(manifest_dir)
+
+    def test_manifest_errors(self):
+        """
+        Test unknown analyses, and CDP without a second sample, are rejected
+        """
+        with self.assertRaises(ValueError):
+            batch._manifest_job({'analysis': 'dens', 'reference': 'ref.fa', 's1': 'a.fa'}, 1)
+        with self.assertRaises(ValueError):
+            batch._manifest_job({'analysis': 'CDP', 'reference': 'ref.fa', 's1': 'a.fa'}, 1)
+
+    def test_plan_batch(self):
+        """
+        Test each sample and reference is loaded once - CDP_single files are separate samples
+        """
+        jobs = [batch._manifest_job(row, 1) for row in
+                [{'analysis': 'den', 'reference': 'ref1.fa', 's1': 'a.fa'},
+                 {'analysis': 'mnt3dm', 'reference': 'ref2.fa', 's1': 'a.fa'},
+                 {'analysis': 'CDP', 'reference': 'ref1.fa', 's1': 'a.fa', 's2': 'b.fa,c.fa'},
+                 {'analysis': 'CDP_single', 'reference': 'ref2.fa', 's1': 'a.fa,b.fa'}]]
+        sample_files, ref_files = batch.plan_batch(jobs)
+        self.assertEqual(sample_files, [('a.fa',), ('b.fa', 'c.fa'), ('b.fa',)])
+        self.assertEqual(ref_files, ['ref1.fa', 'ref2.fa'])
+
+    def test_run_batch(self):
+        """
+        Test a manifest of den and CDP_single analyses runs in this process and writes their CSVs
+        """
+        batch_dir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            shutil.copy(_BASE_DIR + "/test_ref_4.fa", batch_dir)
+            shutil.copy(_BASE_DIR + "/test_seq.fa", batch_dir)
+            with open(os.path.join(batch_dir, "manifest.json"), 'w') as manifest:
+                json.dump([{"analysis": "den", "reference": "test_ref_4.fa", "s1": "test_seq.fa"},
+                           {"analysis": "CDP_single", "reference": "test_ref_4.fa", "s1": "test_seq.fa"}], manifest)
+            os.chdir(batch_dir)
+            with mock.patch.dict(os.environ, {'SCRAM_CACHE_MB': '0'}):
+                self.assertEqual(batch.run_batch("manifest.json", processes=1), [])
+            self.assertTrue(os.path.isfile("test_ref_4_test_seq_21.csv"))
+            self.assertTrue(os.path.isfile("test_ref_4.fa_multiple_file_alignment_21.csv"))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(batch_dir)
+
+    def test_run_batch_split(self):
+        """
+        Test split=True splits den and CDP counts, and split=False doesn't
+        """
+        from scram_modules import cdp
+        from scram_modules import den as dn
+        batch_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy(_BASE_DIR + "/test_ref_4.fa", batch_dir)
+            shutil.copy(_BASE_DIR + "/test_seq.fa", batch_dir)
+            ref_file, seq_file = os.path.join(batch_dir, "test_ref_4.fa"), os.path.join(batch_dir, "test_seq.fa")
+            manifest_file = os.path.join(batch_dir, "manifest.json")
+            with open(manifest_file, 'w') as manifest:
+                json.dump([{"analysis": analysis, "reference": ref_file, "s1": seq_file} for analysis in batch.ANALYSES
+                           if analysis != 'CDP'] + [{"analysis": "CDP", "reference": ref_file, "s1": seq_file,
+                                                     "s2": seq_file}], manifest)
+            for split in [True, False]:
+                with mock.patch.object(dn, 'srna_profile') as srna_profile, \
+                        mock.patch.object(dn, 'srna_profile_21_22_24') as srna_profile_21_22_24, \
+                        mock.patch.object(cdp, 'cdp_split_alignment') as cdp_split_alignment, \
+                        mock.patch.object(cdp, 'cdp_no_split_alignment') as cdp_no_split_alignment, \
+                        mock.patch.object(cdp, 'cdp_split_single') as cdp_split_single, \
+                        mock.patch.object(cdp, 'cdp_no_split_single') as cdp_no_split_single:
+                    self.assertEqual(batch.run_batch(manifest_file, split=split, processes=1), [])
+                # den functions split counts if their split argument is False
+                den_splits = [srna_profile.call_args[0][11], srna_profile_21_22_24.call_args[0][10]]
+                self.assertEqual(den_splits, [not split] * 2)
+                self.assertEqual([cdp_split_alignment.called, cdp_split_single.called], [split] * 2)
+                self.assertEqual([cdp_no_split_alignment.called, cdp_no_split_single.called], [not split] * 2)
+        finally:
+            shutil.rmtree(batch_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,12 @@
 # coding=utf-8
+import random
+import shutil
+import tempfile
 import unittest
+import numpy
 import scram_modules.alignedreads as ar
+import scram_modules.cdp as cdp
+import scram_modules.kmer as kmer
 import scram_modules.srnaseq as srna
 import scram_modules.refseq as refseq
 import scram_modules.dna as dna
@@ -23,4 +29,127 @@ class TestARMethods(unittest.TestCase):
 
         test_aligned=ar.AlignedReads()
         test_aligned[dna.DNA("ATGCGTATGGCGATGAGAGTA")]=[[0, 500000.0]]
-        self.assertEqual(aligned, test_aligned)
\ No newline at end of file
+        self.assertEqual(aligned, test_aligned)
+
+    def test_srna_profile_2(self):
+        """
+        Test a single read aligning a reference twice in the sense orientation
+        """
+        test_seq = self.load_test_read_file()
+
+        single_ref = self.load_test_ref_file("test_ref_4.fa")
+
+        aligned = self.align_reads(single_ref, test_seq)
+
+        test_aligned = ar.AlignedReads()
+        test_aligned[dna.DNA("ATGCGTATGGCGATGAGAGTA")] = [[0, 500000.0], [27, 500000.0]]
+        self.assertEqual(aligned, test_aligned)
+
+    def load_test_read_file(self):
+        """
+        Load test read file into packed storage, as used for CDP
+        :return: PackedSRNASeq object
+        """
+        seq_file = _BASE_DIR + "/test_seq.fa"
+        test_seq = srna.PackedSRNASeq()
+        test_seq.load_seq_file(seq_file, 50, 1, 0)
+        return test_seq
+
+    def load_test_ref_file(self, ref_name):
+        """
+        Load test_ref_file
+        :return: a single reference (DNA)
+        """
+        ref_file = "{0}/{1}".format(_BASE_DIR, ref_name)
+        test_ref = refseq.RefSeq()
+        test_ref.load_ref_file(ref_file)
+        single_ref = ""
+        for header, ref_seq in test_ref:
+            single_ref = ref_seq
+        return single_ref
+
+    def align_reads(self, single_ref, test_seq):
+        """
+        Align Reads
+        :param single_ref:
+        :param test_seq:
+        :return:
+        """
+        aligned = ar.AlignedReads()
+        aligned.align_reads_to_ref(test_seq, single_ref, 21)
+        return aligned
+
+
+class TestCDPMethods(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Multi-reference FASTA file, and two read sets of reads taken from both strands of the references -
+        some reads align to more than one reference, and some span an N
+        """
+        random.seed(3)
+        cls.ref_dir = tempfile.mkdtemp()
+        cls.ref_file = cls.ref_dir + "/refs.fa"
+        cls.refs = []
+        for i in range(12):
+            seq = "".join(random.choice("ACGTN" if j % 53 == 0 else "ACGT") for j in range(random.randrange(15, 200)))
+            if i % 4 == 3:
+                seq += cls.refs[i - 1][1][:30]  # shared with the previous reference
+            cls.refs.append(("ref{0}".format(i), seq))
+        with open(cls.ref_file, 'w') as ref_out:
+            for header, seq in cls.refs:
+                ref_out.write(">{0}\n".format(header))
+                for j in range(0, len(seq), 60):
+                    ref_out.write(seq[j:j + 60] + "\n")
+        cls.read_sets = [srna.PackedSRNASeq(), srna.PackedSRNASeq()]
+        cls.dna_read_sets = [srna.SRNASeq(), srna.SRNASeq()]
+        for set_idx, read_set in enumerate(cls.read_sets):
+            for i in range(150):
+                header, seq = random.choice(cls.refs)
+                if len(seq) < 21:
+                    continue
+                start = random.randrange(len(seq) - 20)
+                read = seq[start:start + 21] if i % 2 else dna.DNA(seq[start:start + 21]).complement()
+                read_set[read] = float(set_idx + i + 1)
+                cls.dna_read_sets[set_idx][dna.DNA(read)] = float(set_idx + i + 1)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.ref_dir, ignore_errors=True)
+
+    def test_cdp_counts(self):
+        """
+        Test counts from a pool of workers, with indexed and streamed references in small chunks, match
+        counts from aligning each read set to each reference in turn
+        """
+        ref_reads = [[read_set.ref_hits(kmer.RefKmers(dna.DNA(seq), 21)) for read_set in self.dna_read_sets]
+                     for _, seq in self.refs]
+        expected_counts = [[sum(numpy.abs(hits[2]).tolist()) for hits in set_hits] for set_hits in ref_reads]
+        total_times = [{} for _ in self.dna_read_sets]  # {read: times aligned to all references}
+        for set_hits in ref_reads:
+            for read_times, hits in zip(total_times, set_hits):
+                for read in hits[1]:
+                    read_times[read] = read_times.get(read, 0) + 1
+        expected_split_counts = [[sum(read_set[read] / read_times[read] for read in hits[1])
+                                  for read_set, read_times, hits in zip(self.dna_read_sets, total_times, set_hits)]
+                                 for set_hits in ref_reads]
+        self.assertGreater(sum(map(sum, expected_counts)), 0)
+        for split, expected in [(False, expected_counts), (True, expected_split_counts)]:
+            for indexed in [True, False]:
+                headers = []
+                if indexed:
+                    refs, indexed_refs = cdp.ref_records(self.ref_file)
+                    self.assertIsNotNone(indexed_refs)
+                else:
+                    refs, indexed_refs = refseq.read_ref_file(self.ref_file), None
+                ref_counts = cdp.ref_counts(refs, headers, self.read_sets, 21, 2, 5, indexed_refs, split)
+                self.assertEqual(headers, [">" + header for header, _ in self.refs])
+                self.assertEqual(ref_counts.shape, (len(self.refs), len(self.read_sets)))
+                for counts, expected_row in zip(ref_counts.tolist(), expected):
+                    for count, expected_count in zip(counts, expected_row):
+                        self.assertAlmostEqual(count, expected_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+import scram_modules.den as dn
+import scram_modules.refseq as refseq
+import scram_modules.srnaseq as srna
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestDenMethods(unittest.TestCase):
+
+    def test_ref_output_names(self):
+        """
+        Test repeated reference names are numbered, without reusing a name from the reference file
+        """
+        self.assertEqual(dn.ref_output_names([">chr1 a", ">chr2", ">chr1 b"]), ["chr1", "chr2", "chr1_3"])
+        self.assertEqual(dn.ref_output_names([">chr1", ">chr1_2", ">chr1"]), ["chr1", "chr1_2", "chr1_3"])
+        self.assertEqual(dn.ref_output_names([">chr1", ">chr1", ">chr1_2"]), ["chr1", "chr1_2", "chr1_2_3"])
+        self.assertEqual(dn.ref_output_names([">chr1_2", ">chr1", ">chr1"]), ["chr1_2", "chr1", "chr1_3"])
+        self.assertEqual(dn.ref_output_names([">chr1_3", ">chr1", ">chr1"]), ["chr1_3", "chr1", "chr1_4"])
+
+    def test_short_ref_profile(self):
+        """
+        Test a reference shorter than the smoothing window is profiled unsmoothed, and later references are still
+        profiled
+        """
+        ref_dir = tempfile.mkdtemp()
+        try:
+            long_ref = str(next(iter(refseq.read_ref_file(_BASE_DIR + "/test_ref_4.fa")))[1])
+            ref_file = os.path.join(ref_dir, "refs.fa")
+            with open(ref_file, 'w') as out_ref:
+                out_ref.write(">short\n{0}\n>long\n{1}\n".format(long_ref[:30], long_ref))
+            seq = srna.PackedSRNASeq()
+            seq.load_seq_file(_BASE_DIR + "/test_seq.fa", 32, 1, 18)
+            profiles = list(dn._ref_profiles(seq, "test_seq", ref_file, [21], 50, True, "auto", False, False, True,
+                                             False, 1, False, None, False, False, False))
+            self.assertEqual([ref_output for ref_output, _, _ in profiles], ["short", "long"])
+            (short_x, [(short_fwd, short_rvs)]), (long_x, [(long_fwd, long_rvs)]) = [p[2] for p in profiles]
+            self.assertEqual((len(short_x), len(short_fwd), len(short_rvs)), (30, 30, 30))
+            self.assertEqual((len(long_x), len(long_fwd), len(long_rvs)), (len(long_ref),) * 3)
+        finally:
+            shutil.rmtree(ref_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import scram_modules.hitmatrix as hm
+
+
+class TestHitMatrixMethods(unittest.TestCase):
+
+    def test_ref_counts(self):
+        """
+        Test aligned and split counts for each reference and sample
+        """
+        matrix = self.hit_matrix()
+        self.assertEqual(matrix.shape, (3, 3))
+        self.assertEqual(matrix.read_times().tolist(), [3, 0, 1])
+        self.assertEqual(matrix.ref_counts().tolist(), [[15.0, 2.0], [5.0, 1.0], [0.0, 0.0]])
+        self.assertTrue(numpy.allclose(matrix.ref_counts(split=True), [[5.0 * 2 / 3 + 5.0, 2 / 3],
+                                                                       [5.0 / 3, 1 / 3], [0.0, 0.0]]))
+        self.assertEqual(matrix.ref_counts(samples=['s2']).tolist(), [[2.0], [1.0], [0.0]])
+        self.assertEqual(matrix.sample_totals().tolist(), [20.0, 3.0])
+
+    def test_ref_counts_subset(self):
+        """
+        Test a subset of samples keeps only reads in those samples, and gives the same counts
+        """
+        matrix = self.hit_matrix()
+        subset = matrix.subset(['s2'])
+        self.assertEqual(subset.sample_names, ['s2'])
+        self.assertEqual(subset.reads.tolist(), [b'AAAA', b'CCCC'])
+        self.assertEqual(subset.ref_counts(split=True).tolist(), matrix.ref_counts(split=True, samples=[1]).tolist())
+
+    def test_reads(self):
+        """
+        Test reads for a reference, and reads aligning to several references
+        """
+        matrix = self.hit_matrix()
+        reads, fwd_hits, rvs_hits = matrix.ref_reads('ref1')
+        self.assertEqual(reads.tolist(), [b'AAAA', b'GGGG'])
+        self.assertEqual(fwd_hits.tolist(), [1, 0])
+        self.assertEqual(rvs_hits.tolist(), [1, 1])
+        reads, ref_numbers, times, counts = matrix.multimapping()
+        self.assertEqual(reads.tolist(), [b'AAAA'])
+        self.assertEqual(ref_numbers.tolist(), [2])
+        self.assertEqual(times.tolist(), [3])
+
+    def test_save_load(self):
+        """
+        Test a saved matrix loads unchanged
+        """
+        matrix = self.hit_matrix()
+        matrix_dir = tempfile.mkdtemp()
+        try:
+            matrix_file = os.path.join(matrix_dir, "hits.npz")
+            matrix.save(matrix_file)
+            loaded_matrix = hm.HitMatrix.load(matrix_file)
+            self.assertEqual(loaded_matrix.headers, matrix.headers)
+            self.assertEqual(loaded_matrix.sample_names, matrix.sample_names)
+            self.assertEqual(loaded_matrix.reads.tolist(), matrix.reads.tolist())
+            self.assertEqual(loaded_matrix.ref_counts(split=True).tolist(), matrix.ref_counts(split=True).tolist())
+        finally:
+            shutil.rmtree(matrix_dir)
+
+    def hit_matrix(self):
+        """
+        Matrix with 3 references (the last without alignments), 3 reads and 2 samples - alignments in any order
+        :return: HitMatrix
+        """
+        return hm.HitMatrix.from_alignments(['ref1', 'ref2', 'ref3'], ['s1', 's2'],
+                                            numpy.array([1, 0, 0]), numpy.array([0, 2, 0]),
+                                            numpy.array([1, 0, 1]), numpy.array([0, 1, 1]),
+                                            numpy.array([b'AAAA', b'CCCC', b'GGGG']),
+                                            numpy.array([[5.0, 1.0], [0.0, 2.0], [5.0, 0.0]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import random
+import unittest
+import scram_modules.kmer as kmer
+import scram_modules.srnaseq as srna
+import scram_modules.dna as dna
+
+
+class TestKmerMethods(unittest.TestCase):
+
+    def test_encode_decode(self):
+        seq = "ATGCGTATGGCGATGAGAGTA"
+        self.assertEqual(kmer.decode(kmer.encode(seq), len(seq)), seq)
+        self.assertEqual(kmer.encode("ACGT"), 0b00011011)
+
+    def test_encode_n(self):
+        self.assertIsNone(kmer.encode("ATGNA"))
+        self.assertIsNone(kmer.encode_key("ATGNA"))
+
+    def test_encode_int_syntax(self):
+        for seq in ["A_C", "+AC", "-AC", " AC", "AC\n", "A C"]:
+            self.assertIsNone(kmer.encode(seq))
+            self.assertIsNone(kmer.encode_key(seq))
+        self.assertEqual(kmer.encode("acgt"), kmer.encode("ACGT"))
+
+    def test_key_length_aware(self):
+        self.assertNotEqual(kmer.encode_key("AAA"), kmer.encode_key("AAAA"))
+        key = kmer.encode_key("T" * 32)
+        self.assertEqual(kmer.key_length(key), 32)
+        self.assertEqual(kmer.decode_key(key), "T" * 32)
+
+    def test_window_codes(self):
+        seq = "ACGTNACGTA"
+        fwd_codes, rvs_codes, valid = kmer.window_codes(kmer.encode_array(seq), 4)
+        self.assertEqual(len(fwd_codes), len(seq) - 3)
+        for pos in range(len(seq) - 3):
+            window = seq[pos:pos + 4]
+            self.assertEqual(bool(valid[pos]), "N" not in window)
+            if valid[pos]:
+                self.assertEqual(int(fwd_codes[pos]), kmer.encode(window))
+                self.assertEqual(int(rvs_codes[pos]), kmer.encode(dna.DNA(window).complement()))
+
+    def test_multi_ref_kmers(self):
+        """
+        Test single pass alignment of several lengths, with the reference split into several blocks
+        """
+        random.seed(2)
+        ref = dna.DNA("".join(random.choice("ACGT") for i in range(1000)))
+        packed_seq = srna.PackedSRNASeq()
+        for nt in [18, 21, 24]:
+            for i in range(20):
+                start = random.randrange(len(ref) - nt)
+                packed_seq[ref[start:start + nt]] = 1.0
+                packed_seq[dna.DNA(ref[start:start + nt]).complement()] = 2.0
+        block_size = kmer._BLOCK_SIZE
+        kmer._BLOCK_SIZE = 300
+        try:
+            hits_by_length = packed_seq.ref_hits_by_length(kmer.MultiRefKmers(ref, packed_seq.lengths()))
+        finally:
+            kmer._BLOCK_SIZE = block_size
+        self.assertEqual(sorted(hits_by_length), [18, 21, 24])
+        for nt, (positions, reads, counts) in hits_by_length.items():
+            test_positions, test_reads, test_counts = packed_seq.ref_hits(kmer.RefKmers(ref, nt))
+            self.assertEqual(positions.tolist(), test_positions.tolist())
+            self.assertEqual(reads, test_reads)
+            self.assertEqual(counts.tolist(), test_counts.tolist())
+            self.assertGreaterEqual(len(reads), 40)
+
+    def test_ref_hits_packed(self):
+        """
+        Test vectorised alignment gives the same hits as the per-position DNA alignment,
+        with references split into several blocks
+        """
+        random.seed(1)
+        ref = dna.DNA("".join(random.choice("ACGTN" if i % 97 == 0 else "ACGT") for i in range(2000)))
+        seq = srna.SRNASeq()
+        packed_seq = srna.PackedSRNASeq()
+        for i in range(200):
+            start = random.randrange(len(ref) - 21)
+            read = ref[start:start + 21] if i % 2 else dna.DNA(ref[start:start + 21]).complement()
+            if "N" in read:
+                continue
+            seq[dna.DNA(read)] = float(i + 1)
+            packed_seq[read] = float(i + 1)
+        block_size = kmer._BLOCK_SIZE
+        kmer._BLOCK_SIZE = 300
+        try:
+            positions, reads, counts = packed_seq.ref_hits(kmer.RefKmers(ref, 21))
+        finally:
+            kmer._BLOCK_SIZE = block_size
+        test_positions, test_reads, test_counts = seq.ref_hits(kmer.RefKmers(ref, 21))
+        self.assertEqual(positions.tolist(), test_positions.tolist())
+        self.assertEqual([packed_seq.to_dna(read) for read in reads], test_reads)
+        self.assertEqual(counts.tolist(), test_counts.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
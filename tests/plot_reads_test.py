@@ -0,0 +1,103 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy
+import scram_modules.plot_reads as pr
+
+
+class TestPlotReadsMethods(unittest.TestCase):
+
+    def test_render_files(self):
+        """
+        Test profiles rendered in worker processes are saved as PNG (at the set resolution) and PDF files
+        """
+        plot_dir = tempfile.mkdtemp()
+        try:
+            file_names = [os.path.join(plot_dir, name) for name in ["ref1.png", "ref2.pdf", "ref3.pdf"]]
+            with pr.FigureRenderer(2) as renderer:
+                for file_name in file_names:
+                    x_ref, y_fwd, y_rvs = self.profile()
+                    renderer.render(pr.den_plot, x_ref, y_fwd, y_rvs, 21, True, file_name, False, "ref", 0,
+                                    dpi=50, rasterize=file_name.endswith("3.pdf"))
+            with open(file_names[0], 'rb') as png:
+                self.assertEqual(png.read(8), b'\x89PNG\r\n\x1a\n')
+                png.seek(16)
+                width, height = numpy.frombuffer(png.read(8), dtype='>u4').tolist()
+            self.assertEqual((width, height), (320, 240))  # default 6.4 x 4.8 inch figure
+            with open(file_names[1], 'rb') as pdf:
+                self.assertNotIn(b'/Subtype /Image', pdf.read())
+            with open(file_names[2], 'rb') as pdf:
+                self.assertIn(b'/Subtype /Image', pdf.read())  # rasterized profile
+        finally:
+            shutil.rmtree(plot_dir)
+
+    def test_render_single(self):
+        """
+        Test a single figure is rendered without starting a pool, and pyplot isn't used for files
+        """
+        plot_dir = tempfile.mkdtemp()
+        try:
+            file_name = os.path.join(plot_dir, "cdp.pdf")
+            with pr.FigureRenderer(4) as renderer:
+                renderer.render(pr.cdp_plot, {'ref1': (1.0, 2.0), 'ref2': (10.0, 5.0)}, "s1", "s2", 21, False,
+                                True, file_name, False, False)
+                self.assertIsNone(renderer._pool)
+            self.assertTrue(os.path.getsize(file_name) > 0)
+            self.assertTrue(pr.plt is None or not pr.plt.get_fignums())
+        finally:
+            shutil.rmtree(plot_dir)
+
+    def test_cdp_density(self):
+        """
+        Test a CDP plot with many references is drawn as hexagonal bins, and can be forced to a scatter plot
+        """
+        plot_dir = tempfile.mkdtemp()
+        try:
+            counts = numpy.random.RandomState(0).lognormal(2, 2, (pr._DENSITY_POINTS + 1, 2))
+            counts_by_ref = {"ref{0}".format(i): tuple(ref_counts) for i, ref_counts in enumerate(counts)}
+            density_file, scatter_file = os.path.join(plot_dir, "density.pdf"), os.path.join(plot_dir, "scatter.pdf")
+            pr.cdp_plot(counts_by_ref, "s1", "s2", 21, False, True, density_file, False, False)
+            pr.cdp_plot(counts_by_ref, "s1", "s2", 21, False, True, scatter_file, False, False, density=False)
+            self.assertTrue(os.path.getsize(density_file) * 10 < os.path.getsize(scatter_file))
+        finally:
+            shutil.rmtree(plot_dir)
+
+    @unittest.skipIf(importlib.util.find_spec("bokeh") is None, "bokeh isn't installed")
+    def test_bokeh_plots(self):
+        """
+        Test profile and CDP plots are drawn with bokeh
+        """
+        from bokeh.plotting import figure
+        shown = []
+        with mock.patch.object(pr, '_load_bokeh', return_value=(figure, shown.append)):
+            x_ref, y_fwd, y_rvs = self.profile()
+            pr.den_plot(x_ref, y_fwd, y_rvs, 21, False, None, False, "ref", 0, bok=True)
+            pr.den_multi_plot_21_22_24(x_ref, y_fwd, y_rvs, y_fwd, y_rvs, y_fwd, y_rvs, False, None, False, "ref", 5,
+                                       bok=True)
+            pr.cdp_plot({'ref1': (1.0, 2.0), 'ref2': (10.0, 5.0)}, "s1", "s2", 21, False, False, None, False, True)
+        self.assertEqual([(p.width, p.height) for p in shown],
+                         [(pr._DEN_BOKEH_WIDTH, pr._DEN_BOKEH_HEIGHT)] * 2 + [(pr._CDP_BOKEH_SIZE,) * 2])
+        self.assertEqual([item.label['value'] for item in shown[1].legend[0].items], ["21 nt", "22 nt", "24 nt"])
+
+    def test_decimate(self):
+        """
+        Test only the first point in each grid cell is kept
+        """
+        x_vals = numpy.array([0.1, 0.11, 1.0, 50.0, 0.1, 99.0])
+        y_vals = numpy.array([0.1, 0.1, 1.0, 50.0, 0.1, 20.0])
+        self.assertEqual(pr._decimate(x_vals, y_vals, 100.0, 3).tolist(), [0, 2, 3])
+
+    def profile(self):
+        """
+        Smoothed profile for a 100 nt reference
+        :return: x_ref, y_fwd, y_rvs (numpy.array)
+        """
+        x_ref = numpy.arange(100)
+        return x_ref, numpy.sin(x_ref / 10.0) + 1, -numpy.cos(x_ref / 10.0) - 1
+
+
+if __name__ == '__main__':
+    unittest.main()
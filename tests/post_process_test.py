@@ -0,0 +1,88 @@
+import unittest
+import numpy
+import scram_modules.post_process as pp
+
+
+class TestPostProcessMethods(unittest.TestCase):
+
+    def test_fill_in_zeros(self):
+        """
+        Test read counts are placed at the read centre, and counts at the same position are summed
+        """
+        sorted_alignments = [[(0, 2.0), (0, 1.0), (5, 4.0)], [(3, -1.0), (9, -2.0)], 10.0]
+        x_ref, y_fwd, y_rvs = pp.fill_in_zeros(sorted_alignments, 10, 4)
+        self.assertEqual(x_ref.tolist(), list(range(10)))
+        self.assertEqual(y_fwd.tolist(), [0, 0, 3, 0, 0, 0, 0, 4, 0, 0])
+        self.assertEqual(y_rvs.tolist(), [0, -1, 0, 0, 0, 0, 0, -2, 0, 0])
+
+    def test_fill_in_zeros_coverage(self):
+        """
+        Test per-nucleotide coverage counts each read at every position it covers
+        """
+        sorted_alignments = [[(0, 2.0), (5, 4.0)], [(3, -1.0), (9, -2.0)], 9.0]
+        x_ref, y_fwd, y_rvs = pp.fill_in_zeros(sorted_alignments, 10, 4, coverage=True)
+        self.assertEqual(y_fwd.tolist(), [2, 2, 2, 2, 0, 4, 4, 4, 4, 0])
+        self.assertEqual(y_rvs.tolist(), [-1, -1, -1, -1, 0, 0, -2, -2, -2, -2])
+
+    def test_fill_in_zeros_no_alignments(self):
+        """
+        Test a reference with no alignments gives zero profiles
+        """
+        x_ref, y_fwd, y_rvs = pp.fill_in_zeros([[], [], 0], 5, 21)
+        self.assertEqual(y_fwd.tolist(), [0] * 5)
+        self.assertEqual(y_rvs.tolist(), [0] * 5)
+
+    def test_smooth(self):
+        """
+        Test running sum and FFT smoothing match direct convolution, and profiles are smoothed together in a batch
+        """
+        x = numpy.random.RandomState(0).rand(3, 2000)
+        for window_len in [7, 50, 200]:
+            for window in ['flat', 'hanning', 'hamming', 'bartlett', 'blackman']:
+                w = numpy.ones(window_len) if window == 'flat' else getattr(numpy, window)(window_len)
+                smoothed = pp.smooth(x, window_len, window)
+                self.assertEqual(smoothed.shape, x.shape)
+                for profile, smoothed_profile in zip(x, smoothed):
+                    s = numpy.r_[profile[window_len - 1:0:-1], profile, profile[-1:-window_len:-1]]
+                    expected = numpy.convolve(w / w.sum(), s, mode='valid')[(window_len - 1) // 2:][:len(profile)]
+                    self.assertTrue(numpy.allclose(pp.smooth(profile, window_len, window), expected))
+                    self.assertTrue(numpy.allclose(smoothed_profile, expected))
+        self.assertIs(pp.smooth(x, 5), x)
+        with self.assertRaises(ValueError):
+            pp.smooth(x[0], 50, window='numpy.ones')
+
+    def test_profile_pyramid(self):
+        """
+        Test binned sum, max, min and mean at each level, and choice of level for an output resolution
+        """
+        profiles = numpy.random.RandomState(1).randn(2, 1003)
+        pyramid = pp.ProfilePyramid(profiles, factor=4, min_bins=10)
+        self.assertEqual([level[0] for level in pyramid.levels], [1, 4, 16, 64, 256])
+        for level in range(len(pyramid)):
+            starts, widths = pyramid.bins(level)
+            for stat, summary in [('sum', numpy.sum), ('max', numpy.max), ('min', numpy.min), ('mean', numpy.mean)]:
+                expected = [[summary(profile[start:start + width]) for start, width in zip(starts, widths)]
+                            for profile in profiles]
+                self.assertTrue(numpy.allclose(pyramid.summary(level, stat), expected))
+        self.assertEqual(pyramid.level(100), 1)
+        self.assertEqual(pyramid.level(5000), 0)
+        x_binned, y_binned = pyramid.for_plot(60)
+        self.assertEqual(len(x_binned), 63)
+        self.assertTrue(numpy.array_equal(numpy.abs(y_binned),
+                                          numpy.maximum(pyramid.summary(2, 'max'), -pyramid.summary(2, 'min'))))
+
+    def test_run_lengths(self):
+        """
+        Test runs of equal values are merged, and runs of zeros are removed
+        """
+        starts, ends, values = pp.run_lengths(numpy.array([0.0, 0.0, 2.0, 2.0, 2.0, -1.0, 0.0, 0.0, 3.0]))
+        self.assertEqual(starts.tolist(), [2, 5, 8])
+        self.assertEqual(ends.tolist(), [5, 6, 9])
+        self.assertEqual(values.tolist(), [2.0, -1.0, 3.0])
+        starts, ends, values = pp.run_lengths(numpy.zeros(5))
+        self.assertEqual(len(starts), 0)
+        self.assertEqual(len(pp.run_lengths(numpy.zeros(0))[0]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import tempfile
+import os
+import pickle
+import shutil
+import scram_modules.refseq as refseq
+import scram_modules.dna as dna
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestRefSeqMethods(unittest.TestCase):
+
+    def test_read_ref_file(self):
+        """
+        Test multi-line, multi-sequence FASTA records are streamed in file order
+        """
+        with tempfile.NamedTemporaryFile('w', suffix='.fa', delete=False) as ref_file:
+            ref_file.write(">ref_1 first\nacgt\nACGTN\n\n>ref_2\nTTTT\n>ref_3\n")
+        try:
+            records = list(refseq.read_ref_file(ref_file.name))
+        finally:
+            os.remove(ref_file.name)
+        self.assertEqual(records, [(">ref_1 first", dna.DNA("ACGTACGTN")),
+                                   (">ref_2", dna.DNA("TTTT")),
+                                   (">ref_3", dna.DNA(""))])
+
+    def test_load_ref_file(self):
+        """
+        Test RefSeq is loaded from streamed records
+        """
+        test_ref = refseq.RefSeq()
+        test_ref.load_ref_file(_BASE_DIR + "/test_ref_1.fa")
+        self.assertEqual(len(test_ref), 1)
+        self.assertEqual(list(test_ref), list(refseq.read_ref_file(_BASE_DIR + "/test_ref_1.fa")))
+
+    def test_indexed_ref_seq(self):
+        """
+        Test indexed sequences and regions match streamed records, and the saved index is reused
+        """
+        ref_dir = tempfile.mkdtemp()
+        ref_file = os.path.join(ref_dir, "ref.fa")
+        with open(ref_file, 'w') as out_ref:
+            out_ref.write(">ref_1 first\nACGTA\nCGTAC\nGT\n\n>ref_2\n>ref_3\nttttt\nAAN\n")
+        try:
+            test_ref = refseq.IndexedRefSeq()
+            test_ref.load_ref_file(ref_file)
+            self.assertTrue(os.path.isfile(ref_file + ".scram.idx"))
+            self.assertEqual(list(test_ref), list(refseq.read_ref_file(ref_file)))
+            self.assertEqual(test_ref.sequence(0, 3, 11), dna.DNA("TACGTACG"))
+            self.assertEqual(test_ref.sequence(2, 4), dna.DNA("TAAN"))
+            self.assertEqual(test_ref.ref_length(0), 12)
+            self.assertEqual(test_ref[">ref_3"], dna.DNA("TTTTTAAN"))
+
+            reloaded_ref = pickle.loads(pickle.dumps(test_ref))
+            self.assertEqual(list(reloaded_ref), list(test_ref))
+            index_ref = refseq.IndexedRefSeq()
+            index_ref.load_ref_file(ref_file)  # from the saved index
+            self.assertEqual(list(index_ref), list(test_ref))
+
+            with open(ref_file + ".fai", 'w') as out_fai:  # samtools index - first word of each header only
+                out_fai.write("ref_1\t12\t14\t5\t6\nref_2\t0\t41\t0\t0\nref_3\t8\t48\t5\t6\n")
+            fai_ref = refseq.IndexedRefSeq()
+            fai_ref.load_ref_file(ref_file)
+            self.assertEqual(fai_ref.headers(), [">ref_1 first", ">ref_2", ">ref_3"])
+
+            index_mtime = os.path.getmtime(ref_file + ".scram.idx")
+            with open(ref_file, 'a') as out_ref:
+                out_ref.write(">ref_4\nACGT\n")
+            os.utime(ref_file, (index_mtime - 1,) * 2)  # older than the index, but a different size
+            size_ref = refseq.IndexedRefSeq()
+            size_ref.load_ref_file(ref_file)
+            self.assertEqual(list(size_ref), list(refseq.read_ref_file(ref_file)))
+
+            with open(ref_file, 'w') as out_ref:
+                out_ref.write(">ref_1\nACG\nACGTA\n")
+            os.utime(ref_file, (os.path.getmtime(ref_file + ".scram.idx") + 1,) * 2)
+            with self.assertRaises(ValueError):
+                refseq.IndexedRefSeq().load_ref_file(ref_file)
+        finally:
+            shutil.rmtree(ref_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import scram_modules.results as res
+
+
+class TestResultsMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_save_load(self):
+        """
+        Test saved columns are memory-mapped back unchanged
+        """
+        results_file = os.path.join(self.out_dir, "results.npz")
+        columns = self.results_columns()
+        res.save_results(results_file, 'cdp', columns, nt=21)
+        results = res.load_results(results_file)
+        self.assertEqual(results.kind, 'cdp')
+        self.assertEqual(results.meta['nt'], 21)
+        self.assertEqual(results.columns(), sorted(columns))
+        self.assertTrue(isinstance(results['counts'], numpy.memmap))
+        self.assertTrue(isinstance(results['reads'], numpy.memmap))
+        for column in columns:
+            self.assertEqual(results[column].tolist(), columns[column].tolist())
+        self.assertFalse('_meta' in results)
+        with self.assertRaises(KeyError):
+            results['_meta']
+
+    def test_save_load_compressed(self):
+        """
+        Test compressed columns are read into memory unchanged
+        """
+        results_file = os.path.join(self.out_dir, "results.npz")
+        columns = self.results_columns()
+        res.save_results(results_file, 'cdp', columns, compress=True)
+        for mmap in [True, False]:
+            results = res.load_results(results_file, mmap)
+            self.assertFalse(isinstance(results['counts'], numpy.memmap))
+            for column in columns:
+                self.assertEqual(results[column].tolist(), columns[column].tolist())
+
+    def results_columns(self):
+        """
+        Columns of each kind that can be mapped, and an empty column that can't
+        :return: {column name (str): column (numpy.array)} (dict)
+        """
+        return {'headers': numpy.array(['>ref1', '>ref2'], dtype=str),
+                'reads': numpy.array([b'ACGT', b'TTTTT']),
+                'counts': numpy.array([[1.0, 2.5], [0.0, 3.0]]),
+                'empty': numpy.zeros(0, dtype=numpy.int64)}
+
+
+if __name__ == '__main__':
+    unittest.main()
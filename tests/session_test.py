@@ -0,0 +1,95 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import scram_modules.plot_reads as pr
+import scram_modules.session as session
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestSessionMethods(unittest.TestCase):
+
+    def test_cache_eviction(self):
+        """
+        Test the least recently used entries are evicted to keep the cache within its size limit
+        """
+        cache = session.SizedCache(100)
+        cache.add('a', 1, 40)
+        cache.add('b', 2, 40)
+        self.assertEqual(cache['a'], 1)  # 'b' is now least recently used
+        cache.add('c', 3, 40)
+        self.assertNotIn('b', cache)
+        self.assertEqual((len(cache), cache.nbytes), (2, 80))
+        cache.add('d', 4, 150)  # larger than the limit - kept on its own
+        self.assertEqual((len(cache), cache.nbytes), (1, 150))
+        self.assertEqual(cache['d'], 4)
+        cache.add('d', 5, 10)  # replaced
+        self.assertEqual((cache['d'], cache.nbytes), (5, 10))
+        cache.clear()
+        self.assertEqual((len(cache), cache.nbytes), (0, 0))
+
+    def test_file_keys(self):
+        """
+        Test a file's cache key changes when the file changes
+        """
+        file_dir = tempfile.mkdtemp()
+        try:
+            in_file = os.path.join(file_dir, "seq.fa")
+            with open(in_file, 'w') as seq:
+                seq.write(">1-1\nAAAA\n")
+            key = session._file_keys([in_file])
+            self.assertEqual(key, session._file_keys([os.path.relpath(in_file)]))
+            with open(in_file, 'a') as seq:
+                seq.write(">2-1\nCCCC\n")
+            self.assertNotEqual(key, session._file_keys([in_file]))
+        finally:
+            shutil.rmtree(file_dir)
+
+    def test_profile_smoothing(self):
+        """
+        Test a profile is smoothed, unless the reference is shorter than the window
+        """
+        file_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy(_BASE_DIR + "/test_ref_4.fa", file_dir)
+            ref_file, seq_file = os.path.join(file_dir, "test_ref_4.fa"), _BASE_DIR + "/test_seq.fa"
+            scram_session = session.Session(processes=1)
+            x_ref, y_fwd, y_rvs = scram_session.profile(seq_file, ref_file, 21)
+            _, y_fwd_smoothed, _ = scram_session.profile(seq_file, ref_file, 21, smooth_win_size=len(x_ref))
+            self.assertNotEqual(y_fwd_smoothed.tolist(), y_fwd.tolist())
+            _, y_fwd_long_win, y_rvs_long_win = scram_session.profile(seq_file, ref_file, 21,
+                                                                      smooth_win_size=len(x_ref) + 1)
+            self.assertEqual((y_fwd_long_win.tolist(), y_rvs_long_win.tolist()), (y_fwd.tolist(), y_rvs.tolist()))
+        finally:
+            shutil.rmtree(file_dir)
+
+    @unittest.skipIf(importlib.util.find_spec("bokeh") is None, "bokeh isn't installed")
+    def test_profile_bokeh(self):
+        """
+        Test a profile and counts are returned and plotted with bokeh
+        """
+        from bokeh.plotting import figure
+        file_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy(_BASE_DIR + "/test_ref_4.fa", file_dir)
+            shutil.copy(_BASE_DIR + "/test_seq.fa", file_dir)
+            ref_file, seq_file = os.path.join(file_dir, "test_ref_4.fa"), os.path.join(file_dir, "test_seq.fa")
+            scram_session = session.Session(processes=1)
+            shown = []
+            with mock.patch.object(pr, '_load_bokeh', return_value=(figure, shown.append)):
+                x_ref, y_fwd, y_rvs = scram_session.profile(seq_file, ref_file, 21, plot=True, bok=True)
+                headers, sample_names, counts = scram_session.counts([seq_file, seq_file], ref_file, 21, plot=True,
+                                                                     bok=True)
+            self.assertEqual((len(x_ref), len(y_fwd), len(y_rvs)), (len(x_ref),) * 3)
+            self.assertGreater(y_fwd.sum() - y_rvs.sum(), 0)
+            self.assertEqual((headers, sample_names, counts.shape), ([">test_ref"], ["test_seq", "test_seq"], (1, 2)))
+            self.assertEqual(len(shown), 2)
+        finally:
+            shutil.rmtree(file_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
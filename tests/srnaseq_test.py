@@ -0,0 +1,210 @@
+import multiprocessing
+import numpy
+import pickle
+import unittest
+import scram_modules.srnaseq as srna
+import scram_modules.dna as dna
+import scram_modules.kmer as kmer
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _shared_count(shared_seq):
+    """
+    Count for a read from a shared read set in a worker process
+    """
+    return shared_seq["ATGCGTATGGCGATGAGAGTA"], len(shared_seq)
+
+
+class TestSRNASeqMethods(unittest.TestCase):
+
+    def test_packed_load(self):
+        """
+        Test packed read storage loads the same reads and RPMR counts as DNA read storage
+        """
+        test_seq = self.load_test_read_file(srna.SRNASeq)
+        test_packed_seq = self.load_test_read_file(srna.PackedSRNASeq)
+        self.assertEqual(len(test_packed_seq), len(test_seq))
+        for sRNA, count in test_seq:
+            self.assertEqual(test_packed_seq[sRNA], count)
+        self.assertEqual(test_packed_seq.lengths(), [21, 22])
+
+    @unittest.skipIf(srna.shared_memory is None, "shared memory requires Python >= 3.8")
+    def test_shared(self):
+        """
+        Test shared memory read storage gives the same reads and counts, and is attached to by reference
+        """
+        test_packed_seq = self.load_test_read_file(srna.PackedSRNASeq)
+        shared_seq = test_packed_seq.shared()
+        try:
+            self.assertEqual(len(shared_seq), len(test_packed_seq))
+            self.assertEqual(sorted(map(str, shared_seq.sRNAs())), sorted(map(str, test_packed_seq.sRNAs())))
+            for sRNA, count in test_packed_seq:
+                self.assertEqual(shared_seq[sRNA], count)
+            self.assertNotIn("AAAAAAAAAAAAAAAAAAAAA", shared_seq)
+            self.assertLess(len(pickle.dumps(shared_seq)), 1000)
+            ref = dna.DNA("ATGCGTATGGCGATGAGAGTAAAAAAATACTCTCATCGCCATACGCAC")
+            self.assertEqual(shared_seq.ref_hits(kmer.RefKmers(ref, 21))[1],
+                             test_packed_seq.ref_hits(kmer.RefKmers(ref, 21))[1])
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                self.assertEqual(pool.apply(_shared_count, (shared_seq,)),
+                                 (test_packed_seq["ATGCGTATGGCGATGAGAGTA"], len(test_packed_seq)))
+        finally:
+            shared_seq.release()
+
+    def test_multi_seq(self):
+        """
+        Test merged read sets give the same aligned counts and reads as aligning each read set in turn
+        """
+        read_sets = [self.load_test_read_file(srna.PackedSRNASeq), srna.PackedSRNASeq()]
+        read_sets[1].load_seq_file(_BASE_DIR + "/test_seq.fa", 21, 1, 0)
+        ref = dna.DNA("ATGCGTATGGCGATGAGAGTAAAAAAATACTCTCATCGCCATACGCACATGCGTATGGCGATGAGAGTA")
+        ref_kmers = kmer.RefKmers(ref, 21)
+        expected_counts = [sum(abs(count) for count in read_set.ref_hits(ref_kmers)[2]) for read_set in read_sets]
+        # second reference - a read that also aligns to the first reference
+        split_ref_kmers = [ref_kmers, kmer.RefKmers(dna.DNA("AAATGCGTATGGCGATGAGAGTAAA"), 21)]
+        read_times = [[{} for _ in split_ref_kmers] for _ in read_sets]  # [[{read: times aligned}]]
+        for set_read_times, read_set in zip(read_times, read_sets):
+            for ref_read_times, single_ref_kmers in zip(set_read_times, split_ref_kmers):
+                for read in read_set.ref_hits(single_ref_kmers)[1]:
+                    ref_read_times[read] = ref_read_times.get(read, 0) + 1
+        expected_split_counts = []
+        for ordinal in range(len(split_ref_kmers)):
+            expected_split_counts.append([])
+            for set_read_times, read_set in zip(read_times, read_sets):
+                expected_split_counts[-1].append(sum(
+                    read_set[read] * times / sum(ref_read_times.get(read, 0) for ref_read_times in set_read_times)
+                    for read, times in set_read_times[ordinal].items()))
+        merged_seq = srna.MultiSRNASeq(read_sets, [21])
+        unmerged_seq = srna.MultiSRNASeq([srna.SRNASeq(), read_sets[1]], [21])
+        self.assertEqual(unmerged_seq.ref_counts(ref_kmers)[1], expected_counts[1])
+        shared_seq = merged_seq.shared()
+        try:
+            for multi_seq in [merged_seq, pickle.loads(pickle.dumps(shared_seq))]:
+                self.assertEqual(multi_seq.ref_counts(ref_kmers).tolist(), expected_counts)
+            unmerged_seq = srna.MultiSRNASeq(read_sets, [33])  # too long to merge - aligned for each read set
+            for multi_seq in [merged_seq, pickle.loads(pickle.dumps(shared_seq)), unmerged_seq]:
+                ref_ordinals, reads, times = [], [], []
+                for ordinal, single_ref_kmers in enumerate(split_ref_kmers):
+                    ref_reads, fwd_times, rvs_times = multi_seq.ref_read_times(single_ref_kmers)
+                    ref_times = fwd_times + rvs_times
+                    ref_ordinals.append(numpy.full(len(ref_times), ordinal))
+                    reads.append(ref_reads)
+                    times.append(ref_times)
+                split_counts = multi_seq.split_counts(21, numpy.concatenate(ref_ordinals), numpy.concatenate(reads),
+                                                      numpy.concatenate(times), len(split_ref_kmers))
+                self.assertEqual(split_counts.shape, (2, 2))
+                read_idx, read_seqs, read_counts = multi_seq.aligned_read_table(21, numpy.concatenate(reads))
+                self.assertEqual(len(read_idx), len(numpy.concatenate(reads)))
+                for read_seq, counts in zip(read_seqs.tolist(), read_counts.tolist()):
+                    self.assertEqual(counts, [read_set[read_seq.decode()] if read_seq.decode() in read_set else 0
+                                              for read_set in read_sets])
+                for counts, expected in zip(split_counts.tolist(), expected_split_counts):
+                    for count, expected_count in zip(counts, expected):
+                        self.assertAlmostEqual(count, expected_count)
+        finally:
+            if shared_seq is not merged_seq:
+                shared_seq.release()
+
+    def test_non_acgt_reads(self):
+        """
+        Test reads with non-ACGT characters are stored, and align to reference windows with the same characters
+        """
+        ref = dna.DNA("ATGCGTATGGCGATGNGAGTAAAAAAATACTCTCATCGCCATACGCACNTTGCA")
+        reads = {"ATGCGTATGGCGATGNGAGTA": 10.0, ref[20:41]: 20.0, dna.DNA(ref[33:54]).complement(): 30.0}
+        test_seq = srna.SRNASeq()
+        test_packed_seq = srna.PackedSRNASeq()
+        for sRNA, count in reads.items():
+            test_seq[dna.DNA(sRNA)] = count
+            test_packed_seq[sRNA] = count
+        self.assertEqual(len(test_packed_seq), 3)
+        self.assertIn("ATGCGTATGGCGATGNGAGTA", test_packed_seq)
+        self.assertEqual(test_packed_seq.lengths(), [21])
+        ref_kmers = kmer.RefKmers(ref, 21)
+        positions, expected_reads, counts = test_seq.ref_hits(ref_kmers)
+        self.assertEqual(positions.tolist(), [0, 53, 20])  # scan order
+        self.assertEqual(counts.tolist(), [10.0, -30.0, 20.0])
+        shared_seq = test_packed_seq.shared()
+        try:
+            for seq in [test_packed_seq, pickle.loads(pickle.dumps(shared_seq))]:
+                self.assertEqual(seq["ATGCGTATGGCGATGNGAGTA"], 10.0)
+                hits = seq.ref_hits(ref_kmers)
+                self.assertEqual(hits[0].tolist(), positions.tolist())
+                self.assertEqual([seq.to_dna(read) for read in hits[1]], expected_reads)
+                self.assertEqual(hits[2].tolist(), counts.tolist())
+                self.assertEqual(seq.ref_hits_by_length(kmer.MultiRefKmers(ref, [21]))[21][0].tolist(),
+                                 positions.tolist())
+        finally:
+            shared_seq.release()
+        test_packed_seq_2 = srna.PackedSRNASeq()
+        test_packed_seq_2["ATGCGTATGGCGATGNGAGTA"] = 1.0
+        multi_seq = srna.MultiSRNASeq([test_packed_seq, test_packed_seq_2], [21])
+        self.assertEqual(multi_seq.ref_counts(ref_kmers).tolist(), [60.0, 1.0])
+        reads, _, _ = multi_seq.ref_read_times(ref_kmers)
+        _, read_seqs, read_counts = multi_seq.aligned_read_table(21, reads)
+        self.assertEqual(dict(zip(read_seqs.tolist(), read_counts.tolist())),
+                         {b"ATGCGTATGGCGATGNGAGTA": [10.0, 1.0], str(ref[20:41]).encode(): [20.0, 0.0],
+                          str(dna.DNA(ref[33:54]).complement()).encode(): [30.0, 0.0]})
+
+    def test_seq_file_cache(self):
+        """
+        Test reads loaded from the sequence file cache match reads parsed from file, for each cutoff
+        """
+        cache_dir = tempfile.mkdtemp()
+        try:
+            with mock.patch.dict(os.environ, {'SCRAM_CACHE_DIR': cache_dir}):
+                for seq_class in [srna.SRNASeq, srna.PackedSRNASeq]:
+                    with mock.patch.dict(os.environ, {'SCRAM_CACHE_MB': '0'}):
+                        parsed_seq = self.load_test_read_file(seq_class)
+                    self.assertEqual(os.listdir(cache_dir), [])
+                    self.load_test_read_file(seq_class)
+                    self.assertEqual(len(os.listdir(cache_dir)), 1)
+                    cached_seq = self.load_test_read_file(seq_class)
+                    self.assertEqual(sorted(map(str, cached_seq.sRNAs())), sorted(map(str, parsed_seq.sRNAs())))
+                    for sRNA, count in parsed_seq:
+                        self.assertEqual(cached_seq[sRNA], count)
+                    for entry_file in os.listdir(cache_dir):
+                        os.remove(os.path.join(cache_dir, entry_file))
+                test_seq = srna.SRNASeq()
+                test_seq.load_seq_file(_BASE_DIR + "/test_seq.fa", 21, 1, 0)
+                test_seq.load_seq_file(_BASE_DIR + "/test_seq.fa", 22, 1, 0)
+                self.assertEqual(len(os.listdir(cache_dir)), 2)
+                with mock.patch.dict(os.environ, {'SCRAM_CACHE_MB': '0.000001'}):
+                    test_seq.load_seq_file(_BASE_DIR + "/test_seq.fa", 23, 1, 0)
+                self.assertEqual(os.listdir(cache_dir), [])  # least recently used entries removed
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def test_seq_file_cache_write_error(self):
+        """
+        Test a failed cache write doesn't stop a sequence file loading
+        """
+        cache_dir = tempfile.mkdtemp()
+        try:
+            with mock.patch.dict(os.environ, {'SCRAM_CACHE_DIR': cache_dir}):
+                with mock.patch.object(srna.seqcache.numpy, 'savez', side_effect=OverflowError("uint64")):
+                    test_seq = self.load_test_read_file(srna.PackedSRNASeq)
+                self.assertEqual(os.listdir(cache_dir), [])
+            with mock.patch.dict(os.environ, {'SCRAM_CACHE_MB': '0'}):
+                parsed_seq = self.load_test_read_file(srna.PackedSRNASeq)
+            self.assertEqual(sorted(map(str, test_seq.sRNAs())), sorted(map(str, parsed_seq.sRNAs())))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def load_test_read_file(self, seq_class):
+        """
+        Load test read file
+        :param seq_class: read storage class
+        :return: SRNASeq object
+        """
+        test_seq = seq_class()
+        test_seq.load_seq_file(_BASE_DIR + "/test_seq.fa", 50, 1, 0)
+        return test_seq
+
+
+if __name__ == '__main__':
+    unittest.main()
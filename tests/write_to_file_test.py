@@ -0,0 +1,96 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import scram_modules.alignedreads as ar
+import scram_modules.dna as dna
+import scram_modules.post_process as pp
+import scram_modules.results as res
+import scram_modules.write_to_file as wtf
+
+
+class TestWriteToFileMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_csv_output(self):
+        """
+        Test alignments are written in position order, and a gzipped CSV holds the same rows
+        """
+        test_aligned = ar.AlignedReads()
+        test_aligned[dna.DNA("GTGCGTATGGCGATGAGAGTA")] = [[47, -250000.0]]
+        test_aligned[dna.DNA("ATGCGTATGGCGATGAGAGTA")] = [[0, 500000.0], [27, 500000.0]]
+        header = os.path.join(self.out_dir, "ref")
+        wtf.csv_output(test_aligned, 21, "seq", header)
+        wtf.csv_output(test_aligned, 21, "seq", header, compress=True)
+        with open(header + "_seq_21.csv") as csv_file:
+            rows = csv_file.read()
+        self.assertEqual(rows.splitlines(), ["sRNA,5-prime nuc. position,Count",
+                                             "ATGCGTATGGCGATGAGAGTA,1,500000.0",
+                                             "ATGCGTATGGCGATGAGAGTA,28,500000.0",
+                                             "GTGCGTATGGCGATGAGAGTA,48,-250000.0"])
+        with gzip.open(header + "_seq_21.csv.gz", 'rt') as csv_file:
+            self.assertEqual(csv_file.read(), rows)
+
+    def test_den_npz_output(self):
+        """
+        Test alignments and profiles are saved as columns with the same rows as the CSV
+        """
+        test_aligned = ar.AlignedReads()
+        test_aligned[dna.DNA("GTGCGTATGGCGATGAGAGTA")] = [[47, -250000.0]]
+        test_aligned[dna.DNA("ATGCGTATGGCGATGAGAGTA")] = [[0, 500000.0], [27, 500000.0]]
+        profile = pp.fill_in_zeros(test_aligned.aln_by_ref_pos(21), 60, 21)
+        header = os.path.join(self.out_dir, "ref")
+        wtf.den_npz_output([(21, test_aligned)], [profile], "seq", header)
+        results = res.load_results(header + "_seq_21.npz")
+        self.assertEqual(results.kind, 'den')
+        self.assertEqual(results['read'].tolist(), [b"ATGCGTATGGCGATGAGAGTA", b"ATGCGTATGGCGATGAGAGTA",
+                                                    b"GTGCGTATGGCGATGAGAGTA"])
+        self.assertEqual(results['position'].tolist(), [1, 28, 48])
+        self.assertEqual(results['count'].tolist(), [500000.0, 500000.0, -250000.0])
+        self.assertEqual(results['nt'].tolist(), [21, 21, 21])
+        # counts at read centres - the rvs read centre is at the same position as a fwd read centre
+        self.assertEqual(results['profile_position'].tolist(), [11, 38])
+        self.assertEqual(results['profile_fwd'].tolist(), [500000.0, 500000.0])
+        self.assertEqual(results['profile_rvs'].tolist(), [0.0, -250000.0])
+
+    def test_bedgraph_output(self):
+        """
+        Test each strand of a profile is written as runs of equal values, without zero runs
+        """
+        test_aligned = ar.AlignedReads()
+        test_aligned[dna.DNA("GTGCGTATGGCGATGAGAGTA")] = [[47, -250000.0]]
+        test_aligned[dna.DNA("ATGCGTATGGCGATGAGAGTA")] = [[0, 500000.0], [10, 500000.0]]
+        profile = pp.fill_in_zeros(test_aligned.aln_by_ref_pos(21), 60, 21, coverage=True)
+        header = os.path.join(self.out_dir, "ref")
+        wtf.bedgraph_output([profile], [21], "seq", header, "chr1", compress=True)
+        with gzip.open(header + "_seq_21_fwd.bedgraph.gz", 'rt') as bedgraph_file:
+            self.assertEqual(bedgraph_file.read().splitlines(),
+                             ["track type=bedGraph name={0}_seq_21_fwd".format(header),
+                              "chr1\t0\t10\t500000.0", "chr1\t10\t21\t1000000.0", "chr1\t21\t31\t500000.0"])
+        with gzip.open(header + "_seq_21_rvs.bedgraph.gz", 'rt') as bedgraph_file:
+            self.assertEqual(bedgraph_file.read().splitlines()[1:], ["chr1\t27\t48\t-250000.0"])
+
+    def test_single_cdp_file_output(self):
+        """
+        Test counts generated for each reference give the same CSV as a dict of counts
+        """
+        out_file = os.path.join(self.out_dir, "cdp.csv")
+        counts_by_ref = {">ref1": [1.0, 2.0], ">ref2": [0.5, 0.0]}
+        wtf.single_cdp_file_output(counts_by_ref, ["seq1", "seq2"], out_file)
+        wtf.single_cdp_file_output(((header, counts) for header, counts in counts_by_ref.items()),
+                                   ["seq1", "seq2"], out_file, compress=True)
+        with open(out_file) as csv_file:
+            rows = csv_file.read()
+        self.assertEqual(rows.splitlines(), ["Reference,seq1,seq2", ">ref1,1.0,2.0", ">ref2,0.5,0.0"])
+        with gzip.open(out_file + ".gz", 'rt') as csv_file:
+            self.assertEqual(csv_file.read(), rows)
+
+
+if __name__ == '__main__':
+    unittest.main()